@@ -1,17 +1,32 @@
 import os
+import asyncio
 import uvicorn
 from fastapi import FastAPI, HTTPException, Depends, Body, Header
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, Dict, Any
+from fastapi.responses import StreamingResponse
+from typing import Optional, Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
 import jwt
 import datetime
 import uuid
 import json
 from pydantic import BaseModel
-from db import get_db_connection, save_document, get_document_by_id
-from document_generator import generate_document_content
+from db import get_db_connection, save_documents, get_document_by_id, get_user_documents, delete_document, HISTORY_PAGE_SIZE
+from document_generator import (
+    generate_document_content, validate_parameters, stream_document_content, stream_pdf, stream_docx
+)
 from rai import analyze_document
 from payments import process_payment, create_subscription
+from jobs import JobQueue, QueueFull, FINISHED_STATES
+from migrations import migrate
+from storage_codec import start_background_compression
+from retention import start_retention_scheduler
+from asset_store import resolve_assets
+from user_cache import invalidate_user
+from pipeline import run_pipeline
+from search_index import search_documents, SEARCH_PAGE_SIZE
+from ledger import reserve, reserved_credits, charge_reservation, release_reservation, InsufficientCredits
+from templates.registry import get_document_type
 
 # Create FastAPI app
 app = FastAPI(title="DocGenius Lite API")
@@ -25,6 +40,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Background queue for document generation
+job_queue = JobQueue()
+
+# Startup hooks run in the order they are registered: the schema is brought
+# up to date before the background tasks that depend on it start
+@app.on_event("startup")
+def migrate_database():
+    """Apply pending schema migrations, so the API doesn't depend on the app having run first"""
+    migrate()
+
+@app.on_event("startup")
+def compress_stored_documents():
+    """Compress documents saved before content compression, in the background"""
+    start_background_compression()
+
+@app.on_event("startup")
+def schedule_retention_purge():
+    """Delete documents past their plan's retention period, periodically in the background"""
+    start_retention_scheduler()
+
+# Seconds between status checks on the job event stream
+JOB_EVENT_POLL_SECONDS = 0.5
+
+# Batch generation limits
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BATCH_WORKERS", "4")),
+    thread_name_prefix="batch"
+)
+
 # JWT configuration
 JWT_SECRET = os.getenv("JWT_SECRET", "docgenius_lite_secret_key")
 JWT_ALGORITHM = "HS256"
@@ -35,6 +80,9 @@ class DocumentRequest(BaseModel):
     title: str
     parameters: Dict[str, Any]
 
+class BatchDocumentRequest(BaseModel):
+    documents: List[DocumentRequest]
+
 class PaymentRequest(BaseModel):
     token: str
     amount: float
@@ -56,39 +104,327 @@ def verify_token(authorization: str = Header(None)):
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def generate_and_save_document(user_id, request, reservation=None):
+    """
+    Generate, analyze, save and pre-render a document (runs on the job queue)
+    
+    The saved document is charged against the reservation made when the job
+    was queued (None for pro users), and whatever isn't charged (e.g. if
+    generation fails) is given back.
+    """
+    try:
+        # The download routes render the stored content, so nothing would
+        # read pre-rendered exports from the artifact cache
+        result = run_pipeline(user_id, request.doc_type, request.title, request.parameters, prerender=())
+        
+        if reservation is not None:
+            try:
+                charge_reservation(
+                    reservation["id"],
+                    [(result["document_id"], reservation["amount"], f"Generated {request.title}")]
+                )
+            except Exception:
+                # Don't keep a document that wasn't paid for
+                delete_document(result["document_id"], user_id)
+                raise
+    finally:
+        if reservation is not None:
+            release_reservation(reservation["id"])
+    
+    return {
+        "document_id": result["document_id"],
+        "credits_used": reservation["amount"] if reservation is not None else 0,
+        "rai_score": result["rai_results"]["score"],
+        "rai_flags": result["rai_results"]["flags"],
+        "timings": result["timings"]
+    }
+
+def generate_and_analyze(request):
+    """Generate and analyze one document of a batch (runs on the batch pool)"""
+    content = generate_document_content(request.doc_type, request.parameters)
+    rai_results = analyze_document(content, request.doc_type)
+    return content, rai_results
+
+def generate_document_batch(user_id, requests):
+    """
+    Validate, generate and save a batch of documents
+    
+    Invalid or failing items are reported individually; the rest are saved
+    together in one transaction. The credits for every valid item are
+    reserved before anything is generated (raising InsufficientCredits if
+    the balance doesn't cover them), saved items are charged against the
+    reservation and the rest is given back.
+    """
+    results = [{"index": index, "status": "pending"} for index in range(len(requests))]
+    
+    # Validate everything up front
+    valid = []
+    for index, request in enumerate(requests):
+        try:
+            validate_parameters(request.doc_type, request.parameters)
+            valid.append(index)
+        except ValueError as e:
+            results[index].update(status="error", error=str(e))
+    
+    if not valid:
+        return results
+    
+    credits = {index: get_document_type(requests[index].doc_type).credits for index in valid}
+    with reserved_credits(user_id, sum(credits.values()), f"Batch of {len(valid)} documents") as reservation:
+        # Generate valid items in parallel
+        futures = {index: batch_executor.submit(generate_and_analyze, requests[index]) for index in valid}
+        
+        generated = []
+        rows = []
+        for index, future in futures.items():
+            try:
+                content, rai_results = future.result()
+            except Exception as e:
+                results[index].update(status="error", error=str(e))
+                continue
+            
+            request = requests[index]
+            generated.append((index, rai_results))
+            rows.append({
+                "user_id": user_id,
+                "doc_type": request.doc_type,
+                "title": request.title,
+                "content": content,
+                "parameters": json.dumps(request.parameters),
+                "rai_score": rai_results["score"],
+                "rai_flags": json.dumps(rai_results["flags"])
+            })
+        
+        # Save all generated documents in one transaction, then charge them together
+        if rows:
+            try:
+                doc_ids = save_documents(rows)
+                if reservation is not None:
+                    charges = [
+                        (doc_id, credits[index], f"Generated {requests[index].title}")
+                        for (index, _), doc_id in zip(generated, doc_ids)
+                    ]
+                    try:
+                        charge_reservation(reservation["id"], charges)
+                    except Exception:
+                        # Don't keep documents that weren't paid for
+                        for doc_id in doc_ids:
+                            delete_document(doc_id, user_id)
+                        raise
+            except Exception as e:
+                for index, _ in generated:
+                    results[index].update(status="error", error=f"Failed to save document: {str(e)}")
+            else:
+                for (index, rai_results), doc_id in zip(generated, doc_ids):
+                    results[index].update(
+                        status="success",
+                        document_id=doc_id,
+                        credits_used=credits[index],
+                        rai_score=rai_results["score"],
+                        rai_flags=rai_results["flags"]
+                    )
+    
+    return results
+
+def serialize_job(job):
+    """Convert a job snapshot into an API response"""
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": datetime.datetime.fromtimestamp(job["created_at"]).isoformat(),
+        "started_at": datetime.datetime.fromtimestamp(job["started_at"]).isoformat() if job["started_at"] else None,
+        "finished_at": datetime.datetime.fromtimestamp(job["finished_at"]).isoformat() if job["finished_at"] else None
+    }
+
 # Routes
-@app.post("/api/documents")
+@app.post("/api/documents", status_code=202)
 async def create_document(
     request: DocumentRequest,
     user: dict = Depends(verify_token)
 ):
-    """Generate and save a new document"""
+    """Queue generation of a new document and return the job id"""
+    # Reject invalid requests before they take a queue slot
     try:
-        # Generate document content
-        content = generate_document_content(request.doc_type, request.parameters)
-        
-        # Analyze document for RAI metrics
-        rai_results = analyze_document(content, request.doc_type)
-        
-        # Save document to database
-        doc_id = save_document(
-            user_id=user["user_id"],
-            doc_type=request.doc_type,
-            title=request.title,
-            content=content,
-            parameters=json.dumps(request.parameters),
-            rai_score=rai_results["score"],
-            rai_flags=json.dumps(rai_results["flags"])
+        validate_parameters(request.doc_type, request.parameters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Hold the credits before queueing, so a user without enough credits is
+    # turned away before anything is generated
+    credits = get_document_type(request.doc_type).credits
+    try:
+        reservation = await asyncio.to_thread(
+            reserve, user["user_id"], credits, f"Generate {request.title}"
         )
-        
-        return {
-            "status": "success",
-            "document_id": doc_id,
-            "rai_score": rai_results["score"],
-            "rai_flags": rai_results["flags"]
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    except InsufficientCredits as e:
+        raise HTTPException(status_code=402, detail=str(e))
+    
+    try:
+        job_id = job_queue.submit(
+            generate_and_save_document,
+            user["user_id"],
+            request,
+            reservation,
+            owner=user["user_id"]
+        )
+    except QueueFull as e:
+        if reservation is not None:
+            await asyncio.to_thread(release_reservation, reservation["id"])
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    
+    return {
+        "status": "queued",
+        "job_id": job_id,
+        "status_url": f"/api/jobs/{job_id}",
+        "events_url": f"/api/jobs/{job_id}/events"
+    }
+
+@app.get("/api/documents")
+async def list_documents(
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    doc_type: Optional[str] = None,
+    user: dict = Depends(verify_token)
+):
+    """List the user's documents newest first, one page at a time"""
+    try:
+        documents, next_cursor = await asyncio.to_thread(
+            get_user_documents, user["user_id"], limit, cursor, doc_type
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "documents": [
+            {
+                "id": doc["id"],
+                "doc_type": doc["doc_type"],
+                "title": doc["title"],
+                "created_at": doc["created_at"],
+                "rai_score": doc["rai_score"]
+            }
+            for doc in documents
+        ],
+        "next_cursor": next_cursor
+    }
+
+@app.get("/api/documents/search")
+async def search_user_documents(
+    q: str,
+    limit: int = SEARCH_PAGE_SIZE,
+    offset: int = 0,
+    doc_type: Optional[str] = None,
+    user: dict = Depends(verify_token)
+):
+    """Search the user's documents by title, text and key parameters, best match first"""
+    try:
+        documents, next_offset = await asyncio.to_thread(
+            search_documents, user["user_id"], q, limit, offset, doc_type
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "documents": [
+            {
+                "id": doc["id"],
+                "doc_type": doc["doc_type"],
+                "title": doc["title"],
+                "created_at": doc["created_at"],
+                "rai_score": doc["rai_score"]
+            }
+            for doc in documents
+        ],
+        "next_offset": next_offset
+    }
+
+@app.post("/api/documents/batch")
+async def create_documents_batch(
+    request: BatchDocumentRequest,
+    user: dict = Depends(verify_token)
+):
+    """Generate and save a batch of documents, reporting results per item"""
+    if not request.documents:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    
+    if len(request.documents) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_SIZE} documents")
+    
+    try:
+        results = await asyncio.to_thread(generate_document_batch, user["user_id"], request.documents)
+    except InsufficientCredits as e:
+        raise HTTPException(status_code=402, detail=str(e))
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    
+    return {
+        "status": "success" if succeeded == len(results) else ("partial" if succeeded else "error"),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results
+    }
+
+@app.post("/api/documents/preview")
+async def preview_document(
+    request: DocumentRequest,
+    user: dict = Depends(verify_token)
+):
+    """Stream the rendered HTML of a document without saving it"""
+    try:
+        validate_parameters(request.doc_type, request.parameters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return StreamingResponse(
+        stream_document_content(request.doc_type, request.parameters, user["user_id"]),
+        media_type="text/html; charset=utf-8"
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    user: dict = Depends(verify_token)
+):
+    """Get the status of a document generation job"""
+    job = job_queue.get(job_id, owner=user["user_id"])
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return serialize_job(job)
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    user: dict = Depends(verify_token)
+):
+    """Stream job status changes as server-sent events until the job finishes"""
+    if not job_queue.get(job_id, owner=user["user_id"]):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        last_status = None
+        while True:
+            job = job_queue.get(job_id, owner=user["user_id"])
+            if not job:
+                yield "event: error\ndata: {\"detail\": \"Job not found\"}\n\n"
+                return
+            
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"event: status\ndata: {json.dumps(serialize_job(job))}\n\n"
+            
+            if job["status"] in FINISHED_STATES:
+                return
+            
+            await asyncio.sleep(JOB_EVENT_POLL_SECONDS)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
 
 @app.get("/api/documents/{doc_id}")
 async def get_document(
@@ -96,7 +432,7 @@ async def get_document(
     user: dict = Depends(verify_token)
 ):
     """Retrieve a document by ID"""
-    document = get_document_by_id(doc_id, user["user_id"])
+    document = await asyncio.to_thread(get_document_by_id, doc_id, user["user_id"])
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -105,13 +441,49 @@ async def get_document(
         "id": document[0],
         "doc_type": document[1],
         "title": document[2],
-        "content": document[3],
+        # Evicted assets are read back from the database
+        "content": await asyncio.to_thread(resolve_assets, document[3]),
         "parameters": json.loads(document[4]),
         "rai_score": document[5],
-        "rai_flags": json.loads(document[6]),
+        # Rows saved before the pipeline wrote RAI results with the insert may have none
+        "rai_flags": json.loads(document[6]) if document[6] else {},
         "created_at": document[7].isoformat()
     }
 
+@app.get("/api/documents/{doc_id}/pdf")
+async def download_document_pdf(
+    doc_id: str,
+    user: dict = Depends(verify_token)
+):
+    """Stream a stored document as a PDF"""
+    document = await asyncio.to_thread(get_document_by_id, doc_id, user["user_id"])
+    
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    return StreamingResponse(
+        stream_pdf(document[3], document[2]),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{doc_id}.pdf"'}
+    )
+
+@app.get("/api/documents/{doc_id}/docx")
+async def download_document_docx(
+    doc_id: str,
+    user: dict = Depends(verify_token)
+):
+    """Stream a stored document as a DOCX"""
+    document = await asyncio.to_thread(get_document_by_id, doc_id, user["user_id"])
+    
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    return StreamingResponse(
+        stream_docx(document[3], document[2], document[1]),
+        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        headers={"Content-Disposition": f'attachment; filename="{doc_id}.docx"'}
+    )
+
 @app.post("/api/payments")
 async def create_payment(
     request: PaymentRequest,
@@ -151,6 +523,7 @@ async def create_payment(
             conn.commit()
             cursor.close()
             conn.close()
+            invalidate_user(user["user_id"])
             
             return {"status": "success", "subscription_id": subscription_id}
         
@@ -2,15 +2,18 @@ import streamlit as st
 import sys
 import os
 from auth import check_authentication, login_page, logout
-from db import init_db, upgrade_db
+from migrations import migrate
+from storage_codec import start_background_compression
+from retention import start_retention_scheduler
 from utils.styles import apply_custom_css, render_clickable_logo
 from utils.sidebar import create_sidebar
 
 def ensure_database():
     """Ensure database is properly initialized and upgraded"""
     try:
-        init_db()
-        upgrade_db()
+        migrate()
+        start_background_compression()
+        start_retention_scheduler()
     except Exception as e:
         st.error(f"Database initialization failed: {str(e)}")
         st.stop()
@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import types
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Cache configuration (override with environment variables)
+ARTIFACT_CACHE_DIR = os.getenv(
+    "ARTIFACT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'artifacts')
+)
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_MEMORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+DISK_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_DISK_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Directory of the application's own modules
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Source file hashes, keyed by (path, mtime)
+_module_versions = {}
+
+def module_version(module):
+    """Get a hash of a module's source file (its name if it has none)"""
+    path = getattr(module, '__file__', None)
+    if not path:
+        return module.__name__
+
+    mtime = os.stat(path).st_mtime_ns
+    version = _module_versions.get((path, mtime))
+    if version is None:
+        with open(path, 'rb') as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:16]
+        _module_versions[(path, mtime)] = version
+    return version
+
+def _app_modules(module):
+    """The module plus the application modules it imports or imports names from"""
+    modules = {module.__name__: module}
+    for value in vars(module).values():
+        name = value.__name__ if isinstance(value, types.ModuleType) else getattr(value, '__module__', None)
+        dependency = sys.modules.get(name) if isinstance(name, str) else None
+        path = getattr(dependency, '__file__', None)
+        if path and os.path.abspath(path).startswith(APP_DIR + os.sep) and '-packages' not in path:
+            modules[dependency.__name__] = dependency
+    return modules
+
+def code_version(*functions):
+    """
+    Get a version hash for the code behind the given functions
+
+    Covers the modules that define them and the application modules those
+    import from (for a template: the template engine, invoice totals and so
+    on), so a change to any of them gives new cache keys.
+    """
+    modules = {}
+    for function in functions:
+        module = sys.modules.get(function.__module__)
+        if module is None:
+            modules[function.__module__] = None
+        else:
+            modules.update(_app_modules(module))
+
+    versions = {name: module and module_version(module) for name, module in modules.items()}
+    payload = json.dumps(versions, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def make_cache_key(doc_type, version, parameters, profile, fmt, extra=None):
+    """Build a content hash key for a rendered artifact"""
+    payload = json.dumps(
+        {
+            'doc_type': doc_type,
+            'version': version,
+            'parameters': parameters,
+            'profile': profile,
+            'format': fmt,
+            'extra': extra
+        },
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ArtifactCache:
+    """Two-tier (memory LRU + disk) cache of rendered document artifacts"""
+
+    def __init__(self, directory=ARTIFACT_CACHE_DIR, memory_max_bytes=MEMORY_CACHE_MAX_BYTES,
+                 disk_max_bytes=DISK_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """Get cached bytes for a key, or None on a miss"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return data
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Refresh recency for disk eviction
+        except OSError:
+            with self._lock:
+                self._counters['misses'] += 1
+            return None
+
+        with self._lock:
+            self._counters['disk_hits'] += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        """Store bytes for a key in both tiers"""
+        with self._lock:
+            self._remember(key, data)
+
+        try:
+            self._write_disk(key, data)
+        except OSError as e:
+            print(f"Error writing artifact cache: {str(e)}")
+
+    def _remember(self, key, data):
+        """Add an entry to the memory tier and evict least recently used entries"""
+        if len(data) > self.memory_max_bytes:
+            return
+
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._counters['evictions'] += 1
+
+    def _write_disk(self, key, data):
+        """Write an entry to the disk tier and evict the oldest files if over the limit"""
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(data)
+            over_limit = self._disk_bytes > self.disk_max_bytes
+
+        if over_limit:
+            self._evict_disk()
+
+    def _disk_entries(self):
+        """List (mtime, size, path) for every file in the disk tier"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_disk_bytes(self):
+        return sum(size for _, size, _ in self._disk_entries())
+
+    def _evict_disk(self):
+        """Delete the least recently used files until the disk tier is under 90% of its limit"""
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * 0.9
+
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._counters['evictions'] += 1
+
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+        for _, _, path in self._disk_entries():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+        with self._lock:
+            self._disk_bytes = 0
+
+    def stats(self):
+        """Get hit/miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['disk_bytes'] = self._disk_bytes
+
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_artifact_cache():
+    """Get the process-wide artifact cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ArtifactCache()
+    return _cache
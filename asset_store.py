@@ -0,0 +1,211 @@
+# Content-addressed store for binary assets embedded in documents (company logos)
+#
+# Templates reference an asset as asset://<sha256 hex> instead of inlining it
+# as a base64 data URI, so a logo is stored once no matter how many documents
+# use it. save_document links each referenced asset to the document in
+# document_assets; triggers keep assets.refcount in step with those links.
+# Exporters call resolve_assets() to turn references back into data URIs, and
+# each asset's data URI is built once per process.
+
+import os
+import re
+import base64
+import hashlib
+import mimetypes
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+
+# Number of assets (and data URIs) kept in memory (override with environment variables)
+ASSET_CACHE_SIZE = int(os.getenv("ASSET_CACHE_SIZE", "64"))
+
+ASSET_SCHEME = "asset://"
+ASSET_REF_PATTERN = re.compile(r"asset://([0-9a-f]{64})")
+
+# Leading bytes of the image formats accepted as logos
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"<svg", "image/svg+xml"),
+    (b"<?xml", "image/svg+xml")
+)
+
+# asset id -> (mime type, bytes), most recently used last
+_assets = OrderedDict()
+_assets_lock = threading.Lock()
+
+# asset id -> path of the file it was read from, so an asset evicted from
+# memory before it was saved can be read again (only paths are kept here)
+_asset_files = {}
+
+class AssetNotFound(RuntimeError):
+    """Raised when a document references an asset that is neither stored nor readable"""
+
+def asset_ref(asset_id):
+    """Get the reference a template uses for an asset"""
+    return f"{ASSET_SCHEME}{asset_id}"
+
+def guess_mime_type(data, path=None):
+    """Detect an image's mime type from its leading bytes, then its file name"""
+    for signature, mime_type in _IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if path:
+        mime_type, _ = mimetypes.guess_type(path)
+        if mime_type:
+            return mime_type
+    return "image/png"
+
+def _remember(asset_id, mime_type, data):
+    with _assets_lock:
+        _assets[asset_id] = (mime_type, data)
+        _assets.move_to_end(asset_id)
+        while len(_assets) > ASSET_CACHE_SIZE:
+            _assets.popitem(last=False)
+
+def put_asset(data, mime_type=None):
+    """Add bytes to the in-process store and return their asset id"""
+    asset_id = hashlib.sha256(data).hexdigest()
+    _remember(asset_id, mime_type or guess_mime_type(data), data)
+    return asset_id
+
+@lru_cache(maxsize=ASSET_CACHE_SIZE)
+def _file_asset(path, mtime_ns, size):
+    with open(path, "rb") as f:
+        data = f.read()
+    asset_id = put_asset(data, guess_mime_type(data, path))
+    _asset_files[asset_id] = path
+    return asset_id
+
+def _reread_file_asset(asset_id):
+    """Read an evicted file asset again; None if its file is gone or has changed"""
+    path = _asset_files.get(asset_id)
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if hashlib.sha256(data).hexdigest() != asset_id:
+        return None
+    mime_type = guess_mime_type(data, path)
+    _remember(asset_id, mime_type, data)
+    return mime_type, data
+
+def register_file(path):
+    """Get the asset id for a file, reading and hashing it only when it changes"""
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    asset_id = _file_asset(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if asset_id not in _assets:
+        # Evicted since the file was read
+        _file_asset.cache_clear()
+        asset_id = _file_asset(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    return asset_id
+
+def get_asset(asset_id):
+    """Get (mime type, bytes) for an asset from memory or the database, or None"""
+    asset = _assets.get(asset_id)
+    if asset is not None:
+        return asset
+
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            "SELECT mime_type, data FROM assets WHERE id = ?", (asset_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        return _reread_file_asset(asset_id)
+    _remember(asset_id, row[0], row[1])
+    return row[0], row[1]
+
+@lru_cache(maxsize=ASSET_CACHE_SIZE)
+def _encoded_asset(asset_id):
+    # Missing assets raise, so they aren't memoized
+    asset = get_asset(asset_id)
+    if asset is None:
+        raise KeyError(asset_id)
+    mime_type, data = asset
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode()}"
+
+def data_uri(asset_id):
+    """Get the base64 data URI for an asset, or None (assets never change, so this is memoized)"""
+    try:
+        return _encoded_asset(asset_id)
+    except KeyError:
+        return None
+
+def find_asset_ids(content):
+    """Get the ids of the assets referenced in HTML content"""
+    if ASSET_SCHEME not in content:
+        return set()
+    return set(ASSET_REF_PATTERN.findall(content))
+
+def assets_available(content):
+    """Check that every asset referenced in HTML content can be resolved"""
+    return all(get_asset(asset_id) is not None for asset_id in find_asset_ids(content))
+
+def _resolve_match(match):
+    return data_uri(match.group(1)) or match.group(0)
+
+def resolve_assets(content):
+    """Replace asset references in HTML with data URIs (unknown assets are left as is)"""
+    if ASSET_SCHEME not in content:
+        return content
+    return ASSET_REF_PATTERN.sub(_resolve_match, content)
+
+def collect_assets(content):
+    """
+    Get {asset id: (mime type, bytes) or None} for the assets a document references
+
+    An asset evicted from memory is read again from its file; None means it
+    is neither in memory nor readable (it may still be stored already).
+    """
+    return {
+        asset_id: _assets.get(asset_id) or _reread_file_asset(asset_id)
+        for asset_id in find_asset_ids(content)
+    }
+
+def attach_assets(cursor, doc_id, content, assets=None):
+    """
+    Store the assets referenced by a document and link them to it
+
+    assets is collect_assets(content) if it was already collected. Raises
+    AssetNotFound if an asset is neither stored nor readable, rather than
+    saving a reference that can never be resolved.
+    """
+    if assets is None:
+        assets = collect_assets(content)
+    for asset_id, asset in assets.items():
+        if asset is not None:
+            mime_type, data = asset
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO assets (id, mime_type, data, size)
+                VALUES (?, ?, ?, ?)
+                """,
+                (asset_id, mime_type, data, len(data))
+            )
+        elif cursor.execute("SELECT 1 FROM assets WHERE id = ?", (asset_id,)).fetchone() is None:
+            raise AssetNotFound(f"Document references asset {asset_id}, which is not stored or available")
+
+        cursor.execute(
+            "INSERT OR IGNORE INTO document_assets (document_id, asset_id) VALUES (?, ?)",
+            (doc_id, asset_id)
+        )
+
+def delete_unreferenced_assets(cursor):
+    """Delete assets no document links to; returns the number deleted"""
+    cursor.execute("DELETE FROM assets WHERE refcount <= 0")
+    return cursor.rowcount
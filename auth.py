@@ -4,6 +4,7 @@ import jwt
 from datetime import datetime, timedelta
 import uuid
 from db import get_db_connection
+from user_cache import cached_user_read, invalidate_user
 
 # JWT configuration
 JWT_SECRET = "your-secret-key"  # In production, use environment variable
@@ -15,7 +16,7 @@ def init_user_db():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Create users table if it doesn't exist (moved to db.py init_db())
+    # Create users table if it doesn't exist (moved to migrations.py)
     cursor.close()
     conn.close()
 
@@ -180,6 +181,11 @@ def get_user_info():
     if not check_authentication():
         return None
     
+    return load_user_info(st.session_state["user_id"])
+
+@cached_user_read
+def load_user_info(user_id):
+    """Get a user's profile fields (cached until the user's data changes)"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -192,7 +198,7 @@ def get_user_info():
                    business_phone, business_email, onboarding_completed
             FROM users WHERE id = ?
             """,
-            (st.session_state["user_id"],)
+            (user_id,)
         )
         user = cursor.fetchone()
         
@@ -229,12 +235,12 @@ def get_user_stats():
         if not user:
             return None
         
-        # Get document count
+        # Get document count from the usage counters
         cursor.execute(
             """
-            SELECT COUNT(*) as doc_count
-            FROM documents 
-            WHERE user_id = ? AND created_at >= DATE('now', '-30 days')
+            SELECT COALESCE(SUM(document_count), 0) as doc_count
+            FROM user_monthly_usage
+            WHERE user_id = ? AND month = strftime('%Y-%m', 'now')
             """,
             (st.session_state["user_id"],)
         )
@@ -298,6 +304,7 @@ def update_user_stats(user_id, stats):
                 st.session_state[key] = value
         
         cursor.execute("COMMIT")
+        invalidate_user(user_id)
         return True
         
     except Exception as e:
@@ -347,6 +354,7 @@ def update_user_info(user_id, data):
         )
         
         conn.commit()
+        invalidate_user(user_id)
         return True
         
     except Exception as e:
@@ -373,7 +381,19 @@ def delete_user(user_id):
             "DELETE FROM credit_transactions WHERE user_id = ?",
             (user_id,)
         )
-        
+
+        # Delete credit reservations
+        cursor.execute(
+            "DELETE FROM credit_reservations WHERE user_id = ?",
+            (user_id,)
+        )
+
+        # Delete document feedback
+        cursor.execute(
+            "DELETE FROM document_feedback WHERE user_id = ?",
+            (user_id,)
+        )
+
         # Delete documents
         cursor.execute(
             "DELETE FROM documents WHERE user_id = ?",
@@ -394,6 +414,7 @@ def delete_user(user_id):
         
         # Commit all changes
         cursor.execute("COMMIT")
+        invalidate_user(user_id)
         return True, "Account successfully deleted"
         
     except Exception as e:
@@ -0,0 +1,70 @@
+# Benchmark: invoice totals with the float row loop vs the fixed-point column engine
+#
+# Both sum unrounded quantity * price products and round the totals once, so
+# they print the same totals; the engine's sums are exact integers, where the
+# float loop can drift by a cent on large invoices. The engine parses and
+# sums a batch of lines column by column, so it has a fixed cost per invoice
+# that shows up on very small ones.
+#
+# Usage: python benchmarks/bench_invoice_totals.py
+
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from invoice_totals import compute_totals, format_money
+
+SIZES = [10, 1000, 10000, 100000]
+REPEATS = 5
+TAX_RATE = 7.5
+SHIPPING = 12.0
+
+def make_lines(line_count):
+    """Build line item lines with sub-cent unit prices"""
+    return [f"Item {i} | {i % 7 + 1} | {i % 100}.{i % 1000:03d}" for i in range(line_count)]
+
+def legacy_totals(lines, tax_rate, shipping):
+    """Totals as previously computed: unrounded float line amounts summed row by row"""
+    subtotal = 0
+    for line in lines:
+        if line.strip():
+            parts = [part.strip() for part in line.split('|')]
+            if len(parts) == 3:
+                desc, qty, price = parts
+                try:
+                    qty = float(qty)
+                    price = float(price)
+                    subtotal += qty * price
+                except ValueError:
+                    continue
+
+    tax_amount = subtotal * (tax_rate / 100)
+    total = subtotal + tax_amount + shipping
+    return f"{total:.2f}"
+
+def engine_totals(lines, tax_rate, shipping):
+    return format_money(compute_totals(lines, tax_rate, shipping)['total'])
+
+def best_time(fn, *args):
+    """Best wall time of REPEATS runs in milliseconds"""
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    print(f"{'line items':>10}  {'float loop (ms)':>15}  {'engine (ms)':>12}  {'speedup':>8}  totals")
+    for size in SIZES:
+        lines = make_lines(size)
+        legacy = best_time(legacy_totals, lines, TAX_RATE, SHIPPING)
+        engine = best_time(engine_totals, lines, TAX_RATE, SHIPPING)
+        legacy_total = legacy_totals(lines, TAX_RATE, SHIPPING)
+        engine_total = engine_totals(lines, TAX_RATE, SHIPPING)
+        match = "match" if legacy_total == engine_total else f"float {legacy_total} vs exact {engine_total}"
+        print(f"{size:>10}  {legacy:>15.2f}  {engine:>12.2f}  {legacy / engine:>7.2f}x  {match}")
+
+if __name__ == '__main__':
+    main()
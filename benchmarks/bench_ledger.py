@@ -0,0 +1,150 @@
+# Benchmark: concurrent credit debits against one balance
+#
+# Builds a temporary database with the app's migrations and a single user,
+# then has N threads charge documents from that user's balance at the same
+# time, first with the previous deduct-then-check-and-roll-back approach and
+# then with ledger.debit. Both must end with a balance that is never negative
+# and that matches the charges recorded; the interesting numbers are the
+# throughput and the writes wasted on rejected charges.
+#
+# Usage: python benchmarks/bench_ledger.py [threads] [charges per thread]
+
+import os
+import sys
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+from migrations import migrate
+from ledger import debit, InsufficientCredits
+
+THREADS = 8
+CHARGES = 200
+AMOUNT = 3
+
+def deduct_then_check(user_id, amount, document_id, description):
+    """The previous deduct_credits: deduct, read the balance back, roll back if negative"""
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN")
+        cursor.execute(
+            """
+            UPDATE users
+            SET ai_credits = ai_credits - ?,
+                total_credits_used = total_credits_used + ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND subscription != 'pro'
+            RETURNING ai_credits
+            """,
+            (amount, amount, user_id)
+        )
+        result = cursor.fetchone()
+        if not result:
+            cursor.execute("ROLLBACK")
+            return True
+        if result[0] < 0:
+            cursor.execute("ROLLBACK")
+            return False
+
+        cursor.execute(
+            """
+            INSERT INTO credit_transactions
+            (id, user_id, amount, transaction_type, document_id, description, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            (str(uuid.uuid4()), user_id, -amount, 'deduction', document_id, description)
+        )
+        cursor.execute("COMMIT")
+        return True
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+def ledger_debit(user_id, amount, document_id, description):
+    try:
+        debit(user_id, amount, document_id, description)
+        return True
+    except InsufficientCredits:
+        return False
+
+def reset_user(user_id, balance):
+    with db.db_connection() as conn:
+        conn.execute("DELETE FROM credit_transactions")
+        conn.execute("DELETE FROM users")
+        conn.execute(
+            "INSERT INTO users (id, email, name, password_hash, subscription, ai_credits) VALUES (?, ?, ?, 'x', 'free', ?)",
+            (user_id, f"{user_id}@example.com", user_id, balance)
+        )
+        conn.commit()
+
+def run(charge, threads, charges, balance):
+    """Run threads x charges debits; returns (seconds, accepted, rejected, errors)"""
+    user_id = "bench-user"
+    reset_user(user_id, balance)
+    counts = {'accepted': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    start_gate = threading.Barrier(threads)
+
+    def worker(index):
+        start_gate.wait()
+        for number in range(charges):
+            try:
+                outcome = 'accepted' if charge(user_id, AMOUNT, None, f"doc {index}-{number}") else 'rejected'
+            except sqlite3.OperationalError:
+                # "database is locked" after the busy timeout
+                outcome = 'errors'
+            with lock:
+                counts[outcome] += 1
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with db.db_connection() as conn:
+        final_balance = conn.execute("SELECT ai_credits FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+        recorded = conn.execute(
+            "SELECT COALESCE(-SUM(amount), 0) FROM credit_transactions WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+    consistent = final_balance >= 0 and balance - final_balance == recorded == counts['accepted'] * AMOUNT
+    return elapsed, counts, final_balance, consistent
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    threads = int(argv[0]) if argv else THREADS
+    charges = int(argv[1]) if len(argv) > 1 else CHARGES
+
+    db.DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_ledger.db")
+    migrate()
+
+    # Enough credits for half of the charges, so half are rejected
+    balance = threads * charges * AMOUNT // 2
+    total = threads * charges
+    print(f"{threads} threads x {charges} charges of {AMOUNT} credits, starting balance {balance}")
+
+    failed = False
+    for label, charge in (("deduct then check", deduct_then_check), ("ledger debit", ledger_debit)):
+        elapsed, counts, final_balance, consistent = run(charge, threads, charges, balance)
+        failed = failed or not consistent
+        print(
+            f"{label:>18}  {total / elapsed:>8.0f} charges/s  {counts['accepted']:>6} accepted  "
+            f"{counts['rejected']:>6} rejected  {counts['errors']:>3} errors  "
+            f"balance {final_balance:>6}  {'ok' if consistent else 'INCONSISTENT'}"
+        )
+
+    db._pool.close_all()
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
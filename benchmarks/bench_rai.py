@@ -0,0 +1,109 @@
+# Benchmark: RAI analyzer throughput over a corpus generated from the five templates
+#
+# Reports uncached (every document new) and memoized throughput, and exits
+# with status 1 if the uncached rate is below rai.TARGET_DOCS_PER_SEC.
+#
+# Usage: python benchmarks/bench_rai.py [documents per type]
+
+import os
+import sys
+import time
+import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rai
+from templates.registry import get_registry
+
+DOCS_PER_TYPE = 200
+REPEATS = 3
+
+# Mixed into some textarea fields so the corpus has findings to report
+SAMPLE_FINDINGS = [
+    "Our world-class team delivers guaranteed results, 100% risk-free.",
+    "Contact the chairman at jane.doe@example.com or (555) 123-4567.",
+    "Payments go to account 12345678901 and card 4111 1111 1111 1111.",
+    "We need more manpower; the foreman will blacklist late vendors.",
+    ""
+]
+
+def sample_parameters(parameters, index):
+    """Fill every field of a template with a value that varies with index"""
+    values = {}
+    for section in parameters:
+        for field in section['fields']:
+            field_id = field['id']
+            if field['type'] == 'date':
+                values[field_id] = datetime.date(2024, 1, 1) + datetime.timedelta(days=index)
+            elif field['type'] == 'number':
+                values[field_id] = float(index % 50)
+            elif field['type'] == 'select':
+                values[field_id] = field['options'][index % len(field['options'])]
+            elif field_id == 'line_items':
+                values[field_id] = "\n".join(
+                    f"Item {index}-{row} | {row + 1} | {index % 90 + row}.50" for row in range(10)
+                )
+            elif field_id == 'tax_classes':
+                values[field_id] = ""
+            elif field['type'] == 'textarea':
+                finding = SAMPLE_FINDINGS[index % len(SAMPLE_FINDINGS)]
+                values[field_id] = f"{field['label']} for document {index}.\n{finding}\nFurther details follow."
+            else:
+                values[field_id] = f"{field['label']} {index}"
+    return values
+
+def build_corpus(docs_per_type):
+    """Generate (content, doc_type) pairs from every registered template"""
+    corpus = []
+    for document_type in get_registry().ordered():
+        for index in range(docs_per_type):
+            content = document_type.generate(sample_parameters(document_type.parameters, index))
+            corpus.append((content, document_type.name))
+    return corpus
+
+def run(corpus):
+    """Seconds to analyze the whole corpus once"""
+    start = time.perf_counter()
+    for content, doc_type in corpus:
+        rai.analyze_document(content, doc_type)
+    return time.perf_counter() - start
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    docs_per_type = int(argv[0]) if argv else DOCS_PER_TYPE
+    corpus = build_corpus(docs_per_type)
+    total_bytes = sum(len(content) for content, _ in corpus)
+    print(f"Corpus: {len(corpus)} documents, {total_bytes / len(corpus) / 1024:.1f} KB average")
+
+    # Uncached: clear the memo before every pass
+    uncached = None
+    for _ in range(REPEATS):
+        rai._results.clear()
+        elapsed = run(corpus)
+        uncached = elapsed if uncached is None else min(uncached, elapsed)
+
+    # Memoized: every document was analyzed by the last pass
+    # (the memo must hold the whole corpus for this to measure hits)
+    memoized = run(corpus) if len(corpus) <= rai.RAI_CACHE_SIZE else None
+
+    uncached_rate = len(corpus) / uncached
+    print(f"{'uncached':>10}  {uncached_rate:>10.0f} docs/sec  {uncached / len(corpus) * 1e6:>8.1f} us/doc")
+    if memoized is not None:
+        print(f"{'memoized':>10}  {len(corpus) / memoized:>10.0f} docs/sec  {memoized / len(corpus) * 1e6:>8.1f} us/doc")
+
+    levels = {}
+    for content, doc_type in corpus:
+        flags = rai.analyze_document(content, doc_type)['flags']
+        for check in ('hallucination', 'security'):
+            levels.setdefault((check, flags[check]), 0)
+            levels[(check, flags[check])] += 1
+        levels.setdefault(('bias', flags['bias']['level']), 0)
+        levels[('bias', flags['bias']['level'])] += 1
+    print("Levels: " + ", ".join(f"{check} {level}: {count}" for (check, level), count in sorted(levels.items())))
+
+    if uncached_rate < rai.TARGET_DOCS_PER_SEC:
+        print(f"FAIL  below the target of {rai.TARGET_DOCS_PER_SEC} docs/sec")
+        return 1
+    print(f"ok    target is {rai.TARGET_DOCS_PER_SEC} docs/sec")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
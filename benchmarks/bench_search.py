@@ -0,0 +1,108 @@
+# Benchmark: full-text search latency on a database of generated documents
+#
+# Builds a temporary database with the app's migrations, fills it with
+# documents generated from the five templates (spread over many users, as in
+# production), then times search_index.search_documents for one user with
+# rare, common and prefix queries.
+#
+# Usage: python benchmarks/bench_search.py [documents] [users]
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+from migrations import migrate
+from search_index import search_documents
+from templates.registry import get_registry
+from bench_rai import sample_parameters
+
+DOCUMENTS = 100000
+USERS = 100
+REPEATS = 20
+SAMPLES = 50
+
+# (label, query) timed for one user
+QUERIES = [
+    ("rare word", "foxtrot"),
+    ("two words", "foxtrot golf"),
+    ("common word", "agreement"),
+    ("every document", "document"),
+    ("client name", "Client 7"),
+    ("prefix", "fox*"),
+    ("no match", "nonexistent")
+]
+
+# Slowest average latency accepted for any query
+TARGET_MS = 20.0
+
+WORDS = "alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima".split()
+
+def build_database(path, documents, users):
+    """Create a database at path holding the given number of documents"""
+    db.DB_FILE = path
+    migrate()
+
+    samples = []
+    document_types = get_registry().ordered()
+    for index in range(SAMPLES):
+        document_type = document_types[index % len(document_types)]
+        parameters = sample_parameters(document_type.parameters, index)
+        parameters["client_name"] = f"Client {index}"
+        samples.append((document_type.name, document_type.generate(parameters), json.dumps(parameters, default=str)))
+
+    user_ids = [f"user-{index}" for index in range(users)]
+    rng = random.Random(1)
+    with db.db_connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (id, email, name, password_hash) VALUES (?, ?, ?, 'x')",
+            [(user_id, f"{user_id}@example.com", user_id) for user_id in user_ids]
+        )
+        rows = []
+        for index in range(documents):
+            doc_type, content, parameters = samples[index % SAMPLES]
+            note = f"<p>{rng.choice(WORDS)} {rng.choice(WORDS)} note {index}</p>"
+            rows.append((
+                f"doc-{index}", user_ids[index % users], doc_type,
+                f"Document {index} {rng.choice(WORDS)}", content + note, parameters
+            ))
+        conn.executemany(
+            "INSERT INTO documents (id, user_id, doc_type, title, content, parameters) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.commit()
+    return user_ids
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    documents = int(argv[0]) if argv else DOCUMENTS
+    users = int(argv[1]) if len(argv) > 1 else USERS
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_search.db")
+    started = time.perf_counter()
+    user_ids = build_database(path, documents, users)
+    print(f"Indexed {documents} documents for {users} users in {time.perf_counter() - started:.1f}s")
+
+    user_id = user_ids[len(user_ids) // 2]
+    slowest = 0.0
+    for label, query in QUERIES:
+        results, _ = search_documents(user_id, query)
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            search_documents(user_id, query)
+        elapsed_ms = (time.perf_counter() - start) / REPEATS * 1000
+        slowest = max(slowest, elapsed_ms)
+        print(f"{label:>15}  {query!r:>16}  {len(results):>3} results  {elapsed_ms:>7.2f} ms")
+
+    db._pool.close_all()
+    if slowest > TARGET_MS:
+        print(f"FAIL  slowest query above the target of {TARGET_MS:.0f} ms")
+        return 1
+    print(f"ok    target is {TARGET_MS:.0f} ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
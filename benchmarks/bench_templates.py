@@ -0,0 +1,209 @@
+# Benchmark: invoice rendering with f-string concatenation vs the compiled template engine
+#
+# The engine side also parses line items exactly and keeps totals in integer
+# cents (invoice_totals.py); bench_invoice_totals.py times that part alone.
+#
+# Usage: python benchmarks/bench_templates.py
+
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from templates import invoice_template
+
+SIZES = [10, 1000, 10000]
+REPEATS = 15
+
+def make_parameters(line_count):
+    """Build invoice parameters with the given number of line items"""
+    return {
+        'business_name': 'Acme Corp',
+        'business_address': '1 Main St\nSpringfield',
+        'business_phone': '555-0100',
+        'business_email': 'billing@acme.test',
+        'client_name': 'Globex',
+        'client_address': '2 Side St\nShelbyville',
+        'invoice_number': 'INV-2024-001',
+        'invoice_date': '2024-03-05',
+        'due_date': '2024-04-04',
+        'payment_terms': 'Net 30',
+        'line_items': '\n'.join(f"Item {i} | {i % 7 + 1} | {i % 100}.99" for i in range(line_count)),
+        'tax_rate': 7.5,
+        'shipping': 12.0
+    }
+
+def legacy_generate(parameters):
+    """Invoice generator as previously written: repeated f-string concatenation"""
+    # Extract parameters
+    business_name = parameters.get('business_name', '')
+    business_address = parameters.get('business_address', '')
+    business_phone = parameters.get('business_phone', '')
+    business_email = parameters.get('business_email', '')
+    
+    client_name = parameters.get('client_name', '')
+    client_address = parameters.get('client_address', '')
+    client_phone = parameters.get('client_phone', '')
+    client_email = parameters.get('client_email', '')
+    
+    invoice_number = parameters.get('invoice_number', '')
+    invoice_date = parameters.get('invoice_date', '')
+    due_date = parameters.get('due_date', '')
+    payment_terms = parameters.get('payment_terms', '')
+    
+    line_items_text = parameters.get('line_items', '')
+    tax_rate = float(parameters.get('tax_rate', 0))
+    shipping = float(parameters.get('shipping', 0))
+    notes = parameters.get('notes', '')
+    payment_instructions = parameters.get('payment_instructions', '')
+    
+    # Process line items
+    line_items = []
+    subtotal = 0
+    
+    for line in line_items_text.split('\n'):
+        if line.strip():
+            parts = [part.strip() for part in line.split('|')]
+            if len(parts) == 3:
+                desc, qty, price = parts
+                try:
+                    qty = float(qty)
+                    price = float(price)
+                    amount = qty * price
+                    subtotal += amount
+                    line_items.append({
+                        'description': desc,
+                        'quantity': qty,
+                        'unit_price': price,
+                        'amount': amount
+                    })
+                except ValueError:
+                    continue
+
+    # Calculate totals
+    tax_amount = subtotal * (tax_rate / 100)
+    total = subtotal + tax_amount + shipping
+
+    # Check if company logo exists
+    company_logo = parameters.get('company_logo', '')
+    logo_html = ''
+    if company_logo and os.path.exists(company_logo):
+        import base64
+        with open(company_logo, "rb") as image_file:
+            encoded_string = base64.b64encode(image_file.read()).decode()
+        logo_html = f'<img src="data:image/png;base64,{encoded_string}" style="max-height: 80px; max-width: 200px; margin-bottom: 15px;">'
+    
+    # Generate HTML
+    document = f"""
+    <div style="max-width: 800px; margin: 0 auto; padding: 20px; font-family: Arial, sans-serif;">
+        <div style="display: flex; justify-content: space-between; margin-bottom: 40px;">
+            <div>
+                {logo_html}
+                <h1 style="color: #2c3e50; margin: 0; font-size: 28px;">INVOICE</h1>
+                <div style="margin-top: 20px;">
+                    <p style="margin: 5px 0;"><strong>{business_name}</strong></p>
+                    <p style="margin: 5px 0; white-space: pre-line;">{business_address}</p>
+                    <p style="margin: 5px 0;">Phone: {business_phone}</p>
+                    <p style="margin: 5px 0;">Email: {business_email}</p>
+                </div>
+            </div>
+            <div style="text-align: right;">
+                <h2 style="color: #7f8c8d; margin: 0;">Invoice #{invoice_number}</h2>
+                <p style="margin: 5px 0;">Date: {invoice_date}</p>
+                <p style="margin: 5px 0;">Due Date: {due_date}</p>
+                <p style="margin: 5px 0;">Terms: {payment_terms}</p>
+            </div>
+        </div>
+
+        <div style="margin-bottom: 30px;">
+            <h3 style="border-bottom: 1px solid #ccc; padding-bottom: 5px;">Bill To:</h3>
+            <p style="margin: 5px 0;"><strong>{client_name}</strong></p>
+            <p style="margin: 5px 0; white-space: pre-line;">{client_address}</p>
+            <p style="margin: 5px 0;">Phone: {client_phone}</p>
+            <p style="margin: 5px 0;">Email: {client_email}</p>
+        </div>
+
+        <table style="width: 100%; border-collapse: collapse; margin-bottom: 30px;">
+            <thead>
+                <tr style="background-color: #f2f2f2;">
+                    <th style="padding: 10px; text-align: left; border-bottom: 2px solid #ddd;">Description</th>
+                    <th style="padding: 10px; text-align: right; border-bottom: 2px solid #ddd;">Quantity</th>
+                    <th style="padding: 10px; text-align: right; border-bottom: 2px solid #ddd;">Unit Price</th>
+                    <th style="padding: 10px; text-align: right; border-bottom: 2px solid #ddd;">Amount</th>
+                </tr>
+            </thead>
+            <tbody>"""
+
+    for item in line_items:
+        document += f"""
+                <tr>
+                    <td style="padding: 10px; border-bottom: 1px solid #ddd;">{item['description']}</td>
+                    <td style="padding: 10px; text-align: right; border-bottom: 1px solid #ddd;">{item['quantity']}</td>
+                    <td style="padding: 10px; text-align: right; border-bottom: 1px solid #ddd;">${item['unit_price']:.2f}</td>
+                    <td style="padding: 10px; text-align: right; border-bottom: 1px solid #ddd;">${item['amount']:.2f}</td>
+                </tr>"""
+
+    document += f"""
+            </tbody>
+        </table>
+
+        <div style="margin-left: auto; width: 300px;">
+            <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
+                <strong>Subtotal:</strong>
+                <span>${subtotal:.2f}</span>
+            </div>
+            <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
+                <strong>Tax ({tax_rate}%):</strong>
+                <span>${tax_amount:.2f}</span>
+            </div>
+            <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
+                <strong>Shipping:</strong>
+                <span>${shipping:.2f}</span>
+            </div>
+            <div style="display: flex; justify-content: space-between; margin-top: 10px; padding-top: 10px; border-top: 2px solid #2c3e50;">
+                <strong>Total:</strong>
+                <span style="font-size: 1.2em; font-weight: bold;">${total:.2f}</span>
+            </div>
+        </div>"""
+
+    if notes:
+        document += f"""
+        <div style="margin-top: 40px;">
+            <h3 style="border-bottom: 1px solid #ccc; padding-bottom: 5px;">Notes:</h3>
+            <p style="white-space: pre-line;">{notes}</p>
+        </div>"""
+
+    if payment_instructions:
+        document += f"""
+        <div style="margin-top: 20px;">
+            <h3 style="border-bottom: 1px solid #ccc; padding-bottom: 5px;">Payment Instructions:</h3>
+            <p style="white-space: pre-line;">{payment_instructions}</p>
+        </div>"""
+
+    document += """
+        <div style="margin-top: 40px; text-align: center; color: #7f8c8d; font-size: 0.9em;">
+            <p>Thank you for your business!</p>
+        </div>
+    </div>
+    """
+
+    return document
+
+def best_time(fn, parameters):
+    """Best wall time of REPEATS runs, in milliseconds"""
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(parameters)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    print(f"{'line items':>10}  {'f-string (ms)':>14}  {'engine (ms)':>12}  {'speedup':>8}")
+    for size in SIZES:
+        parameters = make_parameters(size)
+        legacy = best_time(legacy_generate, parameters)
+        engine = best_time(invoice_template.generate, parameters)
+        print(f"{size:>10}  {legacy:>14.2f}  {engine:>12.2f}  {legacy / engine:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
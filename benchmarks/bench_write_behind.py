@@ -0,0 +1,77 @@
+# Benchmark: one commit per write versus the write-behind queue
+#
+# Builds a temporary database with the app's migrations, then writes the
+# same number of feedback rows three ways: a commit per row, the
+# write-behind queue, and the write-behind queue with its crash-safety
+# journal. Reports the time callers spend writing and how long the queue
+# takes to have everything committed.
+#
+# Usage: python benchmarks/bench_write_behind.py [writes]
+
+import os
+import sys
+import time
+import uuid
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+from migrations import migrate
+from write_behind import WriteBehindQueue
+
+WRITES = 5000
+
+INSERT = """
+    INSERT OR IGNORE INTO document_feedback (id, document_id, user_id, rating, comments, created_at)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+"""
+
+def row(index):
+    return (str(uuid.uuid4()), f"doc-{index}", "bench-user", index % 5 + 1, None)
+
+def commit_per_write(writes):
+    for index in range(writes):
+        conn = db.get_db_connection()
+        conn.execute(INSERT, row(index))
+        conn.commit()
+        conn.close()
+
+def count_rows():
+    with db.db_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM document_feedback").fetchone()[0]
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    writes = int(argv[0]) if argv else WRITES
+
+    directory = tempfile.mkdtemp()
+    db.DB_FILE = os.path.join(directory, "bench_write_behind.db")
+    migrate()
+    # The app's default; FULL syncs every commit
+    print(f"{writes} writes, synchronous = {db.DB_SYNCHRONOUS}")
+
+    start = time.perf_counter()
+    commit_per_write(writes)
+    elapsed = time.perf_counter() - start
+    print(f"{'commit per write':>24}  {elapsed * 1000:>8.1f} ms writing  {writes / elapsed:>9.0f} writes/s")
+
+    for label, journal_path in (("write-behind", None), ("write-behind + journal", os.path.join(directory, "journal"))):
+        before = count_rows()
+        queue = WriteBehindQueue(journal_path=journal_path)
+        start = time.perf_counter()
+        for index in range(writes):
+            queue.enqueue(INSERT, row(index))
+        enqueued = time.perf_counter() - start
+        queue.close()
+        elapsed = time.perf_counter() - start
+        stats = queue.get_stats()
+        assert count_rows() - before == writes, "writes were lost"
+        print(
+            f"{label:>24}  {enqueued * 1000:>8.1f} ms writing  {writes / elapsed:>9.0f} writes/s committed  "
+            f"{stats['batches']} batches"
+        )
+
+    db._pool.close_all()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
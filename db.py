@@ -1,182 +1,235 @@
 import os
+import json
+import base64
+import queue
 import sqlite3
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from storage_codec import encode_content, register_functions
+from search_index import register_functions as register_search_functions
+from asset_store import attach_assets, collect_assets
+from user_cache import invalidate_user
 
 # Database file path
 DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'docgenius.db')
 
-def get_db_connection():
-    """Create a connection to the SQLite database"""
-    conn = sqlite3.connect(DB_FILE)
+# Connection pool settings (override with environment variables)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper()
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+
+if DB_SYNCHRONOUS not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+    raise ValueError(f"Invalid DB_SYNCHRONOUS level '{DB_SYNCHRONOUS}'")
+
+# Document history page sizes
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+MAX_HISTORY_PAGE_SIZE = 100
+
+# History and search only cover documents created in the last 30 days
+HISTORY_WINDOW = "-30 days"
+
+def _connect():
+    """Open and configure a new SQLite connection"""
+    conn = sqlite3.connect(
+        DB_FILE,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False  # Pooled connections move between threads
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    register_functions(conn)
+    register_search_functions(conn)
     return conn
 
-def upgrade_db():
-    """Upgrade database schema with new columns"""
+class ConnectionPool:
+    """Pool of configured SQLite connections, each used by one task at a time"""
+    
+    def __init__(self, size=DB_POOL_SIZE):
+        # LIFO keeps the most recently used (warmest) connection in front
+        self._idle = queue.LifoQueue(maxsize=size)
+    
+    def checkout(self):
+        """Take an idle connection, opening a new one if none are available"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return _connect()
+    
+    def checkin(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Closed or broken connection, don't reuse it
+            return
+        
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool = ConnectionPool()
+
+class PooledConnection:
+    """Connection borrowed from the pool; close() returns it instead of closing it"""
+    
+    __slots__ = ('_conn',)
+    
+    def __init__(self, conn):
+        object.__setattr__(self, '_conn', conn)
+    
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, '_conn')
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, name)
+    
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+    
+    def close(self):
+        conn = object.__getattribute__(self, '_conn')
+        if conn is not None:
+            object.__setattr__(self, '_conn', None)
+            _pool.checkin(conn)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+def get_db_connection():
+    """Borrow a connection from the pool (call close() to return it)"""
+    return PooledConnection(_pool.checkout())
+
+@contextmanager
+def db_connection():
+    """Context manager that borrows a pooled connection for the duration of a block"""
+    conn = _pool.checkout()
+    try:
+        yield conn
+    finally:
+        _pool.checkin(conn)
+
+def get_document_templates():
+    """Get all active document templates"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, doc_type, name, parameters FROM templates WHERE is_active = 1"
+    )
+    templates = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return templates
+
+def prepare_document(doc_type, content):
+    """
+    Encode a document's content and collect its assets ahead of saving it
+    
+    Holds no transaction, so it can run alongside other work (e.g. the RAI
+    analysis); pass the result to save_document as prepared.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        # Start transaction
-        cursor.execute("BEGIN")
-        
-        # Check existing columns in users table
-        cursor.execute("PRAGMA table_info(users)")
-        columns = {column[1] for column in cursor.fetchall()}
-        
-        # Add name column if it doesn't exist
-        if 'name' not in columns:
-            cursor.execute("""
-                ALTER TABLE users 
-                ADD COLUMN name TEXT DEFAULT 'User'
-            """)
-        
-        # Add password_hash column if it doesn't exist
-        if 'password_hash' not in columns:
-            cursor.execute("""
-                ALTER TABLE users 
-                ADD COLUMN password_hash TEXT
-            """)
-        
-        # Add ai_credits column if it doesn't exist
-        if 'ai_credits' not in columns:
-            cursor.execute("""
-                ALTER TABLE users 
-                ADD COLUMN ai_credits INTEGER DEFAULT 50
-            """)
-            
-            cursor.execute("""
-                ALTER TABLE users 
-                ADD COLUMN total_credits_used INTEGER DEFAULT 0
-            """)
-            
-            # Update existing users to have default credits
-            cursor.execute("""
-                UPDATE users 
-                SET ai_credits = 50,
-                    total_credits_used = 0 
-                WHERE ai_credits IS NULL
-            """)
-            
-        # Add onboarding fields if they don't exist
-        for field in ['onboarding_completed', 'industry', 'business_type', 'company_description',
-                      'company_name', 'team_size', 'doc_types', 'company_logo',
-                      'business_address', 'business_phone', 'business_email',
-                      'theme_preference', 'default_doc_type', 'notification_preferences']:
-            if field not in columns:
-                cursor.execute(f"""
-                    ALTER TABLE users 
-                    ADD COLUMN {field} TEXT
-                """)
-                
-        # Add updated_at column if it doesn't exist
-        if 'updated_at' not in columns:
-            cursor.execute("""
-                ALTER TABLE users 
-                ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            """)
-        
-        # Create credit_transactions table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS credit_transactions (
-                id TEXT PRIMARY KEY,
-                user_id TEXT REFERENCES users(id),
-                amount INTEGER NOT NULL,
-                transaction_type TEXT NOT NULL,
-                document_id TEXT REFERENCES documents(id),
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Check if credits_used column exists in documents table
-        cursor.execute("PRAGMA table_info(documents)")
-        columns = {column[1] for column in cursor.fetchall()}
-        
-        if 'credits_used' not in columns:
-            cursor.execute("""
-                ALTER TABLE documents 
-                ADD COLUMN credits_used INTEGER DEFAULT 0
-            """)
-        
-        cursor.execute("COMMIT")
+        return encode_content(cursor, doc_type, content), collect_assets(content)
+    finally:
+        cursor.close()
+        conn.close()
+
+def save_document(user_id, doc_type, title, content, parameters, rai_score, rai_flags, prepared=None):
+    """Save a document to the database (prepared is prepare_document's result, if already run)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    doc_id = str(uuid.uuid4())
+    
+    try:
+        if prepared is None:
+            prepared = encode_content(cursor, doc_type, content), None
+        stored, assets = prepared
+        cursor.execute(
+            """
+            INSERT INTO documents 
+            (id, user_id, doc_type, title, content, content_blob, content_codec, content_size,
+             parameters, rai_score, rai_flags)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING id
+            """,
+            (doc_id, user_id, doc_type, title, *stored, parameters, rai_score, rai_flags)
+        )
         
-    except Exception as e:
-        cursor.execute("ROLLBACK")
-        raise e
+        doc_id = cursor.fetchone()[0]
+        # Raises AssetNotFound rather than saving a reference that can't resolve
+        attach_assets(cursor, doc_id, content, assets)
+        conn.commit()
+        invalidate_user(user_id)
+        return doc_id
+    except Exception:
+        conn.rollback()
+        raise
     finally:
         cursor.close()
         conn.close()
 
-def init_db():
-    """Initialize database with required tables"""
+def save_documents(documents):
+    """
+    Save several documents in a single transaction
+    
+    Each item is a dict with the same keys as save_document's arguments.
+    Returns the new document IDs in the same order.
+    """
+    doc_ids = [str(uuid.uuid4()) for _ in documents]
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        # Start transaction
         cursor.execute("BEGIN")
-        
-        # Create users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                password_hash TEXT NOT NULL,
-                subscription TEXT DEFAULT 'free',
-                ai_credits INTEGER DEFAULT 50,
-                total_credits_used INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                onboarding_completed BOOLEAN DEFAULT FALSE,
-                industry TEXT,
-                business_type TEXT,
-                company_description TEXT,
-                company_name TEXT,
-                team_size TEXT,
-                doc_types TEXT,
-                company_logo TEXT,
-                business_address TEXT,
-                business_phone TEXT,
-                business_email TEXT,
-                theme_preference TEXT DEFAULT 'System',
-                default_doc_type TEXT DEFAULT 'nda',
-                notification_preferences TEXT
-            )
-        """)
-        
-        # Create industry_profiles table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS industry_profiles (
-                user_id TEXT PRIMARY KEY REFERENCES users(id),
-                industry TEXT NOT NULL,
-                company_size TEXT,
-                business_type TEXT,
-                target_market TEXT,
-                company_description TEXT,
-                document_preferences TEXT,
-                brand_colors TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create documents table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS documents (
-                id TEXT PRIMARY KEY,
-                user_id TEXT REFERENCES users(id),
-                title TEXT NOT NULL,
-                content TEXT NOT NULL,
-                doc_type TEXT NOT NULL,
-                credits_used INTEGER DEFAULT 0,
-                status TEXT DEFAULT 'completed',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
+        rows = [
+            (doc_id, doc['user_id'], doc['doc_type'], doc['title'],
+             *encode_content(cursor, doc['doc_type'], doc['content']),
+             doc['parameters'], doc['rai_score'], doc['rai_flags'])
+            for doc_id, doc in zip(doc_ids, documents)
+        ]
+        cursor.executemany(
+            """
+            INSERT INTO documents 
+            (id, user_id, doc_type, title, content, content_blob, content_codec, content_size,
+             parameters, rai_score, rai_flags)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+        for doc_id, doc in zip(doc_ids, documents):
+            attach_assets(cursor, doc_id, doc['content'])
         cursor.execute("COMMIT")
+        for user_id in {doc['user_id'] for doc in documents}:
+            invalidate_user(user_id)
+        return doc_ids
         
     except Exception as e:
         cursor.execute("ROLLBACK")
@@ -185,61 +238,105 @@ def init_db():
         cursor.close()
         conn.close()
 
-def get_document_templates():
-    """Get all active document templates"""
+def delete_document(doc_id, user_id):
+    """Delete a document of a specific user"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, doc_type, name, parameters FROM templates WHERE is_active = 1"
-    )
-    templates = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return templates
+    
+    try:
+        cursor.execute(
+            "DELETE FROM documents WHERE id = ? AND user_id = ?",
+            (doc_id, user_id)
+        )
+        conn.commit()
+        invalidate_user(user_id)
+        return cursor.rowcount > 0
+    finally:
+        cursor.close()
+        conn.close()
 
-def save_document(user_id, doc_type, title, content, parameters, rai_score, rai_flags):
-    """Save a document to the database"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    doc_id = str(uuid.uuid4())
+def save_feedback(doc_id, user_id, rating, comments=None):
+    """Queue a user's rating of a document; written in the background (see write_behind.py)"""
+    if not 1 <= rating <= 5:
+        raise ValueError("Rating must be between 1 and 5")
     
-    cursor.execute(
+    # Imported here because write_behind uses this module's connections
+    from write_behind import enqueue
+    
+    enqueue(
         """
-        INSERT INTO documents 
-        (id, user_id, doc_type, title, content, parameters, rai_score, rai_flags)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        RETURNING id
+        INSERT OR IGNORE INTO document_feedback (id, document_id, user_id, rating, comments, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
         """,
-        (doc_id, user_id, doc_type, title, content, parameters, rai_score, rai_flags)
+        (str(uuid.uuid4()), doc_id, user_id, rating, comments or None,
+         datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'))
     )
-    
-    doc_id = cursor.fetchone()[0]
-    conn.commit()
-    cursor.close()
-    conn.close()
-    return doc_id
 
-def get_user_documents(user_id, limit=30):
-    """Get user's documents with retention period limit"""
+def encode_page_cursor(created_at, doc_id):
+    """Encode the sort key of the last document on a page as an opaque cursor"""
+    key = json.dumps([str(created_at), doc_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_cursor(cursor):
+    """Decode a cursor from encode_page_cursor into (created_at, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Invalid page cursor")
+    if not isinstance(created_at, str) or not isinstance(doc_id, str):
+        raise ValueError("Invalid page cursor")
+    return created_at, doc_id
+
+def get_user_documents(user_id, limit=HISTORY_PAGE_SIZE, cursor=None, doc_type=None):
+    """
+    Get a page of a user's documents from the retention period, newest first
+
+    Pages are keyed on (created_at, id): pass the next_cursor of one page to
+    get the next, so each page costs the same however many documents a user
+    has. Returns (documents, next_cursor); next_cursor is None on the last page.
+    """
+    if not 1 <= limit <= MAX_HISTORY_PAGE_SIZE:
+        raise ValueError(f"Page size must be between 1 and {MAX_HISTORY_PAGE_SIZE}")
+
+    # Limiting to documents created in the history window
+    conditions = ["user_id = ?", "created_at >= DATE('now', ?)"]
+    params = [user_id, HISTORY_WINDOW]
+    if doc_type:
+        conditions.append("doc_type = ?")
+        params.append(doc_type)
+    if cursor:
+        # Rows after the cursor in (created_at DESC, id) order
+        created_at, doc_id = decode_page_cursor(cursor)
+        conditions.append("created_at <= ? AND (created_at < ? OR id > ?)")
+        params.extend((created_at, created_at, doc_id))
+
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Limiting to documents created in the last 30 days
-    retention_days = 30
-    cursor.execute(
-        """
-        SELECT id, doc_type, title, created_at, rai_score
-        FROM documents
-        WHERE user_id = ? AND created_at >= DATE('now', '-30 days')
-        ORDER BY created_at DESC
-        """,
-        (user_id,)
-    )
+    db_cursor = conn.cursor()
     
-    documents = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return documents
+    try:
+        # One extra row tells whether there is a next page
+        db_cursor.execute(
+            f"""
+            SELECT id, doc_type, title, created_at, rai_score
+            FROM documents
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, id
+            LIMIT ?
+            """,
+            (*params, limit + 1)
+        )
+        documents = db_cursor.fetchall()
+    finally:
+        db_cursor.close()
+        conn.close()
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        next_cursor = encode_page_cursor(last['created_at'], last['id'])
+    return documents, next_cursor
 
 def get_document_by_id(doc_id, user_id):
     """Get a document by ID for a specific user"""
@@ -248,7 +345,9 @@ def get_document_by_id(doc_id, user_id):
     
     cursor.execute(
         """
-        SELECT id, doc_type, title, content, parameters, rai_score, rai_flags, created_at
+        SELECT id, doc_type, title,
+               document_content(content, content_blob, content_codec) AS content,
+               parameters, rai_score, rai_flags, created_at
         FROM documents
         WHERE id = ? AND user_id = ?
         """,
@@ -1,71 +1,58 @@
 import os
+import re
 import json
 import datetime
+import io
 import tempfile
-from weasyprint import HTML
 from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-import templates
+from templates.registry import get_document_type
 from db import get_db_connection
+from pdf_renderer import render_pdf
+from artifact_cache import get_artifact_cache, make_cache_key, code_version
+from user_cache import cached_user_read
+from asset_store import ASSET_REF_PATTERN, resolve_assets, assets_available, get_asset, register_file
 
-def validate_parameters(doc_type, parameters):
-    """Validate and preprocess parameters before document generation"""
-    template_params = get_document_parameters(doc_type)
-    validated_params = {}
-    
-    # Collect all required fields
-    required_fields = []
-    for section in template_params:
-        for field in section['fields']:
-            if field.get('required', False):
-                required_fields.append(field['id'])
-    
-    # Check required fields
-    missing_fields = [field for field in required_fields if not parameters.get(field)]
-    if missing_fields:
-        raise ValueError(f"Missing required fields: {', '.join(missing_fields)}")
-    
-    # Process and sanitize parameters
-    for section in template_params:
-        for field in section['fields']:
-            field_id = field['id']
-            if field_id in parameters:
-                value = parameters[field_id]
-                
-                # Type validation and conversion
-                if field.get('type') == 'number':
-                    try:
-                        value = float(value)
-                    except (ValueError, TypeError):
-                        raise ValueError(f"Field '{field_id}' must be a number")
-                elif field.get('type') == 'date':
-                    if not isinstance(value, (datetime.date, str)):
-                        raise ValueError(f"Field '{field_id}' must be a valid date")
-                
-                # Options validation
-                if field.get('options') and value not in field['options']:
-                    raise ValueError(f"Invalid value for field '{field_id}'. Must be one of: {', '.join(field['options'])}")
-                
-                validated_params[field_id] = value
-    
-    return validated_params
+# Chunk size used when streaming exported files
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Formats that can be produced by render_artifact
+ARTIFACT_FORMATS = ('html', 'pdf', 'docx')
+
+# Parameters holding the path of an asset file (e.g. the company logo); cache
+# keys use the file's content hash instead of its path
+ASSET_PARAMETERS = ('company_logo',)
+
+# Image tags whose source is an asset reference
+ASSET_IMAGE_PATTERN = re.compile(r'<img[^>]*src="asset://([0-9a-f]{64})"[^>]*>')
+
+# Width of embedded images in DOCX exports
+DOCX_IMAGE_WIDTH = Inches(2)
+
+def validate_parameters(doc_type, parameters, unknown_fields=None):
+    """
+    Validate and preprocess parameters before document generation
+    
+    unknown_fields controls fields that aren't in the template schema:
+    'ignore' drops them, 'error' rejects them and 'keep' passes them through.
+    Defaults to PARAMETER_UNKNOWN_FIELDS.
+    """
+    return get_document_schema(doc_type).validate(parameters, unknown_fields)
+
+def get_document_schema(doc_type):
+    """Get the precomputed parameter schema index for the document type"""
+    return get_document_type(doc_type).schema
 
 def get_template_by_type(doc_type):
     """Get the appropriate template for the document type"""
-    template_mapping = {
-        "nda": templates.nda_template.generate,
-        "invoice": templates.invoice_template.generate,
-        "letter_of_intent": templates.letter_of_intent_template.generate,
-        "proposal": templates.proposal_template.generate,
-        "scope_of_work": templates.scope_of_work_template.generate
-    }
-    
-    if doc_type not in template_mapping:
-        raise ValueError(f"Document type '{doc_type}' is not supported")
-    
-    return template_mapping[doc_type]
+    return get_document_type(doc_type).generate
+
+def get_stream_template_by_type(doc_type):
+    """Get the streaming generator for the document type, or None if it has none"""
+    return get_document_type(doc_type).generate_stream
 
+@cached_user_read
 def get_industry_profile(user_id):
     """Get the user's industry profile"""
     conn = get_db_connection()
@@ -150,6 +137,10 @@ def apply_industry_customizations(content, profile, doc_type):
                 content += f"\n\nKey {profile['industry']} Focus: {point.capitalize()}"
     
     # Apply brand colors
+    return apply_brand_colors(content, profile)
+
+def apply_brand_colors(content, profile):
+    """Replace the default template colors with the profile's brand colors"""
     if 'brand_colors' in profile:
         content = content.replace(
             '#2E86C1',  # Default primary color in templates
@@ -163,43 +154,113 @@ def apply_industry_customizations(content, profile, doc_type):
 
 def generate_document_content(doc_type, parameters, user_id=None):
     """Generate document content with industry customization"""
+    return render_artifact(doc_type, parameters, 'html', user_id=user_id)
+
+def stream_document_content(doc_type, parameters, user_id=None):
+    """
+    Generate document content as a stream of HTML chunks
+    
+    Templates with a streaming generator are rendered incrementally. Industry
+    terms and focus points need the whole document, so when they apply (or the
+    template can't stream) the content is rendered in full and yielded once.
+    """
+    validated_params = validate_parameters(doc_type, parameters)
+    stream_generator = get_stream_template_by_type(doc_type)
+    profile = get_industry_profile(user_id) if user_id else None
+    
+    industry_content = get_industry_specific_content(doc_type, profile['industry']) if profile else {}
+    if stream_generator is None or 'terms' in industry_content or 'focus_points' in industry_content:
+        yield resolve_assets(render_artifact(doc_type, parameters, 'html', user_id=user_id))
+        return
+    
+    # Asset references are never split across template chunks
+    for chunk in stream_generator(validated_params):
+        yield resolve_assets(apply_brand_colors(chunk, profile) if profile else chunk)
+
+def render_artifact(doc_type, parameters, fmt, user_id=None, title=None):
+    """
+    Render a document as HTML (str), PDF or DOCX (bytes), using the artifact cache
+    
+    Rendering is deterministic given the validated parameters (with asset
+    files by content), the industry profile and the rendering code, so these
+    (plus the format) form the cache key.
+    """
+    if fmt not in ARTIFACT_FORMATS:
+        raise ValueError(f"Format '{fmt}' is not supported")
+    
     # Validate and preprocess parameters
     validated_params = validate_parameters(doc_type, parameters)
     
     # Get template generator
     template_generator = get_template_by_type(doc_type)
     
-    # Generate content with validated parameters
-    content = template_generator(validated_params)
+    # Industry profile is only applied if user_id is provided
+    profile = get_industry_profile(user_id) if user_id else None
+    
+    # DOCX exports embed the title and the current date
+    extra = None
+    if fmt != 'html':
+        extra = {'title': title}
+        if fmt == 'docx':
+            extra['date'] = datetime.date.today().isoformat()
     
-    # Apply industry customizations if user_id is provided
-    if user_id:
-        profile = get_industry_profile(user_id)
+    key_params = dict(validated_params)
+    for name in ASSET_PARAMETERS:
+        if key_params.get(name):
+            key_params[name] = register_file(key_params[name])
+    
+    # Template, engine, customization and export code all shape the output
+    version = code_version(template_generator, apply_industry_customizations)
+    
+    cache = get_artifact_cache()
+    key = make_cache_key(doc_type, version, key_params, profile, fmt, extra)
+    cached = cache.get(key)
+    if cached is not None:
+        if fmt != 'html':
+            return cached
+        # HTML cached by another process may reference assets that were never saved
+        content = cached.decode('utf-8')
+        if assets_available(content):
+            return content
+    
+    if fmt == 'html':
+        # Generate content with validated parameters
+        content = template_generator(validated_params)
+        
+        # Apply industry customizations
         if profile:
             content = apply_industry_customizations(content, profile, doc_type)
+        
+        cache.put(key, content.encode('utf-8'))
+        return content
     
-    return content
+    content = render_artifact(doc_type, parameters, 'html', user_id=user_id)
+    if fmt == 'pdf':
+        data = generate_pdf_bytes(content, title)
+    else:
+        data = generate_docx_bytes(content, title or doc_type, doc_type)
+    
+    cache.put(key, data)
+    return data
+
+def generate_pdf_bytes(content, title=None):
+    """Generate a PDF from HTML content and return it as bytes"""
+    # Render in memory on the warm worker pool
+    return render_pdf(resolve_assets(content))
 
 def generate_pdf(content, title):
     """Generate a PDF file from HTML content"""
-    # Create a temporary HTML file
-    with tempfile.NamedTemporaryFile(suffix='.html', delete=False) as tmp_html:
-        tmp_html.write(content.encode('utf-8'))
-        tmp_html_path = tmp_html.name
-    
-    # Create a temporary PDF file
-    pdf_path = tmp_html_path.replace('.html', '.pdf')
+    pdf_bytes = generate_pdf_bytes(content, title)
     
-    # Generate PDF
-    HTML(tmp_html_path).write_pdf(pdf_path)
-    
-    # Clean up the HTML file
-    os.unlink(tmp_html_path)
+    # Write the PDF to a temporary file
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_pdf:
+        tmp_pdf.write(pdf_bytes)
+        pdf_path = tmp_pdf.name
     
     return pdf_path
 
-def generate_docx(content, title, doc_type):
-    """Generate a DOCX file from content"""
+def build_docx(content, title):
+    """Build a DOCX document object from content"""
     # Create a new Document
     doc = Document()
     
@@ -215,6 +276,13 @@ def generate_docx(content, title, doc_type):
     date_run = date_paragraph.add_run(datetime.datetime.now().strftime("%B %d, %Y"))
     date_paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
     
+    # Add referenced images (the company logo) as pictures
+    for asset_id in dict.fromkeys(ASSET_REF_PATTERN.findall(content)):
+        asset = get_asset(asset_id)
+        if asset is not None and asset[0] != 'image/svg+xml':
+            doc.add_picture(io.BytesIO(asset[1]), width=DOCX_IMAGE_WIDTH)
+    content = ASSET_IMAGE_PATTERN.sub('', content)
+    
     # Add a line
     doc.add_paragraph("_" * 50)
     
@@ -230,24 +298,37 @@ def generate_docx(content, title, doc_type):
         if para.strip():
             doc.add_paragraph(para.strip())
     
+    return doc
+
+def generate_docx_bytes(content, title, doc_type=None):
+    """Generate a DOCX from content and return it as bytes"""
+    buffer = io.BytesIO()
+    build_docx(content, title).save(buffer)
+    return buffer.getvalue()
+
+def generate_docx(content, title, doc_type=None):
+    """Generate a DOCX file from content"""
     # Save to a temporary file
     with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp_docx:
+        tmp_docx.write(generate_docx_bytes(content, title, doc_type))
         docx_path = tmp_docx.name
     
-    doc.save(docx_path)
     return docx_path
 
+def iter_chunks(data, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a bytes object in fixed-size chunks without copying it whole"""
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+def stream_pdf(content, title=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generate a PDF from HTML content and yield it in chunks"""
+    yield from iter_chunks(generate_pdf_bytes(content, title), chunk_size)
+
+def stream_docx(content, title, doc_type=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generate a DOCX from content and yield it in chunks"""
+    yield from iter_chunks(generate_docx_bytes(content, title, doc_type), chunk_size)
+
 def get_document_parameters(doc_type):
     """Get the parameter definitions for a document type"""
-    if doc_type == "nda":
-        return templates.nda_template.PARAMETERS
-    elif doc_type == "invoice":
-        return templates.invoice_template.PARAMETERS
-    elif doc_type == "letter_of_intent":
-        return templates.letter_of_intent_template.PARAMETERS
-    elif doc_type == "proposal":
-        return templates.proposal_template.PARAMETERS
-    elif doc_type == "scope_of_work":
-        return templates.scope_of_work_template.PARAMETERS
-    else:
-        raise ValueError(f"Document type '{doc_type}' is not supported")
+    return get_document_type(doc_type).parameters
@@ -0,0 +1,408 @@
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from itertools import compress, islice, repeat
+from operator import mul, truediv
+
+# Fixed-point scales: money is integer cents, quantities integer thousandths,
+# unit prices integer hundredths of a cent and rates ten-thousandths of a percent
+MONEY_PLACES = 2
+QUANTITY_PLACES = 3
+UNIT_PRICE_PLACES = 4
+RATE_PLACES = 4
+
+MONEY_SCALE = 10 ** MONEY_PLACES
+QUANTITY_SCALE = 10 ** QUANTITY_PLACES
+UNIT_PRICE_SCALE = 10 ** UNIT_PRICE_PLACES
+RATE_SCALE = 10 ** RATE_PLACES
+
+# Line amounts (quantity * unit price) are kept unrounded, in
+# QUANTITY_SCALE * UNIT_PRICE_SCALE units; _LINE_DIVISOR turns them into cents
+_LINE_DIVISOR = QUANTITY_SCALE * UNIT_PRICE_SCALE // MONEY_SCALE
+# amount * percentage rate is in amount units * 100 * RATE_SCALE
+_RATE_DIVISOR = 100 * RATE_SCALE
+
+# Magnitude below which a float scaled by 10**places rounds to the exact scaled
+# value, for values written with at most `places` decimals
+_FLOAT_EXACT_LIMIT = 10 ** 9
+
+# More decimals than a scale keeps, which the float path can't scale exactly
+_EXTRA_DECIMALS = {
+    places: re.compile(rf"\.[0-9]{{{places + 1}}}")
+    for places in (MONEY_PLACES, QUANTITY_PLACES, UNIT_PRICE_PLACES, RATE_PLACES)
+}
+
+# Cents below this magnitude format exactly through a float
+_FLOAT_MONEY_LIMIT = 10 ** 13
+_MONEY_FORMAT = f"%.{MONEY_PLACES}f"
+
+# Line items parsed per batch by compute_totals
+BATCH_LINES = 1000
+
+# Tax class used by lines that don't name one; taxed at the invoice tax rate
+DEFAULT_TAX_CLASS = ''
+
+def parse_scaled(text, places):
+    """Parse a decimal string into an integer scaled by 10**places, rounding half up"""
+    text = str(text).strip()
+    point = text.find('.')
+    if (point == -1 or len(text) - point - 1 <= places) and 'e' not in text and 'E' not in text:
+        # At most `places` decimals: the scaled float is within rounding of an exact integer
+        try:
+            value = float(text)
+        except ValueError:
+            raise ValueError(f"'{text}' is not a valid number")
+        if -_FLOAT_EXACT_LIMIT < value < _FLOAT_EXACT_LIMIT:
+            return round(value * 10 ** places)
+
+    # More decimals than kept, exponents and very large values go through Decimal
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"'{text}' is not a valid number")
+    if not number.is_finite():
+        raise ValueError(f"'{text}' is not a valid number")
+    if abs(number) >= _FLOAT_EXACT_LIMIT:
+        raise ValueError(f"'{text}' is out of range")
+    return int(number.scaleb(places).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def _float_inexact(text, places):
+    """Whether text may not scale exactly through a float (extra decimals or an exponent)"""
+    return 'e' in text or 'E' in text or _EXTRA_DECIMALS[places].search(text) is not None
+
+def parse_column(texts, places):
+    """
+    Parse a column of decimal strings into integers scaled by 10**places
+
+    The whole column is converted, scaled and rounded through floats in
+    bulk, which is exact for values within _FLOAT_EXACT_LIMIT written with
+    at most `places` decimals. One search of the joined column finds any
+    other value; only those take the exact per-value path. Raises
+    ValueError if any value isn't a number.
+    """
+    scale = 10 ** places
+    try:
+        values = list(map(float.__round__, map(mul, map(float, texts), repeat(float(scale)))))
+    except OverflowError:
+        raise ValueError("Column contains a value that is not a valid number")
+
+    limit = _FLOAT_EXACT_LIMIT * scale
+    if not values or (not _float_inexact('|'.join(texts), places)
+                      and -limit < min(values) and max(values) < limit):
+        return values
+
+    for index, (value, text) in enumerate(zip(values, texts)):
+        if _float_inexact(text, places) or not -limit < value < limit:
+            values[index] = parse_scaled(text, places)
+    return values
+
+def divide_half_up(numerator, denominator):
+    """Integer division rounding half away from zero"""
+    quotient, remainder = divmod(abs(numerator), denominator)
+    if remainder * 2 >= denominator:
+        quotient += 1
+    return -quotient if numerator < 0 else quotient
+
+def format_money(cents):
+    """Format integer cents as a decimal string (e.g. 1234 -> '12.34')"""
+    if -_FLOAT_MONEY_LIMIT < cents < _FLOAT_MONEY_LIMIT:
+        # Exact for this range: the nearest float rounds back to the same cents
+        return _MONEY_FORMAT % (cents / MONEY_SCALE)
+
+    sign = '-' if cents < 0 else ''
+    whole, fraction = divmod(abs(cents), MONEY_SCALE)
+    return f"{sign}{whole}.{fraction:0{MONEY_PLACES}d}"
+
+def format_money_column(column):
+    """Format a column of integer cents as decimal strings"""
+    if column and -_FLOAT_MONEY_LIMIT < min(column) and max(column) < _FLOAT_MONEY_LIMIT:
+        return [_MONEY_FORMAT % (cents / MONEY_SCALE) for cents in column]
+    return list(map(format_money, column))
+
+def format_quantity_column(quantities):
+    """Format integer quantities in thousandths the way floats would print"""
+    return list(map(str, map(truediv, quantities, repeat(QUANTITY_SCALE))))
+
+def format_unit_price_column(unit_prices):
+    """Format integer unit prices rounded half up to cents"""
+    return format_money_column(round_column(unit_prices, UNIT_PRICE_SCALE // MONEY_SCALE))
+
+def format_repeated(column, format_column):
+    """
+    Format a column with a column formatter, once per distinct value if
+    values repeat (as quantities and unit prices on an invoice usually do)
+    """
+    distinct = set(column)
+    if len(distinct) * 2 > len(column):
+        return format_column(column)
+
+    distinct = list(distinct)
+    formatted = dict(zip(distinct, format_column(distinct)))
+    return list(map(formatted.__getitem__, column))
+
+def format_rate(rate):
+    """Format a rate in ten-thousandths of a percent the way a float would print"""
+    return str(rate / RATE_SCALE)
+
+def parse_tax_classes(text):
+    """
+    Parse tax classes in the format: Class | Rate (one per line)
+
+    Returns a dict of class name -> rate in ten-thousandths of a percent.
+    """
+    tax_classes = {}
+    for line in (text or '').split('\n'):
+        if line.strip():
+            parts = [part.strip() for part in line.split('|')]
+            if len(parts) != 2 or not parts[0]:
+                raise ValueError(f"Invalid tax class '{line.strip()}'. Use the format: Class | Rate")
+            tax_classes[parts[0]] = parse_scaled(parts[1].rstrip('%'), RATE_PLACES)
+    return tax_classes
+
+def round_column(column, divisor):
+    """Divide a column of integers by divisor, rounding half away from zero"""
+    if column and min(column) >= 0:
+        # Non-negative values: half up is a shifted floor division
+        half = divisor // 2
+        return [(value + half) // divisor for value in column]
+    return list(map(divide_half_up, column, repeat(divisor)))
+
+def _line_amount(quantity, unit_price, discount_rate, discount):
+    """Unrounded net amount of one line"""
+    amount = quantity * unit_price
+    if discount_rate:
+        amount -= divide_half_up(amount * discount_rate, _RATE_DIVISOR)
+    return amount - discount * _LINE_DIVISOR
+
+class LineItemColumns:
+    """
+    Line items stored column-wise as lists of fixed-point integers
+
+    Net line amounts are kept unrounded (see _LINE_DIVISOR). The columns are
+    plain lists rather than array('q'): amounts can exceed 64 bits, and
+    converting to and from arrays costs more than the passes over them.
+
+    Line format: Description | Quantity | Unit Price [| Tax Class [| Discount]]
+    where Discount is an amount (e.g. 5.00) or a percentage (e.g. 10%).
+    """
+
+    def __init__(self, tax_classes=None):
+        self.tax_classes = tax_classes or {}
+        self.descriptions = []
+        self.class_names = [DEFAULT_TAX_CLASS]
+        self.quantities = []
+        self.unit_prices = []
+        self.discount_rates = []
+        self.discounts = []
+        self.classes = []
+        self.amounts = []
+        self._class_index = {DEFAULT_TAX_CLASS: 0}
+        self._discounted = False
+
+    def __len__(self):
+        return len(self.descriptions)
+
+    def append_line(self, line):
+        """Parse one line item and add it; returns False if the line was skipped"""
+        if not line.strip():
+            return False
+
+        parts = [part.strip() for part in line.split('|')]
+        if not 3 <= len(parts) <= 5:
+            return False
+
+        desc, quantity, unit_price = parts[:3]
+        tax_class = parts[3] if len(parts) > 3 else DEFAULT_TAX_CLASS
+        discount = parts[4] if len(parts) > 4 else ''
+
+        try:
+            quantity = parse_scaled(quantity, QUANTITY_PLACES)
+            unit_price = parse_scaled(unit_price, UNIT_PRICE_PLACES)
+            if discount.endswith('%'):
+                discount_rate = parse_scaled(discount[:-1], RATE_PLACES)
+                discount = 0
+            else:
+                discount_rate = 0
+                discount = parse_scaled(discount, MONEY_PLACES) if discount else 0
+        except ValueError:
+            return False
+
+        class_index = self._class_index.get(tax_class)
+        if class_index is None:
+            if tax_class not in self.tax_classes:
+                raise ValueError(f"Unknown tax class '{tax_class}' for line item '{desc}'")
+            class_index = len(self.class_names)
+            self.class_names.append(tax_class)
+            self._class_index[tax_class] = class_index
+
+        self.descriptions.append(desc)
+        self.quantities.append(quantity)
+        self.unit_prices.append(unit_price)
+        self.discount_rates.append(discount_rate)
+        self.discounts.append(discount)
+        if discount_rate or discount:
+            self._discounted = True
+        self.classes.append(class_index)
+        return True
+
+    def _extend_plain(self, lines):
+        """
+        Add plain Description | Quantity | Unit Price lines column by column
+
+        Returns False without adding anything if any line has other fields or
+        a value that isn't a number.
+        """
+        # Split everything at once and slice the flat list into columns. Each
+        # line after the first starts with a newline (stripped off with the
+        # description), so the columns line up only if every newline lands
+        # in the description column and there are three fields per line.
+        text = '|\n'.join(lines)
+        fields = text.split('|')
+        if len(fields) != 3 * len(lines) or text.count('\n') != len(lines) - 1:
+            return False
+        quantities = fields[1::3]
+        unit_prices = fields[2::3]
+        if '\n' in ''.join(quantities) or '\n' in ''.join(unit_prices):
+            return False
+
+        try:
+            quantities = parse_column(quantities, QUANTITY_PLACES)
+            unit_prices = parse_column(unit_prices, UNIT_PRICE_PLACES)
+        except ValueError:
+            return False
+
+        self.descriptions.extend(map(str.strip, fields[0::3]))
+        self.quantities.extend(quantities)
+        self.unit_prices.extend(unit_prices)
+        zeros = [0] * len(lines)
+        for column in (self.discount_rates, self.discounts, self.classes):
+            column.extend(zeros)
+        return True
+
+    def extend_lines(self, lines):
+        """Parse and add every line item from an iterable of lines"""
+        lines = [line for line in lines if line and not line.isspace()]
+        if self._extend_plain(lines):
+            return self
+
+        append_line = self.append_line
+        for line in lines:
+            append_line(line)
+        return self
+
+    def compute(self):
+        """Compute the unrounded net amount column in one pass over the other columns"""
+        if self.has_discounts():
+            self.amounts = list(map(
+                _line_amount, self.quantities, self.unit_prices, self.discount_rates, self.discounts
+            ))
+        else:
+            self.amounts = list(map(mul, self.quantities, self.unit_prices))
+        return self
+
+    def has_discounts(self):
+        """Whether any line carries a discount"""
+        return self._discounted
+
+    def class_bases(self):
+        """Sum the unrounded net amounts per tax class"""
+        if len(self.class_names) == 1:
+            return {DEFAULT_TAX_CLASS: sum(self.amounts)}
+
+        bases = {}
+        for index, name in enumerate(self.class_names):
+            bases[name] = sum(compress(self.amounts, [c == index for c in self.classes]))
+        return bases
+
+    def discount_labels(self):
+        """Display labels for the discount column ('' for lines without one)"""
+        if not self.has_discounts():
+            return repeat('', len(self))
+
+        return [
+            f"{format_rate(rate)}%" if rate else (f"${format_money(amount)}" if amount else '')
+            for rate, amount in zip(self.discount_rates, self.discounts)
+        ]
+
+    def rows(self):
+        """
+        Get template rows, formatted column by column
+
+        Each row is a (description, quantity, unit_price, amount, tax_class,
+        discount) tuple of display strings, with unit prices and amounts
+        rounded half up to cents.
+        """
+        if len(self.class_names) == 1:
+            tax_classes = repeat(DEFAULT_TAX_CLASS, len(self))
+        else:
+            tax_classes = map(self.class_names.__getitem__, self.classes)
+        return zip(
+            self.descriptions,
+            format_repeated(self.quantities, format_quantity_column),
+            format_repeated(self.unit_prices, format_unit_price_column),
+            format_money_column(round_column(self.amounts, _LINE_DIVISOR)),
+            tax_classes,
+            self.discount_labels()
+        )
+
+class InvoiceTotals:
+    """Running invoice totals accumulated from batches of line item columns"""
+
+    def __init__(self, tax_rate=0, tax_classes=None):
+        self.tax_rate = parse_scaled(tax_rate, RATE_PLACES)
+        self.tax_classes = tax_classes or {}
+        self.bases = {}
+        self.line_count = 0
+
+    def add(self, columns):
+        """Add a computed batch of line items"""
+        for name, base in columns.class_bases().items():
+            self.bases[name] = self.bases.get(name, 0) + base
+        self.line_count += len(columns)
+
+    def result(self, shipping=0):
+        """
+        Compute subtotal, tax per class and total, all in integer cents
+
+        Each figure is rounded half up once, from the unrounded line amounts.
+        Lines aren't rounded before they are summed, so the total can differ
+        by a cent from the sum of the printed figures.
+        """
+        # Sum in tax units (line amount units * _RATE_DIVISOR), rounding each figure once
+        tax_divisor = _LINE_DIVISOR * _RATE_DIVISOR
+        subtotal = sum(self.bases.values())
+        tax_total = 0
+        taxes = []
+        for name, base in self.bases.items():
+            rate = self.tax_classes[name] if name else self.tax_rate
+            tax_total += base * rate
+            taxes.append({
+                'tax_class': name,
+                'rate': rate,
+                'base': divide_half_up(base, _LINE_DIVISOR),
+                'amount': divide_half_up(base * rate, tax_divisor)
+            })
+
+        # The default class always shows, even without lines
+        if not any(tax['tax_class'] == DEFAULT_TAX_CLASS for tax in taxes):
+            taxes.insert(0, {'tax_class': DEFAULT_TAX_CLASS, 'rate': self.tax_rate, 'base': 0, 'amount': 0})
+
+        shipping = parse_scaled(shipping, MONEY_PLACES)
+        return {
+            'subtotal': divide_half_up(subtotal, _LINE_DIVISOR),
+            'taxes': taxes,
+            'tax_total': divide_half_up(tax_total, tax_divisor),
+            'shipping': shipping,
+            'total': divide_half_up(subtotal * _RATE_DIVISOR + tax_total + shipping * tax_divisor, tax_divisor)
+        }
+
+def compute_totals(lines, tax_rate=0, shipping=0, tax_classes=None):
+    """Parse line items and compute invoice totals in integer cents"""
+    tax_classes = tax_classes or {}
+    totals = InvoiceTotals(tax_rate, tax_classes)
+    # Columns a batch at a time stay small enough to be cache friendly
+    lines = iter(lines)
+    while True:
+        batch = list(islice(lines, BATCH_LINES))
+        if not batch:
+            return totals.result(shipping)
+        totals.add(LineItemColumns(tax_classes).extend_lines(batch).compute())
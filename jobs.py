@@ -0,0 +1,110 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Job queue configuration (override with environment variables)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "32"))
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+class QueueFull(RuntimeError):
+    """Raised when the job queue already holds the maximum number of pending jobs"""
+
+class JobQueue:
+    """Bounded background job queue backed by a thread pool"""
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING,
+                 result_ttl=JOB_RESULT_TTL_SECONDS):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, owner=None, **kwargs):
+        """Queue a callable and return its job id; raises QueueFull under backpressure"""
+        with self._lock:
+            self._purge_expired()
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"Job queue is full ({self.max_pending} jobs pending)")
+
+            job_id = str(uuid.uuid4())
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "owner": owner,
+                "status": QUEUED,
+                "result": None,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None
+            }
+            self._pending += 1
+
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        """Execute a job and record its outcome"""
+        self._update(job_id, status=RUNNING, started_at=time.time())
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+        else:
+            self._update(job_id, status=SUCCEEDED, result=result, finished_at=time.time())
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(fields)
+
+    def _purge_expired(self):
+        """Forget finished jobs older than the result TTL (caller holds the lock)"""
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in FINISHED_STATES and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id, owner=None):
+        """Get a snapshot of a job, or None if it doesn't exist or belongs to someone else"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or (owner is not None and job["owner"] != owner):
+                return None
+            return dict(job)
+
+    def stats(self):
+        """Get queue depth and job counts by status"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "jobs": counts
+            }
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and wait for running ones to finish"""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,422 @@
+# Credit ledger: atomic debits, credits and reservations
+#
+# A debit is one conditional statement,
+#
+#   UPDATE users SET ai_credits = ai_credits - ? ... WHERE id = ? AND ai_credits >= ?
+#
+# so the balance check and the deduction can't be interleaved with another
+# request, and a rejected debit writes nothing. Every change runs in a short
+# BEGIN IMMEDIATE transaction together with its credit_transactions row.
+#
+# Idempotency: a transaction can carry a key that is unique per user.
+# Charges for a document use document_key(document_id), so retrying the
+# charge for the same document never deducts twice.
+#
+# Reservations: bulk generation reserves the credits for the whole batch up
+# front (deducting them from the balance), charges each document against the
+# reservation as it is saved, then releases what is left. A reservation left
+# open by a crashed process is released once it expires, the next time its
+# user reserves credits.
+
+import os
+import uuid
+from contextlib import contextmanager
+from db import get_db_connection
+from user_cache import invalidate_user
+
+# Seconds before an open reservation may be released (override with an environment variable)
+RESERVATION_TTL_SECONDS = int(os.getenv("CREDIT_RESERVATION_TTL_SECONDS", "900"))
+
+class LedgerError(RuntimeError):
+    """Raised when a credit operation can't be applied"""
+
+class InsufficientCredits(LedgerError):
+    """Raised when a balance or reservation doesn't cover a charge"""
+
+    def __init__(self, required, available):
+        super().__init__(f"Insufficient credits: {required} required, {available} available")
+        self.required = required
+        self.available = available
+
+def document_key(document_id):
+    """Idempotency key for the charge of a document"""
+    return f"document:{document_id}"
+
+def _check_amount(amount):
+    if not isinstance(amount, int) or amount <= 0:
+        raise ValueError("Credit amount must be a positive integer")
+
+def _record(cursor, user_id, amount, transaction_type, document_id, description, idempotency_key):
+    transaction_id = str(uuid.uuid4())
+    cursor.execute(
+        """
+        INSERT INTO credit_transactions
+        (id, user_id, amount, transaction_type, document_id, description, idempotency_key, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """,
+        (transaction_id, user_id, amount, transaction_type, document_id, description, idempotency_key)
+    )
+    return transaction_id
+
+def _find_transaction(cursor, user_id, idempotency_key):
+    """Get (transaction id, balance) of an earlier transaction with the key, or None"""
+    cursor.execute(
+        """
+        SELECT ct.id, u.ai_credits
+        FROM credit_transactions ct
+        JOIN users u ON u.id = ct.user_id
+        WHERE ct.user_id = ? AND ct.idempotency_key = ?
+        """,
+        (user_id, idempotency_key)
+    )
+    return cursor.fetchone()
+
+def _rejection(cursor, user_id, amount):
+    """Explain why a conditional debit matched no row: None for pro users, otherwise raise"""
+    cursor.execute("SELECT ai_credits, subscription FROM users WHERE id = ?", (user_id,))
+    user = cursor.fetchone()
+    if user is None:
+        raise LedgerError(f"User '{user_id}' does not exist")
+    if user['subscription'] == 'pro':
+        return None
+    raise InsufficientCredits(amount, user['ai_credits'])
+
+def debit(user_id, amount, document_id=None, description=None, idempotency_key=None):
+    """
+    Deduct credits if the balance covers them, in a single conditional update
+
+    Charges for a document are idempotent (keyed by document_key unless a key
+    is given). Returns {'applied', 'balance', 'duplicate', 'transaction_id'};
+    applied is False for pro users, who aren't charged. Raises
+    InsufficientCredits without writing anything if the balance is too low.
+    """
+    _check_amount(amount)
+    if idempotency_key is None and document_id:
+        idempotency_key = document_key(document_id)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if idempotency_key:
+                existing = _find_transaction(cursor, user_id, idempotency_key)
+                if existing is not None:
+                    cursor.execute("ROLLBACK")
+                    return {'applied': True, 'balance': existing[1], 'duplicate': True, 'transaction_id': existing[0]}
+
+            cursor.execute(
+                """
+                UPDATE users
+                SET ai_credits = ai_credits - ?,
+                    total_credits_used = total_credits_used + ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND COALESCE(subscription, 'free') != 'pro' AND ai_credits >= ?
+                RETURNING ai_credits
+                """,
+                (amount, amount, user_id, amount)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("ROLLBACK")
+                _rejection(cursor, user_id, amount)
+                return {'applied': False, 'balance': None, 'duplicate': False, 'transaction_id': None}
+
+            transaction_id = _record(cursor, user_id, -amount, 'deduction', document_id, description, idempotency_key)
+            if document_id:
+                cursor.execute("UPDATE documents SET credits_used = ? WHERE id = ?", (amount, document_id))
+            cursor.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+
+        invalidate_user(user_id)
+        return {'applied': True, 'balance': row[0], 'duplicate': False, 'transaction_id': transaction_id}
+    finally:
+        cursor.close()
+        conn.close()
+
+def credit(user_id, amount, description, transaction_type='purchase', idempotency_key=None):
+    """
+    Add credits to a balance and record the transaction
+
+    Returns {'applied', 'balance', 'duplicate', 'transaction_id'}; applied is
+    False if the user doesn't exist or is on the pro plan.
+    """
+    _check_amount(amount)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if idempotency_key:
+                existing = _find_transaction(cursor, user_id, idempotency_key)
+                if existing is not None:
+                    cursor.execute("ROLLBACK")
+                    return {'applied': True, 'balance': existing[1], 'duplicate': True, 'transaction_id': existing[0]}
+
+            cursor.execute(
+                """
+                UPDATE users
+                SET ai_credits = ai_credits + ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND COALESCE(subscription, 'free') != 'pro'
+                RETURNING ai_credits
+                """,
+                (amount, user_id)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("ROLLBACK")
+                return {'applied': False, 'balance': None, 'duplicate': False, 'transaction_id': None}
+
+            transaction_id = _record(cursor, user_id, amount, transaction_type, None, description, idempotency_key)
+            cursor.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+
+        invalidate_user(user_id)
+        return {'applied': True, 'balance': row[0], 'duplicate': False, 'transaction_id': transaction_id}
+    finally:
+        cursor.close()
+        conn.close()
+
+def _release_expired(cursor, user_id):
+    """Return the credits of a user's expired open reservations; returns the credits returned"""
+    cursor.execute(
+        """
+        SELECT COALESCE(SUM(remaining), 0) FROM credit_reservations
+        WHERE user_id = ? AND status = 'open' AND expires_at < CURRENT_TIMESTAMP
+        """,
+        (user_id,)
+    )
+    expired = cursor.fetchone()[0]
+    if not expired:
+        return 0
+
+    cursor.execute("UPDATE users SET ai_credits = ai_credits + ? WHERE id = ?", (expired, user_id))
+    cursor.execute(
+        """
+        UPDATE credit_reservations
+        SET status = 'expired', remaining = 0, closed_at = CURRENT_TIMESTAMP
+        WHERE user_id = ? AND status = 'open' AND expires_at < CURRENT_TIMESTAMP
+        """,
+        (user_id,)
+    )
+    return expired
+
+def reserve(user_id, amount, description=None, idempotency_key=None, ttl=RESERVATION_TTL_SECONDS):
+    """
+    Hold credits for a batch by deducting them from the balance up front
+
+    Returns {'id', 'amount', 'remaining', 'balance'}, or None for pro users
+    (nothing to hold). A repeated idempotency_key returns the existing
+    reservation. Raises InsufficientCredits if the balance is too low.
+    """
+    _check_amount(amount)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            released = _release_expired(cursor, user_id)
+
+            if idempotency_key:
+                cursor.execute(
+                    """
+                    SELECT r.id, r.amount, r.remaining, u.ai_credits
+                    FROM credit_reservations r
+                    JOIN users u ON u.id = r.user_id
+                    WHERE r.user_id = ? AND r.idempotency_key = ?
+                    """,
+                    (user_id, idempotency_key)
+                )
+                existing = cursor.fetchone()
+                if existing is not None:
+                    cursor.execute("COMMIT" if released else "ROLLBACK")
+                    return dict(zip(('id', 'amount', 'remaining', 'balance'), existing))
+
+            cursor.execute(
+                """
+                UPDATE users
+                SET ai_credits = ai_credits - ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND COALESCE(subscription, 'free') != 'pro' AND ai_credits >= ?
+                RETURNING ai_credits
+                """,
+                (amount, user_id, amount)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("COMMIT" if released else "ROLLBACK")
+                _rejection(cursor, user_id, amount)
+                return None
+
+            reservation_id = str(uuid.uuid4())
+            cursor.execute(
+                """
+                INSERT INTO credit_reservations
+                (id, user_id, amount, remaining, description, idempotency_key, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, DATETIME('now', ?))
+                """,
+                (reservation_id, user_id, amount, amount, description, idempotency_key, f"{int(ttl):+d} seconds")
+            )
+            cursor.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+
+        invalidate_user(user_id)
+        return {'id': reservation_id, 'amount': amount, 'remaining': amount, 'balance': row[0]}
+    finally:
+        cursor.close()
+        conn.close()
+
+def charge_reservation(reservation_id, charges):
+    """
+    Charge documents against an open reservation in one transaction
+
+    charges is a list of (document_id, amount, description). Documents that
+    were already charged are skipped. Returns {'charged', 'duplicates',
+    'remaining'}; raises InsufficientCredits if the reservation doesn't cover
+    the new charges, and LedgerError if it isn't open.
+    """
+    for _, amount, _ in charges:
+        _check_amount(amount)
+    if not charges:
+        return {'charged': 0, 'duplicates': 0, 'remaining': None}
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute(
+                "SELECT user_id, remaining, status FROM credit_reservations WHERE id = ?",
+                (reservation_id,)
+            )
+            reservation = cursor.fetchone()
+            if reservation is None or reservation['status'] != 'open':
+                raise LedgerError(f"Reservation '{reservation_id}' is not open")
+            user_id = reservation['user_id']
+
+            keys = [document_key(document_id) for document_id, _, _ in charges]
+            cursor.execute(
+                f"""
+                SELECT idempotency_key FROM credit_transactions
+                WHERE user_id = ? AND idempotency_key IN ({', '.join('?' * len(keys))})
+                """,
+                (user_id, *keys)
+            )
+            charged = {row[0] for row in cursor.fetchall()}
+            new_charges = []
+            for (document_id, amount, description), key in zip(charges, keys):
+                if key not in charged:
+                    charged.add(key)
+                    new_charges.append((document_id, amount, description, key))
+
+            total = sum(amount for _, amount, _, _ in new_charges)
+            if total:
+                cursor.execute(
+                    """
+                    UPDATE credit_reservations
+                    SET remaining = remaining - ?
+                    WHERE id = ? AND status = 'open' AND remaining >= ?
+                    RETURNING remaining
+                    """,
+                    (total, reservation_id, total)
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    raise InsufficientCredits(total, reservation['remaining'])
+                remaining = row[0]
+
+                for document_id, amount, description, key in new_charges:
+                    _record(cursor, user_id, -amount, 'deduction', document_id, description, key)
+                cursor.executemany(
+                    "UPDATE documents SET credits_used = ? WHERE id = ?",
+                    [(amount, document_id) for document_id, amount, _, _ in new_charges]
+                )
+                cursor.execute(
+                    "UPDATE users SET total_credits_used = total_credits_used + ? WHERE id = ?",
+                    (total, user_id)
+                )
+            else:
+                remaining = reservation['remaining']
+            cursor.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+
+        invalidate_user(user_id)
+        return {'charged': len(new_charges), 'duplicates': len(charges) - len(new_charges), 'remaining': remaining}
+    finally:
+        cursor.close()
+        conn.close()
+
+def release_reservation(reservation_id):
+    """Close a reservation and return its unused credits to the balance; returns the credits returned"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute(
+                "SELECT user_id, remaining FROM credit_reservations WHERE id = ? AND status = 'open'",
+                (reservation_id,)
+            )
+            reservation = cursor.fetchone()
+            if reservation is None:
+                cursor.execute("ROLLBACK")
+                return 0
+
+            user_id, remaining = reservation
+            if remaining:
+                cursor.execute(
+                    "UPDATE users SET ai_credits = ai_credits + ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (remaining, user_id)
+                )
+            cursor.execute(
+                """
+                UPDATE credit_reservations
+                SET status = 'closed', remaining = 0, closed_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """,
+                (reservation_id,)
+            )
+            cursor.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+
+        invalidate_user(user_id)
+        return remaining
+    finally:
+        cursor.close()
+        conn.close()
+
+@contextmanager
+def reserved_credits(user_id, amount, description=None, idempotency_key=None):
+    """
+    Reserve credits for the duration of a block and release what is left after it
+
+    Yields the reservation (None for pro users); charge documents against it
+    with charge_reservation.
+    """
+    reservation = reserve(user_id, amount, description, idempotency_key)
+    try:
+        yield reservation
+    finally:
+        if reservation is not None:
+            release_reservation(reservation['id'])
@@ -0,0 +1,677 @@
+# Numbered schema migrations
+#
+# The schema version is stored in PRAGMA user_version. On startup migrate()
+# compares it with LATEST_VERSION and, only if the database is behind, applies
+# the pending migrations in order inside a single transaction.
+#
+# To change the schema, append a new (version, description, function) entry
+# to MIGRATIONS; never edit a migration that has already shipped.
+#
+# Usage:
+#   python migrations.py            # apply pending migrations
+#   python migrations.py --dry-run  # apply and roll back, reporting timings
+#   python migrations.py --status   # show the current and latest versions
+
+import sys
+import time
+import argparse
+from db import get_db_connection
+
+class MigrationError(RuntimeError):
+    """Raised when the database schema can't be migrated"""
+
+def _columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {column[1] for column in cursor.fetchall()}
+
+def _add_missing_columns(cursor, table, columns):
+    """Add each (name, definition) column that the table doesn't have yet"""
+    existing = _columns(cursor, table)
+    for name, definition in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+def _baseline(cursor):
+    """Consolidated schema; brings databases created by any earlier setup script up to date"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            subscription TEXT DEFAULT 'free',
+            ai_credits INTEGER DEFAULT 50,
+            total_credits_used INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            onboarding_completed BOOLEAN DEFAULT FALSE,
+            industry TEXT,
+            business_type TEXT,
+            company_description TEXT,
+            company_name TEXT,
+            team_size TEXT,
+            doc_types TEXT,
+            company_logo TEXT,
+            business_address TEXT,
+            business_phone TEXT,
+            business_email TEXT,
+            theme_preference TEXT DEFAULT 'System',
+            default_doc_type TEXT DEFAULT 'nda',
+            notification_preferences TEXT
+        )
+    """)
+
+    # Older databases are missing some user columns
+    missing_credits = 'ai_credits' not in _columns(cursor, 'users')
+    _add_missing_columns(cursor, 'users', [
+        ('name', "TEXT DEFAULT 'User'"),
+        ('password_hash', 'TEXT'),
+        ('ai_credits', 'INTEGER DEFAULT 50'),
+        ('total_credits_used', 'INTEGER DEFAULT 0'),
+        ('onboarding_completed', 'BOOLEAN DEFAULT FALSE'),
+        ('industry', 'TEXT'),
+        ('business_type', 'TEXT'),
+        ('company_description', 'TEXT'),
+        ('company_name', 'TEXT'),
+        ('team_size', 'TEXT'),
+        ('doc_types', 'TEXT'),
+        ('company_logo', 'TEXT'),
+        ('business_address', 'TEXT'),
+        ('business_phone', 'TEXT'),
+        ('business_email', 'TEXT'),
+        ('theme_preference', 'TEXT'),
+        ('default_doc_type', 'TEXT'),
+        ('notification_preferences', 'TEXT'),
+        ('updated_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+    ])
+    if missing_credits:
+        cursor.execute("""
+            UPDATE users
+            SET ai_credits = 50,
+                total_credits_used = 0
+            WHERE ai_credits IS NULL
+        """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS industry_profiles (
+            user_id TEXT PRIMARY KEY REFERENCES users(id),
+            industry TEXT NOT NULL,
+            company_size TEXT,
+            business_type TEXT,
+            target_market TEXT,
+            company_description TEXT,
+            document_preferences TEXT,
+            brand_colors TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS documents (
+            id TEXT PRIMARY KEY,
+            user_id TEXT REFERENCES users(id),
+            doc_type TEXT NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            parameters TEXT,
+            rai_score REAL,
+            rai_flags TEXT,
+            credits_used INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'completed',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # The old init_database.py script named the doc_type column "type"
+    columns = _columns(cursor, 'documents')
+    if 'type' in columns and 'doc_type' not in columns:
+        cursor.execute("ALTER TABLE documents RENAME COLUMN type TO doc_type")
+
+    _add_missing_columns(cursor, 'documents', [
+        ('parameters', 'TEXT'),
+        ('rai_score', 'REAL'),
+        ('rai_flags', 'TEXT'),
+        ('credits_used', 'INTEGER DEFAULT 0'),
+        ('status', "TEXT DEFAULT 'completed'"),
+        ('updated_at', 'TIMESTAMP')
+    ])
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS credit_transactions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT REFERENCES users(id),
+            amount INTEGER NOT NULL,
+            transaction_type TEXT NOT NULL,
+            document_id TEXT REFERENCES documents(id),
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS templates (
+            id TEXT PRIMARY KEY,
+            doc_type TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            template TEXT NOT NULL,
+            parameters TEXT NOT NULL,
+            version INTEGER DEFAULT 1,
+            is_active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _history_indexes(cursor):
+    """Secondary indexes for the per-user history queries (see query_plan_check.py)"""
+    # Covers the document list/count queries so they never touch the table
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_documents_user_created
+        ON documents (user_id, created_at DESC, id, doc_type, title, credits_used, status, rai_score)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_credit_transactions_user_created
+        ON credit_transactions (user_id, created_at DESC)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_credit_transactions_document
+        ON credit_transactions (document_id)
+    """)
+
+def _user_usage(cursor):
+    """Per-user usage counters kept up to date by triggers on documents"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_usage (
+            user_id TEXT PRIMARY KEY REFERENCES users(id),
+            document_count INTEGER NOT NULL DEFAULT 0,
+            content_bytes INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_monthly_usage (
+            user_id TEXT NOT NULL REFERENCES users(id),
+            month TEXT NOT NULL,
+            document_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month)
+        ) WITHOUT ROWID
+    """)
+
+    # Increment on insert, decrement on delete; an update of the counted
+    # columns is treated as a delete of the old row plus an insert of the new
+    increment = """
+            INSERT INTO user_usage (user_id, document_count, content_bytes)
+            VALUES (NEW.user_id, 1, LENGTH(CAST(NEW.content AS BLOB)))
+            ON CONFLICT (user_id) DO UPDATE SET
+                document_count = document_count + 1,
+                content_bytes = content_bytes + excluded.content_bytes;
+            INSERT INTO user_monthly_usage (user_id, month, document_count)
+            VALUES (NEW.user_id, strftime('%Y-%m', NEW.created_at), 1)
+            ON CONFLICT (user_id, month) DO UPDATE SET
+                document_count = document_count + 1;
+    """
+    decrement = """
+            UPDATE user_usage SET
+                document_count = document_count - 1,
+                content_bytes = content_bytes - LENGTH(CAST(OLD.content AS BLOB))
+            WHERE user_id = OLD.user_id;
+            UPDATE user_monthly_usage SET
+                document_count = document_count - 1
+            WHERE user_id = OLD.user_id AND month = strftime('%Y-%m', OLD.created_at);
+    """
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS documents_usage_insert
+        AFTER INSERT ON documents
+        WHEN NEW.user_id IS NOT NULL
+        BEGIN {increment}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS documents_usage_delete
+        AFTER DELETE ON documents
+        WHEN OLD.user_id IS NOT NULL
+        BEGIN {decrement}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS documents_usage_update_old
+        AFTER UPDATE OF user_id, content, created_at ON documents
+        WHEN OLD.user_id IS NOT NULL
+        BEGIN {decrement}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS documents_usage_update_new
+        AFTER UPDATE OF user_id, content, created_at ON documents
+        WHEN NEW.user_id IS NOT NULL
+        BEGIN {increment}
+        END
+    """)
+
+    # Backfill from existing documents
+    cursor.execute("DELETE FROM user_usage")
+    cursor.execute("DELETE FROM user_monthly_usage")
+    cursor.execute("""
+        INSERT INTO user_usage (user_id, document_count, content_bytes)
+        SELECT user_id, COUNT(*), COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0)
+        FROM documents
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+    """)
+    cursor.execute("""
+        INSERT INTO user_monthly_usage (user_id, month, document_count)
+        SELECT user_id, strftime('%Y-%m', created_at), COUNT(*)
+        FROM documents
+        WHERE user_id IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY user_id, strftime('%Y-%m', created_at)
+    """)
+
+def _compressed_content(cursor):
+    """Compressed document content (see storage_codec.py) counted by its uncompressed size"""
+    _add_missing_columns(cursor, 'documents', [
+        ('content_blob', 'BLOB'),
+        ('content_codec', 'TEXT'),
+        ('content_size', 'INTEGER')
+    ])
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS compression_dicts (
+            id INTEGER PRIMARY KEY,
+            doc_type TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            dictionary BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (doc_type, digest)
+        )
+    """)
+
+    # Same counters as _user_usage, but sized by content_size; rows written
+    # before this migration have no size yet and fall back to the text length
+    increment = """
+            INSERT INTO user_usage (user_id, document_count, content_bytes)
+            VALUES (NEW.user_id, 1, COALESCE(NEW.content_size, LENGTH(CAST(NEW.content AS BLOB))))
+            ON CONFLICT (user_id) DO UPDATE SET
+                document_count = document_count + 1,
+                content_bytes = content_bytes + excluded.content_bytes;
+            INSERT INTO user_monthly_usage (user_id, month, document_count)
+            VALUES (NEW.user_id, strftime('%Y-%m', NEW.created_at), 1)
+            ON CONFLICT (user_id, month) DO UPDATE SET
+                document_count = document_count + 1;
+    """
+    decrement = """
+            UPDATE user_usage SET
+                document_count = document_count - 1,
+                content_bytes = content_bytes - COALESCE(OLD.content_size, LENGTH(CAST(OLD.content AS BLOB)))
+            WHERE user_id = OLD.user_id;
+            UPDATE user_monthly_usage SET
+                document_count = document_count - 1
+            WHERE user_id = OLD.user_id AND month = strftime('%Y-%m', OLD.created_at);
+    """
+    for name in ('insert', 'delete', 'update_old', 'update_new'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS documents_usage_{name}")
+    cursor.execute(f"""
+        CREATE TRIGGER documents_usage_insert
+        AFTER INSERT ON documents
+        WHEN NEW.user_id IS NOT NULL
+        BEGIN {increment}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER documents_usage_delete
+        AFTER DELETE ON documents
+        WHEN OLD.user_id IS NOT NULL
+        BEGIN {decrement}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER documents_usage_update_old
+        AFTER UPDATE OF user_id, content, content_size, created_at ON documents
+        WHEN OLD.user_id IS NOT NULL
+        BEGIN {decrement}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER documents_usage_update_new
+        AFTER UPDATE OF user_id, content, content_size, created_at ON documents
+        WHEN NEW.user_id IS NOT NULL
+        BEGIN {increment}
+        END
+    """)
+
+def _asset_store(cursor):
+    """Content-addressed assets shared between documents (see asset_store.py)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS assets (
+            id TEXT PRIMARY KEY,
+            mime_type TEXT NOT NULL,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS document_assets (
+            document_id TEXT NOT NULL REFERENCES documents(id),
+            asset_id TEXT NOT NULL REFERENCES assets(id),
+            PRIMARY KEY (document_id, asset_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_assets_unreferenced
+        ON assets (refcount) WHERE refcount <= 0
+    """)
+
+    # Reference counts follow the document links, and links go with their document
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS document_assets_insert
+        AFTER INSERT ON document_assets
+        BEGIN
+            UPDATE assets SET refcount = refcount + 1 WHERE id = NEW.asset_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS document_assets_delete
+        AFTER DELETE ON document_assets
+        BEGIN
+            UPDATE assets SET refcount = refcount - 1 WHERE id = OLD.asset_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS documents_assets_delete
+        AFTER DELETE ON documents
+        BEGIN
+            DELETE FROM document_assets WHERE document_id = OLD.id;
+        END
+    """)
+
+def _history_type_index(cursor):
+    """Index for the document history pages filtered by type (see db.get_user_documents)"""
+    # Same order as idx_documents_user_created, so filtered pages are read in
+    # index order and the keyset condition is a range on created_at
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_documents_user_type_created
+        ON documents (user_id, doc_type, created_at DESC, id, title, rai_score)
+    """)
+
+def _search_index(cursor):
+    """Full-text search index kept in sync with documents (see search_index.py)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS search_owners (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL UNIQUE,
+            last_row INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS document_search_rows (
+            rowid INTEGER PRIMARY KEY,
+            document_id TEXT NOT NULL UNIQUE
+        )
+    """)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents_search USING fts5 (
+            title, body, keywords,
+            content = '',
+            tokenize = 'porter unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+
+    # Rows of a user are numbered within the user's block of 2^32 rowids
+    insert = """
+        INSERT OR IGNORE INTO search_owners (user_id) SELECT NEW.user_id WHERE NEW.user_id IS NOT NULL;
+        UPDATE search_owners SET last_row = last_row + 1 WHERE user_id = NEW.user_id;
+        INSERT INTO document_search_rows (rowid, document_id)
+        SELECT id * 4294967296 + last_row, NEW.id FROM search_owners WHERE user_id = NEW.user_id;
+        INSERT INTO documents_search (rowid, title, body, keywords)
+        SELECT rowid, NEW.title,
+               document_text(NEW.content, NEW.content_blob, NEW.content_codec),
+               document_keywords(NEW.parameters)
+        FROM document_search_rows WHERE document_id = NEW.id;
+    """
+    # A contentless table deletes a row given the values that were indexed
+    delete = """
+        INSERT INTO documents_search (documents_search, rowid, title, body, keywords)
+        SELECT 'delete', rowid, OLD.title,
+               document_text(OLD.content, OLD.content_blob, OLD.content_codec),
+               document_keywords(OLD.parameters)
+        FROM document_search_rows WHERE document_id = OLD.id;
+        DELETE FROM document_search_rows WHERE document_id = OLD.id;
+    """
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS documents_search_insert
+        AFTER INSERT ON documents
+        BEGIN {insert}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS documents_search_delete
+        AFTER DELETE ON documents
+        BEGIN {delete}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS documents_search_update
+        AFTER UPDATE OF id, user_id, title, content, content_blob, content_codec, parameters ON documents
+        BEGIN {delete} {insert}
+        END
+    """)
+
+    # Index the existing documents, oldest first
+    cursor.execute("""
+        INSERT OR IGNORE INTO search_owners (user_id)
+        SELECT DISTINCT user_id FROM documents WHERE user_id IS NOT NULL
+    """)
+    cursor.execute("""
+        INSERT INTO document_search_rows (rowid, document_id)
+        SELECT o.id * 4294967296 + ROW_NUMBER() OVER (PARTITION BY d.user_id ORDER BY d.created_at, d.rowid), d.id
+        FROM documents d
+        JOIN search_owners o ON o.user_id = d.user_id
+    """)
+    cursor.execute("""
+        UPDATE search_owners
+        SET last_row = (SELECT COUNT(*) FROM documents WHERE documents.user_id = search_owners.user_id)
+    """)
+    cursor.execute("""
+        INSERT INTO documents_search (rowid, title, body, keywords)
+        SELECT r.rowid, d.title,
+               document_text(d.content, d.content_blob, d.content_codec),
+               document_keywords(d.parameters)
+        FROM document_search_rows r
+        JOIN documents d ON d.id = r.document_id
+    """)
+
+def _credit_ledger(cursor):
+    """Idempotency keys and credit reservations (see ledger.py)"""
+    _add_missing_columns(cursor, 'credit_transactions', [('idempotency_key', 'TEXT')])
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_credit_transactions_idempotency
+        ON credit_transactions (user_id, idempotency_key)
+        WHERE idempotency_key IS NOT NULL
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS credit_reservations (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL REFERENCES users(id),
+            amount INTEGER NOT NULL,
+            remaining INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open',
+            description TEXT,
+            idempotency_key TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            closed_at TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_credit_reservations_idempotency
+        ON credit_reservations (user_id, idempotency_key)
+        WHERE idempotency_key IS NOT NULL
+    """)
+    # Open reservations are few; expired ones are released per user
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_credit_reservations_open
+        ON credit_reservations (user_id, expires_at)
+        WHERE status = 'open'
+    """)
+
+def _document_feedback(cursor):
+    """Ratings of generated documents, written by the write-behind queue (see write_behind.py)"""
+    # No foreign keys: feedback is written after the fact and may arrive
+    # after its document was deleted
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS document_feedback (
+            id TEXT PRIMARY KEY,
+            document_id TEXT,
+            user_id TEXT NOT NULL,
+            rating INTEGER NOT NULL,
+            comments TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_document_feedback_document
+        ON document_feedback (document_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_document_feedback_user
+        ON document_feedback (user_id)
+    """)
+
+# (version, description, function) in the order they are applied
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "per-user history indexes", _history_indexes),
+    (3, "per-user usage counters", _user_usage),
+    (4, "compressed document content", _compressed_content),
+    (5, "shared document assets", _asset_store),
+    (6, "per-user history index by document type", _history_type_index),
+    (7, "full-text document search", _search_index),
+    (8, "credit ledger idempotency and reservations", _credit_ledger),
+    (9, "document feedback", _document_feedback)
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(cursor):
+    """Read the schema version stored in the database header"""
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+def _prepare_new_database(cursor):
+    """Apply settings that can only be chosen before the first table is created"""
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master")
+    if cursor.fetchone()[0]:
+        return
+    # Lets retention.py return freed pages to the filesystem. Switching to
+    # WAL has already written the header, so the mode takes effect through a
+    # VACUUM, which is instant on an empty database. Set once here rather
+    # than per connection: on an incremental database the pragma waits for
+    # the write lock.
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    cursor.execute("VACUUM")
+
+def migrate(dry_run=False):
+    """
+    Apply pending migrations in a single transaction and return a timing report
+
+    With dry_run the migrations run and are then rolled back.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    report = {'from_version': None, 'to_version': None, 'dry_run': dry_run, 'applied': [], 'seconds': 0.0}
+
+    try:
+        # Fast path: one integer comparison when the schema is current
+        version = get_schema_version(cursor)
+        report['from_version'] = report['to_version'] = version
+        if version == LATEST_VERSION:
+            return report
+
+        started = time.perf_counter()
+        if version == 0 and not dry_run:
+            # Part of the baseline schema, but can't run inside its transaction
+            _prepare_new_database(cursor)
+        cursor.execute("BEGIN IMMEDIATE")
+
+        try:
+            # Another process may have migrated while we waited for the lock
+            version = get_schema_version(cursor)
+            report['from_version'] = version
+            if version > LATEST_VERSION:
+                raise MigrationError(
+                    f"Database schema version {version} is newer than this code ({LATEST_VERSION})"
+                )
+
+            for number, description, apply in MIGRATIONS:
+                if number <= version:
+                    continue
+                step_started = time.perf_counter()
+                apply(cursor)
+                report['applied'].append({
+                    'version': number,
+                    'description': description,
+                    'seconds': time.perf_counter() - step_started
+                })
+
+            cursor.execute(f"PRAGMA user_version = {LATEST_VERSION}")
+            report['to_version'] = LATEST_VERSION
+
+            cursor.execute("ROLLBACK" if dry_run else "COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+        report['seconds'] = time.perf_counter() - started
+
+        if report['applied'] and not dry_run:
+            # Refresh planner statistics for new or changed indexes
+            cursor.execute("PRAGMA optimize")
+
+        return report
+    finally:
+        cursor.close()
+        conn.close()
+
+def format_report(report):
+    """Format a migration report for printing"""
+    if not report['applied']:
+        return f"Schema is up to date (version {report['to_version']})"
+
+    lines = []
+    for step in report['applied']:
+        lines.append(f"  {step['version']:>4}  {step['description']:<40} {step['seconds'] * 1000:8.1f} ms")
+    action = "Would migrate" if report['dry_run'] else "Migrated"
+    lines.append(
+        f"{action} schema from version {report['from_version']} to {report['to_version']} "
+        f"in {report['seconds'] * 1000:.1f} ms"
+    )
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("--dry-run", action="store_true", help="Apply pending migrations, then roll back")
+    parser.add_argument("--status", action="store_true", help="Show the current and latest schema version")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            version = get_schema_version(cursor)
+        finally:
+            cursor.close()
+            conn.close()
+        print(f"Schema version {version}, latest {LATEST_VERSION}")
+        return 0
+
+    try:
+        print(format_report(migrate(dry_run=args.dry_run)))
+    except MigrationError as e:
+        print(str(e))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
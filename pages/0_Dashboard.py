@@ -380,6 +380,7 @@ def display_dashboard():
             st.switch_page("pages/3_Account.py")
     
     # Stats Section
+    storage_display, storage_unit, storage_progress = get_storage_display_values(st.session_state.get('user_id'))
     st.markdown("""
         <div class="stats-container">
             <div class="stat-card">
@@ -413,10 +414,9 @@ def display_dashboard():
         limit='∞' if st.session_state.get('subscription') == 'pro' else '3',
         period='this month' if st.session_state.get('subscription') == 'pro' else 'remaining',
         doc_progress=min((st.session_state.get('free_docs_used', 0) / 3) * 100, 100) if st.session_state.get('subscription') != 'pro' else 50,
-        # Calculate storage values
-        storage_display=get_storage_display_values(st.session_state.get('user_id'))[0],
-        storage_unit=get_storage_display_values(st.session_state.get('user_id'))[1],
-        storage_progress=get_storage_display_values(st.session_state.get('user_id'))[2],
+        storage_display=storage_display,
+        storage_unit=storage_unit,
+        storage_progress=storage_progress,
         credits_val='Unlimited' if st.session_state.get('subscription') == 'pro' else credits,
         credits_progress=100 if st.session_state.get('subscription') == 'pro' else (credits / 50) * 100
     ), unsafe_allow_html=True)
@@ -7,21 +7,24 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth import check_authentication, get_user_info, update_user_info
 from document_generator import (
     get_document_parameters, 
-    generate_document_content, 
-    generate_pdf, 
-    generate_docx,
-    get_industry_profile
+    render_artifact,
+    get_industry_profile,
+    apply_industry_customizations
 )
 from utils.document import (
     get_document_display_name, 
     get_document_description, 
-    create_download_link, 
     display_rai_indicator,
     calculate_required_credits,
-    get_user_credits,
-    deduct_credits
+    get_user_credits
 )
 from utils.sidebar import create_sidebar
+from templates.registry import get_registry
+from templates.preview import IncrementalPreview
+from pipeline import run_pipeline
+from db import delete_document, save_feedback
+from ledger import reserved_credits, charge_reservation, InsufficientCredits
+from asset_store import resolve_assets
 
 def next_step():
     st.session_state.wizard_step += 1
@@ -34,7 +37,10 @@ def reset_wizard():
     st.session_state.doc_type = None
     st.session_state.doc_params = {}
     st.session_state.generated_content = None
+    st.session_state.document_id = None
+    st.session_state.preview = None
     st.session_state.rai_results = None
+    st.session_state.exports = {}
 
 # Page configuration
 st.set_page_config(
@@ -86,6 +92,9 @@ if 'generated_content' not in st.session_state:
 if 'rai_results' not in st.session_state:
     st.session_state.rai_results = None
 
+if 'exports' not in st.session_state:
+    st.session_state.exports = {}
+
 # Get user's industry profile
 profile = get_industry_profile(st.session_state.get('user_id'))
 if not profile and st.session_state.wizard_step == 1:
@@ -93,13 +102,13 @@ if not profile and st.session_state.wizard_step == 1:
     if st.button("Complete Profile"):
         st.switch_page("pages/onboarding.py")
 
+# Height in pixels of the scrollable live preview
+PREVIEW_HEIGHT = 700
+
 # Document types
 DOC_TYPES = {
-    "nda": "Non-Disclosure Agreement",
-    "invoice": "Invoice",
-    "letter_of_intent": "Letter of Intent",
-    "proposal": "Business Proposal",
-    "scope_of_work": "Scope of Work"
+    document_type.name: document_type.display_name
+    for document_type in get_registry().ordered()
 }
 
 # Main content
@@ -245,8 +254,11 @@ elif st.session_state.wizard_step == 2:
         st.session_state.doc_params = {}
         st.info("Autofill disabled. Please fill in all fields manually.")
     
-    # Parameter input form
-    with st.form("document_params"):
+    # Parameter inputs next to a live preview; without a form every edit
+    # reruns the page and the preview re-renders only the affected sections
+    form_col, preview_col = st.columns([3, 2])
+    
+    with form_col:
         for section in parameters:
             st.markdown(f"### {section['section']}")
             
@@ -299,12 +311,26 @@ elif st.session_state.wizard_step == 2:
                 if param_id == 'business_address' and value and use_autofill and 'business_address' not in st.session_state:
                     st.session_state.business_address = value
         
-        # Form submission buttons
+        # Navigation buttons
         col1, col2 = st.columns(2)
         with col1:
-            back_button = st.form_submit_button("← Back")
+            back_button = st.button("← Back")
         with col2:
-            next_button = st.form_submit_button("Generate Document →")
+            next_button = st.button("Generate Document →")
+    
+    with preview_col:
+        st.markdown("### Live Preview")
+        preview = st.session_state.get('preview')
+        if preview is None or preview.doc_type != st.session_state.doc_type:
+            preview = st.session_state.preview = IncrementalPreview(st.session_state.doc_type)
+        try:
+            preview_html = preview.update(st.session_state.doc_params)
+            if profile:
+                preview_html = apply_industry_customizations(preview_html, profile, st.session_state.doc_type)
+            with st.container(height=PREVIEW_HEIGHT):
+                st.markdown(resolve_assets(preview_html), unsafe_allow_html=True)
+        except Exception as e:
+            st.info(f"Preview unavailable: {str(e)}")
     
     # Handle form submission
     if back_button:
@@ -345,36 +371,47 @@ elif st.session_state.wizard_step == 2:
                         # Update user profile in database
                         update_user_info(st.session_state.user_id, update_data)
                 
-                # Generate document content with industry profile
-                st.session_state.generated_content = generate_document_content(
-                    st.session_state.doc_type, 
-                    st.session_state.doc_params,
-                    st.session_state.get('user_id')  # Pass user_id for industry customization
-                )
-                
-                # Get RAI analysis
-                from rai import analyze_document
-                st.session_state.rai_results = analyze_document(
-                    st.session_state.generated_content,
-                    st.session_state.doc_type
-                )
-                
-                # Deduct credits if not on pro plan
-                if st.session_state.get('subscription') != 'pro':
-                    credits_required = calculate_required_credits(st.session_state.doc_type)
-                    success = deduct_credits(
+                # Hold the credits before generating, so a user without enough
+                # credits is turned away without generating anything; what
+                # isn't charged (e.g. if generation fails) is given back
+                credits_required = calculate_required_credits(st.session_state.doc_type)
+                description = f"Generated {DOC_TYPES[st.session_state.doc_type]}"
+                with reserved_credits(st.session_state.get('user_id'), credits_required, description) as reservation:
+                    # Generate with the industry profile, analyze and save; the
+                    # exports are pre-rendered in the background
+                    st.session_state.exports = {}
+                    result = run_pipeline(
                         st.session_state.get('user_id'),
-                        credits_required,
-                        None,  # Document ID will be updated after saving
-                        f"Generated {DOC_TYPES[st.session_state.doc_type]}"
+                        st.session_state.doc_type,
+                        DOC_TYPES[st.session_state.doc_type],
+                        st.session_state.doc_params,
+                        personalize=True
                     )
                     
-                    if not success:
-                        st.error("Failed to deduct credits. Please try again.")
-                        st.stop()
+                    # Pro users have no reservation and aren't charged
+                    if reservation is not None:
+                        try:
+                            charge_reservation(
+                                reservation['id'],
+                                [(result['document_id'], credits_required, description)]
+                            )
+                        except Exception:
+                            # Don't keep a document that wasn't paid for
+                            delete_document(result['document_id'], st.session_state.get('user_id'))
+                            raise
+                        st.session_state["ai_credits"] = reservation['balance']
+                        st.session_state["total_credits_used"] = (
+                            st.session_state.get("total_credits_used", 0) + credits_required
+                        )
+                
+                st.session_state.generated_content = result['content']
+                st.session_state.rai_results = result['rai_results']
+                st.session_state.document_id = result['document_id']
                 
                 next_step()
                 
+            except InsufficientCredits as e:
+                st.error(f"Not enough credits to generate this document. {str(e)}.")
             except Exception as e:
                 st.error(f"Error generating document: {str(e)}")
 
@@ -391,7 +428,7 @@ elif st.session_state.wizard_step == 3:
     
     # Display document preview
     st.markdown("### Document Preview")
-    st.markdown(st.session_state.generated_content, unsafe_allow_html=True)
+    st.markdown(resolve_assets(st.session_state.generated_content), unsafe_allow_html=True)
     
     # Export options
     st.markdown("### Export Options")
@@ -400,22 +437,38 @@ elif st.session_state.wizard_step == 3:
     with col1:
         if st.button("Generate PDF"):
             with st.spinner("Generating PDF..."):
-                pdf_path = generate_pdf(
-                    st.session_state.generated_content,
-                    f"{DOC_TYPES[st.session_state.doc_type]}"
+                st.session_state.exports['pdf'] = render_artifact(
+                    st.session_state.doc_type,
+                    st.session_state.doc_params,
+                    'pdf',
+                    user_id=st.session_state.get('user_id'),
+                    title=DOC_TYPES[st.session_state.doc_type]
                 )
-                st.markdown(create_download_link(pdf_path, "Download PDF"), unsafe_allow_html=True)
-                os.unlink(pdf_path)
+        if st.session_state.exports.get('pdf'):
+            st.download_button(
+                "Download PDF",
+                data=st.session_state.exports['pdf'],
+                file_name=f"{st.session_state.doc_type}.pdf",
+                mime="application/pdf"
+            )
     
     with col2:
         if st.button("Generate DOCX"):
             with st.spinner("Generating DOCX..."):
-                docx_path = generate_docx(
-                    st.session_state.generated_content,
-                    f"{DOC_TYPES[st.session_state.doc_type]}"
+                st.session_state.exports['docx'] = render_artifact(
+                    st.session_state.doc_type,
+                    st.session_state.doc_params,
+                    'docx',
+                    user_id=st.session_state.get('user_id'),
+                    title=DOC_TYPES[st.session_state.doc_type]
                 )
-                st.markdown(create_download_link(docx_path, "Download DOCX"), unsafe_allow_html=True)
-                os.unlink(docx_path)
+        if st.session_state.exports.get('docx'):
+            st.download_button(
+                "Download DOCX",
+                data=st.session_state.exports['docx'],
+                file_name=f"{st.session_state.doc_type}.docx",
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            )
     
     # Feedback and buttons
     st.markdown("### How would you rate this document?")
@@ -423,7 +476,13 @@ elif st.session_state.wizard_step == 3:
     feedback = st.text_area("Comments (optional)")
     
     if st.button("Submit Feedback & Create New Document"):
-        # In a real implementation, save feedback to database
+        # Queued and written in the background with other feedback
+        save_feedback(
+            st.session_state.get('document_id'),
+            st.session_state.get('user_id'),
+            rating,
+            feedback.strip()
+        )
         st.success("Thank you for your feedback!")
         reset_wizard()
     
@@ -5,8 +5,10 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth import check_authentication
 from db import get_user_documents
+from search_index import search_documents
 from utils import get_document_display_name, display_rai_indicator, format_date
 from utils.sidebar import create_sidebar
+from templates.registry import get_registry
 
 # Page configuration
 st.set_page_config(
@@ -30,17 +32,66 @@ if not check_authentication():
 # Document history page
 st.title("Document History")
 
-# Get user's documents
+# Search box and document type filter; both are applied in the database
+search_col, filter_col = st.columns([3, 2])
+with search_col:
+    search_query = st.text_input(
+        "Search documents:",
+        placeholder="Client name, invoice number, any word in the document"
+    ).strip()
+with filter_col:
+    document_types = [document_type.name for document_type in get_registry().ordered()]
+    filter_type = st.selectbox(
+        "Filter by document type:",
+        [None] + document_types,
+        format_func=lambda doc_type: "All" if doc_type is None else get_document_display_name(doc_type)
+    )
+
+# Positions of the pages visited so far (cursors when browsing, offsets when
+# searching); the last one is the current page. Changing the search or the
+# filter starts again from the first page.
+history_view = (search_query, filter_type)
+if st.session_state.get('history_view') != history_view or 'history_pages' not in st.session_state:
+    st.session_state.history_view = history_view
+    st.session_state.history_pages = [None]
+
+# Get the current page of the user's documents
 user_id = st.session_state.get('user_id')
-documents = get_user_documents(user_id)
+search_error = None
+if search_query:
+    try:
+        documents, next_page = search_documents(
+            user_id,
+            search_query,
+            offset=st.session_state.history_pages[-1] or 0,
+            doc_type=filter_type
+        )
+    except ValueError as e:
+        documents, next_page = [], None
+        search_error = str(e)
+else:
+    try:
+        documents, next_page = get_user_documents(
+            user_id,
+            cursor=st.session_state.history_pages[-1],
+            doc_type=filter_type
+        )
+    except ValueError:
+        # Stale cursor: start again from the first page
+        st.session_state.history_pages = [None]
+        documents, next_page = get_user_documents(user_id, doc_type=filter_type)
+page_number = len(st.session_state.history_pages)
 
 # Display document history
-if not documents:
+if not documents and not search_query and filter_type is None and page_number == 1:
     st.info("You haven't created any documents yet. Create your first document from the Generate Document page.")
 else:
     # Display documents in a table
     retention_days = 30
-    st.markdown(f"Your documents from the past {retention_days} days:")
+    if search_query:
+        st.markdown(f"Documents matching **{search_query}**, best match first:")
+    else:
+        st.markdown(f"Your documents from the past {retention_days} days:")
     
     # Create a data table
     data = []
@@ -51,32 +102,20 @@ else:
             "Document Type": get_document_display_name(doc_type),
             "Title": title,
             "Created": format_date(created_at),
-            "Trust Score": f"{rai_score:.2f}"
+            "Trust Score": f"{rai_score:.2f}" if rai_score is not None else ""
         })
     
     # Free plan retention notice
     if st.session_state.get('subscription') != 'pro':
         st.info(f"Free plan: Documents are retained for {retention_days} days. Upgrade to Pro for unlimited retention.")
     
-    # Filter options
-    doc_types = list(set([d["Document Type"] for d in data]))
-    doc_types.insert(0, "All")
-    
-    filter_type = st.selectbox("Filter by document type:", doc_types)
-    
-    # Apply filter
-    if filter_type != "All":
-        filtered_data = [d for d in data if d["Document Type"] == filter_type]
-    else:
-        filtered_data = data
-    
     # Display data
-    if filtered_data:
+    if data:
         # Use different display methods based on number of documents
-        if len(filtered_data) > 5:
+        if len(data) > 5:
             # Use a table for many documents
             st.dataframe(
-                filtered_data,
+                data,
                 use_container_width=True,
                 column_config={
                     "ID": st.column_config.TextColumn("ID", width="small"),
@@ -95,7 +134,7 @@ else:
             )
         else:
             # Use expandable cards for fewer documents
-            for doc in filtered_data:
+            for doc in data:
                 with st.expander(f"{doc['Title']} ({doc['Document Type']})"):
                     col1, col2 = st.columns(2)
                     
@@ -105,8 +144,10 @@ else:
                     
                     with col2:
                         st.markdown("**Trust Score:**")
-                        score = float(doc['Trust Score'])
-                        display_rai_indicator(score)
+                        if doc['Trust Score']:
+                            display_rai_indicator(float(doc['Trust Score']))
+                        else:
+                            st.caption("Analysis pending")
                     
                     # Action buttons
                     btn1, btn2, btn3 = st.columns(3)
@@ -120,16 +161,27 @@ else:
                     with btn3:
                         if st.button("Download DOCX", key=f"docx_{doc['ID']}"):
                             st.info("DOCX download would start here")
+    elif search_error:
+        st.warning(search_error)
+    elif search_query:
+        st.info("No documents match your search.")
+    elif filter_type is not None:
+        st.info(f"No {get_document_display_name(filter_type)} documents found.")
     else:
-        st.info(f"No {filter_type} documents found.")
+        st.info("No documents found.")
     
-    # Pagination (for future implementation when there are many documents)
-    if len(data) > 10:
+    # Pagination: Next moves on from the last document shown, Previous goes
+    # back to the position the current page was loaded from
+    if page_number > 1 or next_page is not None:
         st.markdown("---")
         col1, col2, col3 = st.columns([1, 3, 1])
         with col1:
-            st.button("← Previous")
+            if st.button("← Previous", disabled=page_number == 1):
+                st.session_state.history_pages.pop()
+                st.rerun()
         with col2:
-            st.write("Page 1 of 1")
+            st.write(f"Page {page_number}")
         with col3:
-            st.button("Next →")
+            if st.button("Next →", disabled=next_page is None):
+                st.session_state.history_pages.append(next_page)
+                st.rerun()
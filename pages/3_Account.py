@@ -14,6 +14,7 @@ from utils.document import (
 )
 from utils.sidebar import create_sidebar
 from utils.styles import add_home_button
+from templates.registry import get_registry
 
 def format_date_display(date_value):
     """Format a date value for display, handling both string and datetime objects"""
@@ -365,7 +366,10 @@ if st.session_state.get('subscription') != 'pro':
     
     if transactions:
         for transaction in transactions:
-            amount, trans_type, description, created_at, doc_title = transaction
+            amount = transaction['amount']
+            description = transaction['description']
+            created_at = transaction['created_at']
+            doc_title = transaction['document_title']
             st.markdown(f"""
                 <div class="credit-transaction">
                     <div style="display: flex; justify-content: space-between; align-items: center;">
@@ -437,7 +441,7 @@ theme_pref = st.select_slider(
     value=current_theme
 )
 
-doc_types = ["nda", "invoice", "letter_of_intent", "proposal", "scope_of_work"]
+doc_types = [document_type.name for document_type in get_registry().ordered()]
 default_doc = st.selectbox(
     "Default Document Type",
     options=doc_types,
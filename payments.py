@@ -2,6 +2,7 @@ import os
 import stripe
 import uuid
 from db import get_db_connection
+from user_cache import invalidate_user
 
 # Initialize Stripe with the API key from environment variables
 stripe.api_key = os.getenv("STRIPE_API_KEY", "sk_test_example")
@@ -124,6 +125,7 @@ def create_subscription(user_id, token, plan):
         )
         
         conn.commit()
+        invalidate_user(user_id)
         cursor.close()
         conn.close()
         
@@ -0,0 +1,105 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Pool configuration (override with environment variables)
+RENDER_POOL_WORKERS = int(os.getenv("RENDER_POOL_WORKERS", "2"))
+RENDER_POOL_MAX_QUEUE = int(os.getenv("RENDER_POOL_MAX_QUEUE", "16"))
+RENDER_TIMEOUT_SECONDS = float(os.getenv("RENDER_TIMEOUT_SECONDS", "60"))
+
+# Per-worker state, populated once by _init_worker
+_font_config = None
+
+class RenderQueueFull(RuntimeError):
+    """Raised when the render pool already has the maximum number of pending jobs"""
+
+def _init_worker():
+    """Load fonts once per worker process"""
+    global _font_config
+    from weasyprint.text.fonts import FontConfiguration
+
+    _font_config = FontConfiguration()
+
+def _render(content):
+    """Render an HTML string to PDF bytes inside a worker process"""
+    from weasyprint import HTML
+
+    return HTML(string=content).write_pdf(font_config=_font_config)
+
+class RenderPool:
+    """Long-lived pool of WeasyPrint worker processes"""
+
+    def __init__(self, workers=RENDER_POOL_WORKERS, max_queue=RENDER_POOL_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = self._start_executor()
+        self._executor_lock = threading.Lock()
+        # Running jobs plus queued jobs may never exceed this number
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+
+    def _start_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+    def _restart(self, broken):
+        """Replace a broken executor (once, however many callers saw it break)"""
+        with self._executor_lock:
+            if self._executor is broken:
+                print("PDF render pool broke, starting new worker processes")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._start_executor()
+
+    def submit(self, content):
+        """Queue an HTML string for rendering and return a future for the PDF bytes"""
+        if not self._slots.acquire(blocking=False):
+            raise RenderQueueFull(
+                f"PDF render queue is full ({self.workers + self.max_queue} jobs pending)"
+            )
+
+        try:
+            executor = self._executor
+            try:
+                future = executor.submit(_render, content)
+            except BrokenProcessPool:
+                self._restart(executor)
+                future = self._executor.submit(_render, content)
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def render(self, content, timeout=RENDER_TIMEOUT_SECONDS):
+        """
+        Render an HTML string to PDF bytes, blocking until it is done
+
+        If a worker dies (which breaks the whole executor), the pool is
+        restarted and the render retried once.
+        """
+        executor = self._executor
+        try:
+            return self.submit(content).result(timeout=timeout)
+        except BrokenProcessPool:
+            self._restart(executor)
+            return self.submit(content).result(timeout=timeout)
+
+    def shutdown(self, wait=True):
+        """Stop all worker processes"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_render_pool():
+    """Get the process-wide render pool, starting it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RenderPool()
+    return _pool
+
+def render_pdf(content):
+    """Render an HTML string to PDF bytes using the shared render pool"""
+    return get_render_pool().render(content)
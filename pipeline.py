@@ -0,0 +1,162 @@
+# Document generation pipeline
+#
+# The HTML is generated first. The RAI analysis then runs alongside encoding
+# the content for storage and collecting its assets, and once both are done
+# the document is saved together with its RAI results in a single insert, so
+# a stored document always has its analysis. The caller waits for these
+# stages only:
+#
+#   generate --+--> rai ----------+--> save
+#              +--> prepare ------+
+#              +--> pdf, docx   (pre-rendered into the artifact cache in the
+#                               background; the caller doesn't wait for them)
+#
+# Pre-renders run on their own small pool so a slow PDF never delays a
+# generation; at most PIPELINE_PRERENDER_MAX_PENDING wait at a time, beyond
+# that they are skipped and the export renders on demand. Every run returns
+# the timings of the stages it waited for, and totals (including the
+# pre-renders) are kept per process (see get_stage_stats).
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from db import prepare_document, save_document
+from rai import analyze_document
+from document_generator import render_artifact
+
+# Pipeline configuration (override with environment variables)
+PIPELINE_RAI_WORKERS = int(os.getenv("PIPELINE_RAI_WORKERS", "4"))
+PIPELINE_PRERENDER_WORKERS = int(os.getenv("PIPELINE_PRERENDER_WORKERS", "2"))
+PIPELINE_PRERENDER_MAX_PENDING = int(os.getenv("PIPELINE_PRERENDER_MAX_PENDING", "16"))
+PIPELINE_PRERENDER = tuple(
+    fmt.strip() for fmt in os.getenv("PIPELINE_PRERENDER", "pdf,docx").split(",") if fmt.strip()
+)
+
+for _fmt in PIPELINE_PRERENDER:
+    if _fmt not in ('pdf', 'docx'):
+        raise ValueError(f"Invalid PIPELINE_PRERENDER format '{_fmt}'")
+
+# Runs the RAI analysis while the calling thread prepares the document for storage
+_rai_executor = ThreadPoolExecutor(max_workers=max(1, PIPELINE_RAI_WORKERS), thread_name_prefix="rai")
+
+_prerender_executor = ThreadPoolExecutor(
+    max_workers=max(1, PIPELINE_PRERENDER_WORKERS), thread_name_prefix="prerender"
+)
+_prerender_pending = 0
+_prerender_lock = threading.Lock()
+
+# stage -> {'count', 'seconds', 'max_seconds', 'errors'}
+_stage_stats = {}
+_stats_lock = threading.Lock()
+
+def _record(timings, errors):
+    with _stats_lock:
+        for stage, seconds in timings.items():
+            stats = _stage_stats.setdefault(stage, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'errors': 0})
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        for stage in errors:
+            _stage_stats.setdefault(stage, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'errors': 0})
+            _stage_stats[stage]['errors'] += 1
+
+def get_stage_stats():
+    """Get run counts, total/average/max seconds and errors per stage for this process"""
+    with _stats_lock:
+        return {
+            stage: dict(stats, average_seconds=stats['seconds'] / stats['count'] if stats['count'] else 0.0)
+            for stage, stats in _stage_stats.items()
+        }
+
+def _timed(timings, stage, fn, *args, **kwargs):
+    """Run a stage, recording its duration even if it fails"""
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[stage] = time.perf_counter() - started
+
+def _prerender(doc_type, parameters, fmt, user_id, title):
+    """Render an export into the artifact cache; runs in the background"""
+    global _prerender_pending
+    timings = {}
+    errors = {}
+    try:
+        _timed(timings, fmt, render_artifact, doc_type, parameters, fmt, user_id=user_id, title=title)
+    except Exception as e:
+        errors[fmt] = e
+        print(f"Pre-rendering {fmt} failed: {str(e)}")
+    finally:
+        _record(timings, errors)
+        with _prerender_lock:
+            _prerender_pending -= 1
+
+def start_prerender(doc_type, parameters, user_id=None, title=None, formats=PIPELINE_PRERENDER):
+    """Queue background pre-renders of a document's exports; returns the formats queued"""
+    global _prerender_pending
+    queued = []
+    for fmt in formats:
+        with _prerender_lock:
+            if _prerender_pending >= PIPELINE_PRERENDER_MAX_PENDING:
+                break
+            _prerender_pending += 1
+        # Copied so a caller changing its parameters can't affect the render
+        _prerender_executor.submit(_prerender, doc_type, dict(parameters), fmt, user_id, title)
+        queued.append(fmt)
+    return queued
+
+def run_pipeline(user_id, doc_type, title, parameters, personalize=False, prerender=PIPELINE_PRERENDER):
+    """
+    Generate, analyze and save a document, and start pre-rendering its exports
+
+    The analysis runs while the content is encoded for storage, and the
+    document is saved with its results once both are done. personalize
+    applies the user's industry profile to the content. Returns
+    the document id, RAI results, per-stage timings in seconds and the
+    export formats queued for pre-rendering. Errors from generation,
+    analysis or saving are raised; pre-render errors are only logged.
+    """
+    profile_user_id = user_id if personalize else None
+    timings = {}
+    errors = {}
+    started = time.perf_counter()
+
+    try:
+        stage = 'generate'
+        content = _timed(timings, stage, render_artifact, doc_type, parameters, 'html', user_id=profile_user_id)
+
+        prerendered = start_prerender(doc_type, parameters, profile_user_id, title, prerender)
+
+        analysis = _rai_executor.submit(_timed, timings, 'rai', analyze_document, content, doc_type)
+        stage = 'prepare'
+        try:
+            prepared = _timed(timings, stage, prepare_document, doc_type, content)
+        finally:
+            # Let the analysis finish even if preparing failed, so its timing is recorded
+            wait([analysis])
+
+        stage = 'rai'
+        rai_results = analysis.result()
+
+        stage = 'save'
+        doc_id = _timed(
+            timings, stage, save_document,
+            user_id, doc_type, title, content, json.dumps(parameters, default=str),
+            rai_results["score"], json.dumps(rai_results["flags"]), prepared
+        )
+    except Exception as e:
+        errors[stage] = e
+        raise
+    finally:
+        timings['total'] = time.perf_counter() - started
+        _record(timings, errors)
+
+    return {
+        "document_id": doc_id,
+        "content": content,
+        "rai_results": rai_results,
+        "timings": timings,
+        "prerendered": prerendered
+    }
@@ -0,0 +1,187 @@
+# Query planner audit for the hot per-user queries
+#
+# Runs EXPLAIN QUERY PLAN on every query below and exits with status 1 if any
+# of them scans a whole table or index.
+#
+# Usage:
+#   python query_plan_check.py                # check the app database
+#   python query_plan_check.py --db path.db   # check another database file
+#   python query_plan_check.py --fresh        # check a new database built by the migrations
+
+import os
+import sys
+import sqlite3
+import argparse
+import tempfile
+from storage_codec import register_functions
+
+# (name, sql, sample parameters) for every query on a hot path
+HOT_QUERIES = [
+    (
+        "get_user_documents",
+        """
+        SELECT id, doc_type, title, created_at, rai_score
+        FROM documents
+        WHERE user_id = ? AND created_at >= DATE('now', ?)
+        ORDER BY created_at DESC, id
+        LIMIT ?
+        """,
+        ("user", "-30 days", 21)
+    ),
+    (
+        "get_user_documents (next page, by type)",
+        """
+        SELECT id, doc_type, title, created_at, rai_score
+        FROM documents
+        WHERE user_id = ? AND created_at >= DATE('now', ?) AND doc_type = ?
+          AND created_at <= ? AND (created_at < ? OR id > ?)
+        ORDER BY created_at DESC, id
+        LIMIT ?
+        """,
+        ("user", "-30 days", "nda", "2024-01-01 00:00:00", "2024-01-01 00:00:00", "doc", 21)
+    ),
+    (
+        "search_documents",
+        """
+        SELECT d.id, d.doc_type, d.title, d.created_at, d.rai_score
+        FROM documents_search s
+        JOIN document_search_rows r ON r.rowid = s.rowid
+        JOIN documents d ON d.id = r.document_id
+        WHERE documents_search MATCH ? AND s.rowid BETWEEN ? AND ?
+          AND d.created_at >= DATE('now', ?) AND d.doc_type = ?
+        ORDER BY bm25(documents_search, 10.0, 1.0, 5.0), s.rowid
+        LIMIT ? OFFSET ?
+        """,
+        ('"acme"', 4294967296, 8589934591, "-30 days", "nda", 21, 0)
+    ),
+    (
+        "get_recent_documents",
+        """
+        SELECT id, title, doc_type, created_at, credits_used, status
+        FROM documents
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+        LIMIT ?
+        """,
+        ("user", 5)
+    ),
+    (
+        "get_user_usage",
+        """
+        SELECT u.document_count, u.content_bytes, COALESCE(m.document_count, 0) AS documents_this_month
+        FROM user_usage u
+        LEFT JOIN user_monthly_usage m ON m.user_id = u.user_id AND m.month = strftime('%Y-%m', 'now')
+        WHERE u.user_id = ?
+        """,
+        ("user",)
+    ),
+    (
+        "get_user_stats",
+        """
+        SELECT COALESCE(SUM(document_count), 0) as doc_count
+        FROM user_monthly_usage
+        WHERE user_id = ? AND month = strftime('%Y-%m', 'now')
+        """,
+        ("user",)
+    ),
+    (
+        "get_document_by_id",
+        """
+        SELECT id, doc_type, title,
+               document_content(content, content_blob, content_codec) AS content,
+               parameters, rai_score, rai_flags, created_at
+        FROM documents
+        WHERE id = ? AND user_id = ?
+        """,
+        ("doc", "user")
+    ),
+    (
+        "get_credit_history",
+        """
+        SELECT ct.amount, ct.transaction_type, ct.description, ct.created_at, d.title as document_title
+        FROM credit_transactions ct
+        LEFT JOIN documents d ON ct.document_id = d.id
+        WHERE ct.user_id = ?
+        ORDER BY ct.created_at DESC
+        LIMIT ?
+        """,
+        ("user", 10)
+    )
+]
+
+def explain(conn, sql, params):
+    """Get the EXPLAIN QUERY PLAN detail lines for a query"""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+def _is_full_scan(line):
+    if not line.startswith("SCAN ") or line == "SCAN CONSTANT ROW":
+        return False
+    # A virtual table (FTS5) scan with constraints in its plan ("INDEX 0:M...") is a lookup
+    _, _, index_plan = line.partition("VIRTUAL TABLE INDEX ")
+    return not index_plan.partition(":")[2]
+
+def find_problems(plan):
+    """Split plan lines into full scans (errors) and temp b-tree sorts (warnings)"""
+    scans = [line for line in plan if _is_full_scan(line)]
+    sorts = [line for line in plan if line.startswith("USE TEMP B-TREE")]
+    return scans, sorts
+
+def check(conn, queries=HOT_QUERIES):
+    """Print the plan for every query; returns the number of queries that scan"""
+    failures = 0
+    for name, sql, params in queries:
+        try:
+            plan = explain(conn, sql, params)
+        except sqlite3.Error as e:
+            print(f"FAIL  {name}: {str(e)}")
+            failures += 1
+            continue
+
+        scans, sorts = find_problems(plan)
+        print(f"{'FAIL' if scans else 'ok':<5} {name}")
+        for line in plan:
+            marker = "!" if line in scans else ("~" if line in sorts else " ")
+            print(f"      {marker} {line}")
+        failures += bool(scans)
+    return failures
+
+def build_fresh_database(path):
+    """Create a database at path with the app's schema migrations"""
+    import db
+    from migrations import migrate
+    db.DB_FILE = path
+    migrate()
+    db._pool.close_all()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if a hot query does a full table scan")
+    parser.add_argument("--db", help="Database file to check (defaults to the app database)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Check a new database built by the migrations")
+    args = parser.parse_args(argv)
+
+    if args.fresh:
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, "query_plan_check.db")
+        build_fresh_database(path)
+    else:
+        from db import DB_FILE
+        path = args.db or DB_FILE
+
+    if not os.path.exists(path):
+        print(f"Database '{path}' does not exist")
+        return 2
+
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    register_functions(conn)
+    try:
+        failures = check(conn)
+    finally:
+        conn.close()
+
+    print(f"\n{failures} of {len(HOT_QUERIES)} queries do a full scan" if failures else
+          f"\nAll {len(HOT_QUERIES)} queries use an index")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
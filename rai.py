@@ -1,65 +1,249 @@
-import random
+import os
+import re
+import html
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
 
-def analyze_document(content, doc_type):
-    """
-    Analyze a document for Responsible AI metrics
-    
-    In a real implementation, this would use actual NLP/AI models for:
-    - Bias detection
-    - Hallucination detection
-    - Security/privacy risk assessment
-    
-    For this MVP, we'll use a simplified implementation
-    """
-    # Simulate RAI analysis with reasonable defaults
-    # In a real implementation, this would use actual models
-    
-    # Calculate a bias score (0-1, lower is better)
-    # This would normally use a trained model to detect bias in language
-    bias_score = random.uniform(0.1, 0.4)
-    
-    # Determine bias level based on the score
+# Analyzer settings (override with environment variables)
+RAI_CACHE_SIZE = int(os.getenv("RAI_CACHE_SIZE", "1024"))
+
+# Throughput every change to the analyzer must keep, on uncached documents
+# (checked by benchmarks/bench_rai.py)
+TARGET_DOCS_PER_SEC = int(os.getenv("RAI_TARGET_DOCS_PER_SEC", "500"))
+
+# Exclusionary or gendered wording, matched as whole words (case-insensitive)
+BIAS_LEXICON = (
+    "chairman", "chairmen", "manpower", "man-hours", "man hours", "manmade", "man-made",
+    "mankind", "salesman", "salesmen", "workman", "workmen", "foreman", "middleman",
+    "businessman", "businessmen", "spokesman", "craftsman", "craftsmen", "freshman",
+    "he or she", "his or her", "him or her", "guys", "girls", "housewife",
+    "blacklist", "blacklisted", "whitelist", "whitelisted", "master/slave", "slave",
+    "grandfathered", "grandfather clause", "crazy", "insane", "lame", "dumb", "retarded",
+    "handicapped", "crippled", "wheelchair-bound", "young and energetic", "digital native",
+    "digital natives", "native speaker", "native english", "culture fit", "able-bodied",
+    "third world", "illegal alien", "illegal aliens", "gypped", "spirit animal"
+)
+
+# Absolute or superlative claims that can't be verified from the document
+CLAIM_LEXICON = (
+    "guaranteed", "guarantees", "we guarantee", "100%", "100 percent", "best in class",
+    "best-in-class", "world-class", "world class", "industry-leading", "industry leading",
+    "market-leading", "market leading", "leading provider", "number one", "#1",
+    "unmatched", "unparalleled", "unrivaled", "unbeatable", "second to none", "risk-free",
+    "risk free", "zero risk", "zero defects", "error-free", "never fails", "always delivers",
+    "proven to", "scientifically proven", "clinically proven", "the best",
+    "state-of-the-art", "cutting-edge", "revolutionary", "fastest", "cheapest"
+)
+
+# Personal data patterns; the order matters where they overlap
+PII_PATTERNS = (
+    ("ssn", r"\d{3}-\d{2}-\d{4}"),
+    ("card", r"(?:\d{4}[ -]){3}\d{4}|\d{15,16}"),
+    ("phone", r"(?:\+\d{1,3}[ .-]?)?(?:\(\d{3}\)|\d{3})[ .-]?\d{3}[ .-]?\d{4}"),
+    ("account", r"\d{8,17}")
+)
+
+# PII kinds that make a document high risk on their own
+SENSITIVE_PII = frozenset(("ssn", "card", "account"))
+
+# Contact details (emails, phones) tolerated before security risk is raised
+CONTACT_PII_LIMIT = 4
+
+# Bias score: BIAS_BASE plus BIAS_PER_HIT for every bias term per 1,000 words
+BIAS_BASE = 0.1
+BIAS_PER_HIT = 0.15
+
+# Claims needed for medium and high hallucination risk
+CLAIMS_MEDIUM = 1
+CLAIMS_HIGH = 4
+
+# Contribution of each risk level to the overall score
+RISK_WEIGHTS = {"low": 0.1, "medium": 0.3, "high": 0.6}
+
+# Number of matched terms kept in the flags for display
+MAX_REPORTED_TERMS = 10
+
+# Punctuation that separates words; hyphens, slashes, "%" and "#" stay part of a word
+_WORD_BREAKS = str.maketrans({char: " " for char in '.,;:!?()[]{}"|*<>='})
+
+def _words(text):
+    """Lowercase words of a text"""
+    return text.lower().translate(_WORD_BREAKS).split()
+
+def _build_lexicon():
+    """Map each lexicon phrase (as a tuple of words) to its rule, plus the longest phrase per first word"""
+    phrases = {}
+    for kind, terms in (("bias", BIAS_LEXICON), ("claim", CLAIM_LEXICON)):
+        for term in terms:
+            phrases[tuple(_words(term))] = kind
+    longest = {}
+    for words in phrases:
+        longest[words[0]] = max(longest.get(words[0], 0), len(words))
+    return phrases, longest
+
+_LEXICON, _LEXICON_FIRST_WORDS = _build_lexicon()
+
+# Runs of digits and phone/card separators; only these are matched against PII_PATTERNS
+_NUMBER_RE = re.compile(r"[\d(+][\d ()+./-]{6,}\d")
+_PII_RE = re.compile(
+    r"(?<![\w.])(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in PII_PATTERNS) + r")(?![\w-])"
+)
+_EMAIL_LOCAL_RE = re.compile(r"[\w.%+-]+$")
+_EMAIL_DOMAIN_RE = re.compile(r"[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,}")
+
+# Style and script blocks are dropped with their content, other tags are dropped
+_MARKUP_RE = re.compile(r"<(?:style|script)\b.*?</(?:style|script)\s*>|<[^>]*>", re.IGNORECASE | re.DOTALL)
+
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+def strip_html(content):
+    """Get the visible text of an HTML document"""
+    return html.unescape(_MARKUP_RE.sub(" ", content))
+
+def _luhn_valid(number):
+    digits = [int(d) for d in number if d.isdigit()]
+    checksum = sum(digits[-1::-2]) + sum(sum(divmod(d * 2, 10)) for d in digits[-2::-2])
+    return checksum % 10 == 0
+
+def scan_words(words):
+    """Find lexicon phrases in one pass over the words, longest phrase first"""
+    bias_terms = []
+    claims = []
+    lexicon = _LEXICON
+    first_words = _LEXICON_FIRST_WORDS
+    index = 0
+    count = len(words)
+
+    while index < count:
+        longest = first_words.get(words[index])
+        if longest is not None:
+            for length in range(min(longest, count - index), 0, -1):
+                phrase = tuple(words[index:index + length])
+                kind = lexicon.get(phrase)
+                if kind is not None:
+                    (bias_terms if kind == "bias" else claims).append(" ".join(phrase))
+                    index += length - 1
+                    break
+        index += 1
+
+    return bias_terms, claims
+
+def find_emails(text):
+    """Count email addresses, starting from each "@" instead of every position"""
+    count = 0
+    at = text.find("@")
+    while at != -1:
+        if _EMAIL_LOCAL_RE.search(text, max(0, at - 64), at) and _EMAIL_DOMAIN_RE.match(text, at + 1):
+            count += 1
+        at = text.find("@", at + 1)
+    return count
+
+def scan_pii(text):
+    """Count personal data matches by kind"""
+    pii = {}
+    emails = find_emails(text) if "@" in text else 0
+    if emails:
+        pii["email"] = emails
+
+    for candidate in _NUMBER_RE.finditer(text):
+        for match in _PII_RE.finditer(text, candidate.start(), candidate.end()):
+            kind = match.lastgroup
+            if kind == "card" and not _luhn_valid(match.group()):
+                kind = "account"
+            pii[kind] = pii.get(kind, 0) + 1
+
+    return pii
+
+def _level(count, medium, high):
+    if count >= high:
+        return "high"
+    if count >= medium:
+        return "medium"
+    return "low"
+
+def _unique(terms):
+    return list(dict.fromkeys(terms))[:MAX_REPORTED_TERMS]
+
+def _analyze(content, doc_type):
+    text = strip_html(content)
+    words = _words(text)
+    bias_terms, claims = scan_words(words)
+    pii = scan_pii(text)
+    word_count = len(words)
+
+    # Bias score (0-1, lower is better), from the density of bias terms
+    bias_score = min(1.0, BIAS_BASE + BIAS_PER_HIT * len(bias_terms) * 1000 / max(word_count, 1000))
     if bias_score < 0.2:
         bias_level = "low"
     elif bias_score < 0.5:
         bias_level = "medium"
     else:
         bias_level = "high"
-    
-    # Hallucination detection
-    # In a real system, this would check for factual assertions that can't be verified
-    # For this demo, we'll randomly set it based on document type
-    hallucination_risk = "low"
-    if doc_type in ["proposal", "scope_of_work"] and random.random() < 0.3:
-        hallucination_risk = "medium"
-    
-    # Security and privacy risk
-    # This would assess the document for PII, sensitive data, etc.
-    security_risk = "low"
-    if doc_type == "nda":
-        security_risk = "medium"  # NDAs often contain sensitive info
-    
-    # Calculate overall RAI score (0-1, higher is better)
-    # This is an oversimplified calculation for demo purposes
-    rai_score = 1.0 - (bias_score * 0.5 + 
-                      (0.3 if hallucination_risk == "medium" else 0.1) * 0.25 +
-                      (0.3 if security_risk == "medium" else 0.1) * 0.25)
-    
-    # Round to 2 decimal places
-    rai_score = round(rai_score, 2)
-    
+
+    # Hallucination risk from unverifiable claims
+    hallucination_risk = _level(len(claims), CLAIMS_MEDIUM, CLAIMS_HIGH)
+
+    # Security and privacy risk from personal data; NDAs are sensitive by nature
+    contact_count = pii.get("email", 0) + pii.get("phone", 0)
+    if any(kind in SENSITIVE_PII for kind in pii):
+        security_risk = "high"
+    elif contact_count > CONTACT_PII_LIMIT or doc_type == "nda":
+        security_risk = "medium"
+    else:
+        security_risk = "low"
+
+    # Overall RAI score (0-1, higher is better)
+    rai_score = 1.0 - (bias_score * 0.5 +
+                       RISK_WEIGHTS[hallucination_risk] * 0.25 +
+                       RISK_WEIGHTS[security_risk] * 0.25)
+
     return {
-        "score": rai_score,
+        "score": round(max(rai_score, 0.0), 2),
         "flags": {
             "bias": {
                 "level": bias_level,
-                "score": round(bias_score, 2)
+                "score": round(bias_score, 2),
+                "terms": _unique(bias_terms)
             },
             "hallucination": hallucination_risk,
-            "security": security_risk
+            "security": security_risk,
+            "claims": _unique(claims),
+            "pii": pii,
+            "word_count": word_count
         }
     }
 
+def analyze_document(content, doc_type):
+    """
+    Analyze a document for Responsible AI metrics
+
+    Deterministic rule-based checks over the document text, which is
+    extracted from the HTML once:
+    - Bias: exclusionary or gendered terms, scored by density
+    - Hallucination: absolute or superlative claims that can't be verified
+    - Security/privacy: emails, phone numbers, SSNs, card and account numbers
+
+    Results are memoized by content hash, so re-analyzing a document is free.
+    """
+    key = hashlib.sha256(content.encode("utf-8")).digest() + doc_type.encode("utf-8")
+    with _results_lock:
+        result = _results.get(key)
+        if result is not None:
+            _results.move_to_end(key)
+
+    if result is None:
+        result = _analyze(content, doc_type)
+        with _results_lock:
+            _results[key] = result
+            while len(_results) > RAI_CACHE_SIZE:
+                _results.popitem(last=False)
+
+    # Callers may modify the result (e.g. serialize the flags in place)
+    return copy.deepcopy(result)
+
 def get_rai_badge_color(score):
     """Get the color for an RAI badge based on the score"""
     if score >= 0.8:
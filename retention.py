@@ -0,0 +1,366 @@
+# Retention purge for expired documents
+#
+# Documents older than their owner's plan allows (RETENTION_DAYS) are deleted
+# in small batches, each in its own short write transaction, so the app and
+# API keep writing while a purge runs. The batch size adapts to keep every
+# transaction near RETENTION_BATCH_SECONDS: the delete triggers (usage
+# counters, asset references, the search index) make deletes cost more than
+# they look.
+#
+# Per batch, credit transactions keep their history but lose the reference
+# to the deleted document, and assets no document links to any more are
+# deleted. Afterwards the freed pages are returned to the filesystem with
+# PRAGMA incremental_vacuum, which needs auto_vacuum = INCREMENTAL: new
+# databases get it from the migrations, and an existing database is switched
+# over once with --enable-incremental-vacuum (a full VACUUM).
+#
+# Usage:
+#   python retention.py                               # purge expired documents and vacuum
+#   python retention.py --dry-run                     # count expired documents per plan
+#   python retention.py --enable-incremental-vacuum   # switch auto_vacuum mode, then purge
+
+import os
+import sys
+import time
+import argparse
+import threading
+from db import get_db_connection
+from asset_store import delete_unreferenced_assets
+from user_cache import invalidate_user
+
+# Days documents are kept per plan; 0 keeps them forever (override with environment variables)
+RETENTION_DAYS = {
+    'free': int(os.getenv("RETENTION_FREE_DAYS", "30")),
+    'pro': int(os.getenv("RETENTION_PRO_DAYS", "0"))
+}
+
+# Purge settings (override with environment variables)
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "100"))
+RETENTION_MAX_BATCH_SIZE = int(os.getenv("RETENTION_MAX_BATCH_SIZE", "1000"))
+RETENTION_BATCH_SECONDS = float(os.getenv("RETENTION_BATCH_SECONDS", "0.2"))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.05"))
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", str(6 * 60 * 60)))
+
+# Pages freed per PRAGMA incremental_vacuum step
+VACUUM_STEP_PAGES = int(os.getenv("VACUUM_STEP_PAGES", "2000"))
+
+# Users read per query while looking for expired documents
+USER_PAGE_SIZE = 500
+
+# PRAGMA auto_vacuum value for INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+def _cutoff(cursor, days):
+    """Documents created before the returned date are expired (matches the history page)"""
+    cursor.execute("SELECT DATE('now', ?)", (f"-{days} days",))
+    return cursor.fetchone()[0]
+
+def _plan_users(cursor, plan):
+    """Yield the ids of the users on a plan, in pages"""
+    after = ''
+    while True:
+        cursor.execute(
+            """
+            SELECT id FROM users
+            WHERE id > ? AND COALESCE(subscription, 'free') = ?
+            ORDER BY id
+            LIMIT ?
+            """,
+            (after, plan, USER_PAGE_SIZE)
+        )
+        user_ids = [row[0] for row in cursor.fetchall()]
+        if not user_ids:
+            return
+        yield from user_ids
+        after = user_ids[-1]
+
+def _expired_ids(cursor, user_id, cutoff, limit):
+    """Get up to limit expired document ids of a user (None for documents without one)"""
+    cursor.execute(
+        f"""
+        SELECT id FROM documents
+        WHERE user_id {'IS NULL' if user_id is None else '= ?'} AND created_at < ?
+        LIMIT ?
+        """,
+        ((cutoff, limit) if user_id is None else (user_id, cutoff, limit))
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+def delete_documents(cursor, doc_ids):
+    """
+    Delete documents in one transaction and return what was reclaimed
+
+    Credit transactions that reference them are kept with document_id set
+    to NULL, and assets left without references are deleted.
+    """
+    placeholders = ", ".join("?" * len(doc_ids))
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute(
+            f"""
+            SELECT COUNT(*),
+                   COALESCE(SUM(COALESCE(content_size, LENGTH(CAST(content AS BLOB)))), 0),
+                   COALESCE(SUM(COALESCE(LENGTH(CAST(content AS BLOB)), 0) + COALESCE(LENGTH(content_blob), 0)), 0),
+                   GROUP_CONCAT(DISTINCT user_id)
+            FROM documents WHERE id IN ({placeholders})
+            """,
+            doc_ids
+        )
+        documents, content_bytes, stored_bytes, user_ids = cursor.fetchone()
+
+        cursor.execute(
+            f"UPDATE credit_transactions SET document_id = NULL WHERE document_id IN ({placeholders})",
+            doc_ids
+        )
+        credit_transactions = cursor.rowcount
+        cursor.execute(f"DELETE FROM documents WHERE id IN ({placeholders})", doc_ids)
+
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM assets WHERE refcount <= 0")
+        _, asset_bytes = cursor.fetchone()
+        assets = delete_unreferenced_assets(cursor)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    for user_id in (user_ids or "").split(","):
+        invalidate_user(user_id)
+
+    return {
+        'documents': documents,
+        'content_bytes': content_bytes,
+        'stored_bytes': stored_bytes,
+        'credit_transactions': credit_transactions,
+        'assets': assets,
+        'asset_bytes': asset_bytes
+    }
+
+class _Purge:
+    """Collects expired ids into batches and deletes them, adapting the batch size"""
+
+    def __init__(self, cursor, report, stop_event):
+        self.cursor = cursor
+        self.report = report
+        self.stop_event = stop_event
+        self.batch_size = max(1, min(RETENTION_BATCH_SIZE, RETENTION_MAX_BATCH_SIZE))
+        self.pending = []
+
+    @property
+    def stopped(self):
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def add_user(self, plan, user_id, cutoff):
+        """Queue a user's expired documents, deleting every time a batch is full"""
+        while not self.stopped:
+            ids = _expired_ids(self.cursor, user_id, cutoff, self.batch_size - len(self.pending))
+            self.pending.extend(ids)
+            if len(self.pending) < self.batch_size:
+                return
+            self.flush(plan)
+
+    def flush(self, plan):
+        if not self.pending:
+            return
+        started = time.perf_counter()
+        deleted = delete_documents(self.cursor, self.pending)
+        elapsed = time.perf_counter() - started
+        self.pending = []
+
+        plan_report = self.report['plans'].setdefault(plan, {'documents': 0, 'content_bytes': 0, 'stored_bytes': 0})
+        for key in plan_report:
+            plan_report[key] += deleted[key]
+        for key, value in deleted.items():
+            self.report[key] += value
+        self.report['batches'] += 1
+        self.report['max_batch_seconds'] = max(self.report['max_batch_seconds'], elapsed)
+
+        # Keep each transaction near the time budget
+        if elapsed > RETENTION_BATCH_SECONDS and self.batch_size > 1:
+            self.batch_size = max(1, self.batch_size // 2)
+        elif elapsed < RETENTION_BATCH_SECONDS / 2:
+            self.batch_size = min(RETENTION_MAX_BATCH_SIZE, self.batch_size * 2)
+
+        if RETENTION_BATCH_PAUSE_SECONDS > 0:
+            time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+
+def purge_expired(stop_event=None):
+    """Delete every expired document in batches; returns a report of what was reclaimed"""
+    conn = get_db_connection()
+    read_cursor = conn.cursor()
+    write_cursor = conn.cursor()
+    report = {
+        'plans': {}, 'documents': 0, 'content_bytes': 0, 'stored_bytes': 0,
+        'credit_transactions': 0, 'assets': 0, 'asset_bytes': 0,
+        'batches': 0, 'max_batch_seconds': 0.0
+    }
+
+    try:
+        purge = _Purge(write_cursor, report, stop_event)
+        for plan, days in RETENTION_DAYS.items():
+            if days <= 0:
+                continue
+            cutoff = _cutoff(write_cursor, days)
+            # Documents without a user are kept as long as on the free plan
+            if plan == 'free':
+                purge.add_user(plan, None, cutoff)
+            # Users are read ahead a page at a time, so deletes can run in between
+            for user_id in _plan_users(read_cursor, plan):
+                if purge.stopped:
+                    break
+                purge.add_user(plan, user_id, cutoff)
+            purge.flush(plan)
+        return report
+    finally:
+        read_cursor.close()
+        write_cursor.close()
+        conn.close()
+
+def count_expired():
+    """Count the documents each plan would purge, without deleting anything"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    counts = {}
+
+    try:
+        for plan, days in RETENTION_DAYS.items():
+            if days <= 0:
+                continue
+            cursor.execute(
+                """
+                SELECT COUNT(*)
+                FROM documents d
+                LEFT JOIN users u ON u.id = d.user_id
+                WHERE COALESCE(u.subscription, 'free') = ? AND d.created_at < ?
+                """,
+                (plan, _cutoff(cursor, days))
+            )
+            counts[plan] = cursor.fetchone()[0]
+        return counts
+    finally:
+        cursor.close()
+        conn.close()
+
+def enable_incremental_vacuum():
+    """Switch the database to auto_vacuum = INCREMENTAL; runs a full VACUUM if needed"""
+    conn = get_db_connection()
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+def incremental_vacuum(stop_event=None):
+    """
+    Return free pages to the filesystem in steps of VACUUM_STEP_PAGES
+
+    Returns the pages and bytes reclaimed, or None if the database isn't in
+    incremental auto_vacuum mode.
+    """
+    conn = get_db_connection()
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            return None
+
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        remaining = free_pages
+        while remaining > 0 and not (stop_event is not None and stop_event.is_set()):
+            conn.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})").fetchall()
+            remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if remaining > 0 and RETENTION_BATCH_PAUSE_SECONDS > 0:
+                time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+
+        # The file only shrinks once the WAL is checkpointed
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        reclaimed = free_pages - remaining
+        return {'pages': reclaimed, 'bytes': reclaimed * page_size}
+    finally:
+        conn.close()
+
+def run_retention(stop_event=None, vacuum=True):
+    """Purge expired documents, then vacuum; returns the combined report"""
+    started = time.perf_counter()
+    report = purge_expired(stop_event)
+    report['vacuum'] = incremental_vacuum(stop_event) if vacuum and report['documents'] else None
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+def format_report(report):
+    """Format a retention report for printing"""
+    lines = [
+        f"Purged {report['documents']} documents in {report['batches']} batches "
+        f"({report['seconds']:.2f}s, longest batch {report['max_batch_seconds']:.3f}s)"
+    ]
+    for plan, plan_report in report['plans'].items():
+        lines.append(
+            f"  {plan}: {plan_report['documents']} documents, {plan_report['content_bytes']} bytes of content, "
+            f"{plan_report['stored_bytes']} bytes stored"
+        )
+    lines.append(
+        f"  {report['credit_transactions']} credit transactions detached, "
+        f"{report['assets']} assets ({report['asset_bytes']} bytes) deleted"
+    )
+    vacuum = report.get('vacuum')
+    if vacuum is not None:
+        lines.append(f"  {vacuum['pages']} pages ({vacuum['bytes']} bytes) returned to the filesystem")
+    elif report['documents']:
+        lines.append("  Freed pages kept for reuse (run with --enable-incremental-vacuum to return them)")
+    return "\n".join(lines)
+
+_scheduler_thread = None
+_scheduler_lock = threading.Lock()
+_scheduler_stop = threading.Event()
+
+def _run_scheduler():
+    while not _scheduler_stop.is_set():
+        try:
+            report = run_retention(_scheduler_stop)
+            if report['documents']:
+                print(format_report(report))
+        except Exception as e:
+            print(f"Retention purge failed: {str(e)}")
+        _scheduler_stop.wait(RETENTION_INTERVAL_SECONDS)
+
+def start_retention_scheduler():
+    """Run the retention purge every RETENTION_INTERVAL_SECONDS on a daemon thread, once per process"""
+    global _scheduler_thread
+    if RETENTION_INTERVAL_SECONDS <= 0:
+        return None
+    with _scheduler_lock:
+        if _scheduler_thread is None:
+            _scheduler_thread = threading.Thread(
+                target=_run_scheduler,
+                name="retention-purge",
+                daemon=True
+            )
+            _scheduler_thread.start()
+    return _scheduler_thread
+
+def stop_retention_scheduler():
+    """Ask the scheduler to stop after the current batch"""
+    _scheduler_stop.set()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delete documents past their plan's retention period")
+    parser.add_argument("--dry-run", action="store_true", help="Count expired documents per plan without deleting")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="Switch the database to incremental auto_vacuum first (runs a full VACUUM once)")
+    parser.add_argument("--no-vacuum", action="store_true", help="Don't run incremental_vacuum after the purge")
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        for plan, count in count_expired().items():
+            print(f"{plan}: {count} expired documents ({RETENTION_DAYS[plan]} day retention)")
+        return 0
+
+    if args.enable_incremental_vacuum and enable_incremental_vacuum():
+        print("Switched the database to incremental auto_vacuum")
+
+    print(format_report(run_retention(vacuum=not args.no_vacuum)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
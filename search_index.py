@@ -0,0 +1,148 @@
+# Full-text search over generated documents
+#
+# documents_search is a contentless FTS5 table: it keeps only the index, not a
+# second copy of the text, so it adds little on top of the compressed content.
+# Its columns are the title, the visible text of the HTML and the values of
+# the key parameters (client names, invoice numbers, ...). Triggers on
+# documents keep it in sync, calling the SQL functions that db.py registers on
+# every connection, so documents can't be written from a connection without
+# them.
+#
+# Every user owns a block of OWNER_BLOCK_SIZE rowids (search_owners.id times
+# the block size, numbered by search_owners.last_row), and
+# document_search_rows maps each FTS rowid to its document. A query is
+# limited to the owner's rowid range, which FTS5 seeks to directly, so its
+# cost depends on the user's own documents rather than on everyone's. These
+# are INTEGER PRIMARY KEY rowids, which VACUUM keeps (documents.rowid may be
+# renumbered).
+#
+# A contentless table removes a row by being given the exact values that were
+# indexed, which the triggers recompute from the old row. document_text() and
+# document_keywords() must therefore stay deterministic; changing what they
+# return (e.g. SEARCH_KEYWORD_FIELDS) needs a migration that rebuilds the index.
+
+import os
+import re
+import json
+from rai import strip_html
+from storage_codec import decode_content
+
+# Search settings (override with environment variables)
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+MAX_SEARCH_PAGE_SIZE = 100
+
+# Longest query accepted, in whitespace separated words
+MAX_SEARCH_WORDS = 16
+
+# Parameters indexed as keywords, so they outrank a mention in the body
+SEARCH_KEYWORD_FIELDS = (
+    "invoice_number", "proposal_id", "project_number", "client_name", "company_name",
+    "business_name", "contractor_name", "recipient_name", "sender_name",
+    "client_contact_name", "project_name", "proposal_title", "subject"
+)
+
+# bm25 weights of the title, body and keywords columns
+SEARCH_RANK_WEIGHTS = (10.0, 1.0, 5.0)
+
+# Rowids per user in documents_search (see the migration in migrations.py)
+OWNER_BLOCK_SIZE = 2 ** 32
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def document_text(content, content_blob, content_codec):
+    """Get the visible text of a stored document"""
+    return strip_html(decode_content(content, content_blob, content_codec) or "")
+
+def document_keywords(parameters):
+    """Get the values of the key parameters from the stored parameters JSON"""
+    try:
+        values = json.loads(parameters) if parameters else {}
+    except ValueError:
+        return ""
+    if not isinstance(values, dict):
+        return ""
+    return " ".join(str(values[field]) for field in SEARCH_KEYWORD_FIELDS if values.get(field))
+
+def register_functions(conn):
+    """Register the functions the search triggers call on a connection"""
+    conn.create_function("document_text", 3, document_text, deterministic=True)
+    conn.create_function("document_keywords", 1, document_keywords, deterministic=True)
+
+def build_match_query(query):
+    """
+    Turn free text into an FTS5 query
+
+    Each word becomes a phrase of its tokens (so "INV-2024-001" matches as
+    written); a word ending in "*" matches as a prefix. Words are stemmed by
+    the index, so "agreement" also finds "agreements". Raises ValueError if
+    the query has nothing to search for.
+    """
+    phrases = []
+    for word in query.split()[:MAX_SEARCH_WORDS]:
+        tokens = _TOKEN_RE.findall(word)
+        if tokens:
+            phrases.append('"' + " ".join(tokens) + '"' + ("*" if word.endswith("*") else ""))
+    if not phrases:
+        raise ValueError("Search query is empty")
+
+    return " ".join(phrases)
+
+def search_documents(user_id, query, limit=SEARCH_PAGE_SIZE, offset=0, doc_type=None):
+    """
+    Search a user's documents, best match first
+
+    Covers the same documents as the history (created within
+    db.HISTORY_WINDOW). Returns (documents, next_offset); next_offset is
+    None on the last page.
+    """
+    if not 1 <= limit <= MAX_SEARCH_PAGE_SIZE:
+        raise ValueError(f"Page size must be between 1 and {MAX_SEARCH_PAGE_SIZE}")
+    if offset < 0:
+        raise ValueError("Offset must not be negative")
+
+    match = build_match_query(query)
+
+    # Imported here because db registers this module's functions
+    from db import get_db_connection, HISTORY_WINDOW
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT id FROM search_owners WHERE user_id = ?", (user_id,))
+        owner = cursor.fetchone()
+        if owner is None:
+            return [], None
+
+        first_row = owner[0] * OWNER_BLOCK_SIZE
+        conditions = [
+            "documents_search MATCH ?", "s.rowid BETWEEN ? AND ?", "d.created_at >= DATE('now', ?)"
+        ]
+        params = [match, first_row, first_row + OWNER_BLOCK_SIZE - 1, HISTORY_WINDOW]
+        if doc_type:
+            conditions.append("d.doc_type = ?")
+            params.append(doc_type)
+
+        # One extra row tells whether there is a next page
+        cursor.execute(
+            f"""
+            SELECT d.id, d.doc_type, d.title, d.created_at, d.rai_score
+            FROM documents_search s
+            JOIN document_search_rows r ON r.rowid = s.rowid
+            JOIN documents d ON d.id = r.document_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY bm25(documents_search, {", ".join("?" * len(SEARCH_RANK_WEIGHTS))}), s.rowid
+            LIMIT ? OFFSET ?
+            """,
+            (*params, *SEARCH_RANK_WEIGHTS, limit + 1, offset)
+        )
+        documents = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    next_offset = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_offset = offset + limit
+    return documents, next_offset
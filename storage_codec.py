@@ -0,0 +1,349 @@
+# Compressed storage for generated document content
+#
+# Document HTML is stored zlib-compressed in documents.content_blob, with
+# documents.content left empty. Each document type gets a preset dictionary
+# built from the static markup of its template (the inline styles and
+# boilerplate that every document of that type repeats), so even short
+# documents compress well. Dictionaries are stored in compression_dicts and
+# never change once written; content_codec records which one a row uses:
+#
+#   NULL       - plain text in documents.content
+#   zlib       - zlib without a dictionary
+#   zlib:<id>  - zlib with compression_dicts row <id>
+#
+# documents.content_size holds the uncompressed size in bytes for quota
+# accounting. Reads go through the document_content() SQL function that
+# db.py registers on every connection.
+#
+# Usage:
+#   python storage_codec.py                      # compress existing plain text rows
+#   python storage_codec.py --stats              # show stored vs. uncompressed sizes
+
+import os
+import sys
+import time
+import zlib
+import hashlib
+import argparse
+import threading
+
+# Compression settings (override with environment variables)
+CONTENT_COMPRESSION = os.getenv("CONTENT_COMPRESSION", "zlib").lower()
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "256"))
+COMPRESS_BATCH_SIZE = int(os.getenv("COMPRESS_BATCH_SIZE", "200"))
+COMPRESS_BATCH_PAUSE_SECONDS = float(os.getenv("COMPRESS_BATCH_PAUSE_SECONDS", "0.05"))
+
+if CONTENT_COMPRESSION not in ('zlib', 'off'):
+    raise ValueError(f"Invalid CONTENT_COMPRESSION '{CONTENT_COMPRESSION}'")
+
+# zlib only looks back 32 KB, so a longer dictionary is wasted
+MAX_DICTIONARY_BYTES = 32 * 1024
+
+CODEC_ZLIB = 'zlib'
+
+class CodecError(RuntimeError):
+    """Raised when stored content can't be decoded"""
+
+# dictionary id -> bytes, and doc_type -> (dictionary id, bytes); committed
+# dictionaries only, so a rolled back id is never reused from here
+_dictionaries = {}
+_current_dictionaries = {}
+# dictionary id -> bytes of dictionaries written in a transaction that may
+# not have committed yet (read back by the search triggers while it's open)
+_pending_dictionaries = {}
+_dictionary_lock = threading.Lock()
+
+def build_dictionary(doc_type):
+    """Build a preset dictionary from the static markup of a document type's templates"""
+    from templates.engine import CompiledTemplate
+    from templates.registry import get_registry
+
+    registry = get_registry()
+    if doc_type not in registry:
+        return b""
+
+    segments = []
+    for value in vars(registry.get(doc_type).module).values():
+        if isinstance(value, CompiledTemplate):
+            segments.extend(value.static_text())
+
+    # zlib favours matches near the end of the dictionary, so keep the tail
+    dictionary = "".join(segments).encode("utf-8")
+    return dictionary[-MAX_DICTIONARY_BYTES:]
+
+def _store_dictionary(cursor, doc_type, digest, dictionary):
+    """Insert a dictionary unless it exists; returns its id"""
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO compression_dicts (doc_type, digest, dictionary)
+        VALUES (?, ?, ?)
+        """,
+        (doc_type, digest, dictionary)
+    )
+    cursor.execute(
+        "SELECT id FROM compression_dicts WHERE doc_type = ? AND digest = ?",
+        (doc_type, digest)
+    )
+    return cursor.fetchone()[0]
+
+def get_dictionary(cursor, doc_type):
+    """
+    Get (id, bytes) of the current dictionary for a document type, storing it if new
+
+    A new dictionary is committed on a connection of its own before it is
+    used and cached. If the caller's connection is already in a transaction
+    (which may hold the write lock), it is written in that transaction
+    instead and only cached once a later call finds it committed, so a
+    rollback can't leave cached ids that no row backs.
+    """
+    current = _current_dictionaries.get(doc_type)
+    if current is not None:
+        return current
+
+    dictionary = build_dictionary(doc_type)
+    if not dictionary:
+        with _dictionary_lock:
+            _current_dictionaries[doc_type] = (None, b"")
+        return None, b""
+
+    # Imported here because db registers document_content() from this module
+    from db import get_db_connection
+
+    digest = hashlib.sha256(dictionary).hexdigest()
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            "SELECT id FROM compression_dicts WHERE doc_type = ? AND digest = ?",
+            (doc_type, digest)
+        ).fetchone()
+        if row is None and cursor.connection.in_transaction:
+            dictionary_id = _store_dictionary(cursor, doc_type, digest, dictionary)
+            with _dictionary_lock:
+                _pending_dictionaries[dictionary_id] = dictionary
+            return dictionary_id, dictionary
+
+        if row is None:
+            store = conn.cursor()
+            try:
+                dictionary_id = _store_dictionary(store, doc_type, digest, dictionary)
+                conn.commit()
+            finally:
+                store.close()
+        else:
+            dictionary_id = row[0]
+    finally:
+        conn.close()
+
+    current = (dictionary_id, dictionary)
+    with _dictionary_lock:
+        _dictionaries[dictionary_id] = dictionary
+        _current_dictionaries[doc_type] = current
+        _pending_dictionaries.pop(dictionary_id, None)
+    return current
+
+def _load_dictionary(dictionary_id):
+    """Get a stored dictionary by id, reading it on a separate connection if not cached"""
+    dictionary = _dictionaries.get(dictionary_id)
+    if dictionary is not None:
+        return dictionary
+
+    # Imported here because db registers document_content() from this module
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            "SELECT dictionary FROM compression_dicts WHERE id = ?", (dictionary_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        # Written by a transaction of this process that is still open
+        dictionary = _pending_dictionaries.get(dictionary_id)
+        if dictionary is not None:
+            return dictionary
+        raise CodecError(f"Compression dictionary {dictionary_id} does not exist")
+
+    with _dictionary_lock:
+        _dictionaries[dictionary_id] = row[0]
+    return row[0]
+
+def encode_content(cursor, doc_type, content):
+    """
+    Encode document content for storage
+
+    Returns (content, content_blob, content_codec, content_size) column values.
+    Content that is small or doesn't shrink is kept as plain text.
+    """
+    raw = content.encode("utf-8")
+    size = len(raw)
+    if CONTENT_COMPRESSION == 'off' or size < COMPRESS_MIN_BYTES:
+        return content, None, None, size
+
+    dictionary_id, dictionary = get_dictionary(cursor, doc_type)
+    if dictionary:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=dictionary)
+        codec = f"{CODEC_ZLIB}:{dictionary_id}"
+    else:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL)
+        codec = CODEC_ZLIB
+    blob = compressor.compress(raw) + compressor.flush()
+
+    if len(blob) >= size:
+        return content, None, None, size
+    return "", blob, codec, size
+
+def decode_content(content, content_blob, content_codec):
+    """Get the document HTML from its stored column values"""
+    if content_codec is None:
+        return content
+
+    codec, _, dictionary_id = content_codec.partition(":")
+    if codec != CODEC_ZLIB:
+        raise CodecError(f"Unknown content codec '{content_codec}'")
+
+    if dictionary_id:
+        decompressor = zlib.decompressobj(zdict=_load_dictionary(int(dictionary_id)))
+    else:
+        decompressor = zlib.decompressobj()
+    return (decompressor.decompress(content_blob) + decompressor.flush()).decode("utf-8")
+
+def register_functions(conn):
+    """Register document_content(content, content_blob, content_codec) on a connection"""
+    conn.create_function("document_content", 3, decode_content, deterministic=True)
+
+def compress_batch(cursor, after_rowid, batch_size=COMPRESS_BATCH_SIZE):
+    """
+    Encode one batch of plain text rows after a rowid
+
+    Returns (last rowid seen, rows compressed), or (None, 0) when no rows are left.
+    """
+    cursor.execute(
+        """
+        SELECT rowid, id, doc_type, content
+        FROM documents
+        WHERE rowid > ? AND content_codec IS NULL AND content_size IS NULL
+        ORDER BY rowid
+        LIMIT ?
+        """,
+        (after_rowid, batch_size)
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None, 0
+
+    compressed = 0
+    for rowid, doc_id, doc_type, content in rows:
+        values = encode_content(cursor, doc_type, content)
+        # Plain rows still get their size, so they aren't picked up again
+        cursor.execute(
+            """
+            UPDATE documents
+            SET content = ?, content_blob = ?, content_codec = ?, content_size = ?
+            WHERE id = ? AND content_codec IS NULL
+            """,
+            (*values, doc_id)
+        )
+        compressed += values[2] is not None
+
+    return rows[-1][0], compressed
+
+def compress_existing(batch_size=COMPRESS_BATCH_SIZE, pause=COMPRESS_BATCH_PAUSE_SECONDS, stop_event=None):
+    """
+    Compress documents stored as plain text, one short transaction per batch
+
+    Returns the number of rows compressed.
+    """
+    from db import get_db_connection
+
+    if CONTENT_COMPRESSION == 'off':
+        return 0
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    after_rowid = 0
+    total = 0
+
+    try:
+        while stop_event is None or not stop_event.is_set():
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                after_rowid, compressed = compress_batch(cursor, after_rowid, batch_size)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+            if after_rowid is None:
+                break
+            total += compressed
+            # Give foreground writers a chance at the write lock
+            time.sleep(pause)
+        return total
+    finally:
+        cursor.close()
+        conn.close()
+
+_background_thread = None
+_background_lock = threading.Lock()
+
+def _run_background_compression():
+    try:
+        compressed = compress_existing()
+        if compressed:
+            print(f"Compressed {compressed} stored documents")
+    except Exception as e:
+        print(f"Background document compression failed: {str(e)}")
+
+def start_background_compression():
+    """Compress existing plain text documents on a daemon thread, once per process"""
+    global _background_thread
+    with _background_lock:
+        if _background_thread is None:
+            _background_thread = threading.Thread(
+                target=_run_background_compression,
+                name="document-compression",
+                daemon=True
+            )
+            _background_thread.start()
+    return _background_thread
+
+def get_storage_stats():
+    """Get row counts and stored vs. uncompressed content bytes"""
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            """
+            SELECT COUNT(*) AS documents,
+                   COALESCE(SUM(content_codec IS NOT NULL), 0) AS compressed,
+                   COALESCE(SUM(LENGTH(CAST(content AS BLOB)) + COALESCE(LENGTH(content_blob), 0)), 0) AS stored_bytes,
+                   COALESCE(SUM(COALESCE(content_size, LENGTH(CAST(content AS BLOB)))), 0) AS content_bytes
+            FROM documents
+            """
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compress stored document content")
+    parser.add_argument("--stats", action="store_true", help="Show stored vs. uncompressed sizes")
+    args = parser.parse_args(argv)
+
+    if not args.stats:
+        print(f"Compressed {compress_existing(pause=0)} documents")
+
+    stats = get_storage_stats()
+    ratio = stats['stored_bytes'] / stats['content_bytes'] if stats['content_bytes'] else 1.0
+    print(
+        f"{stats['compressed']} of {stats['documents']} documents compressed, "
+        f"{stats['stored_bytes']} bytes stored for {stats['content_bytes']} bytes of content ({ratio:.1%})"
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
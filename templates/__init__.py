@@ -1,6 +1,2 @@
-# Import all template generators for easy access
-from templates.nda_template import generate as nda_generate
-from templates.invoice_template import generate as invoice_generate
-from templates.letter_of_intent_template import generate as letter_of_intent_generate
-from templates.proposal_template import generate as proposal_generate
-from templates.scope_of_work_template import generate as scope_of_work_generate
+# Document templates are discovered and imported lazily through the registry
+from templates.registry import get_registry, get_document_type
@@ -0,0 +1,270 @@
+# Minimal precompiled template engine used by the document templates
+#
+# Syntax:
+#   {{ name }} / {{ item.field }}          placeholder
+#   {% if name %}...{% else %}...{% endif %} conditional block (truthiness)
+#   {% for item in items %}...{% endfor %}  loop block
+#   {% for a, b in rows %}...{% endfor %}   loop over tuples, unpacking them
+#
+# Templates are compiled once at import: the source is split into static
+# segments, placeholders and blocks, which are then turned into a Python
+# render function that appends to a single list that is joined once. Each
+# run of static text and placeholders becomes a single f-string append, so
+# a loop body costs about what the same f-string written by hand would.
+#
+# sections() splits a template into independently renderable pieces, each
+# knowing the context names it reads, so a caller can re-render only the
+# pieces whose inputs changed (see templates/preview.py).
+
+import re
+
+_TOKEN_RE = re.compile(r'(\{\{.*?\}\}|\{%.*?%\})', re.DOTALL)
+_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+
+class TemplateError(ValueError):
+    """Raised when a template can't be compiled or rendered"""
+
+# Node kinds
+_TEXT, _VAR, _IF, _FOR = range(4)
+
+def _parse_name(expression, name):
+    """Split a dotted name into its lookup path"""
+    expression = expression.strip()
+    if not _NAME_RE.match(expression):
+        raise TemplateError(f"Invalid expression '{expression}' in template '{name}'")
+    return tuple(expression.split('.'))
+
+def _context_get(context, name):
+    """Look up a top-level template variable"""
+    try:
+        return context[name]
+    except KeyError:
+        raise TemplateError(f"Missing template variable '{name}'")
+
+def _attr(value, name):
+    """Resolve one step of a dotted name (dict key or attribute)"""
+    return value[name] if value.__class__ is dict else getattr(value, name)
+
+class CompiledTemplate:
+    """A template compiled into static segments, placeholders and blocks"""
+
+    def __init__(self, source, name='<template>', nodes=None):
+        self.name = name
+        self.nodes = self._compile(source) if nodes is None else nodes
+        self._renderer = self._build_renderer()
+        self._sections = None
+
+    def _compile(self, source):
+        root = []
+        stack = [('root', root, None)]
+
+        for token in _TOKEN_RE.split(source):
+            if not token:
+                continue
+
+            nodes = stack[-1][1]
+
+            if token.startswith('{{'):
+                nodes.append((_VAR, _parse_name(token[2:-2], self.name)))
+
+            elif token.startswith('{%'):
+                words = token[2:-2].split()
+                tag = words[0] if words else ''
+
+                if tag == 'if' and len(words) == 2:
+                    node = [_IF, _parse_name(words[1], self.name), [], []]
+                    nodes.append(node)
+                    stack.append(('if', node[2], node))
+
+                elif tag == 'else' and len(words) == 1 and stack[-1][0] == 'if':
+                    _, _, node = stack.pop()
+                    stack.append(('else', node[3], node))
+
+                elif tag == 'endif' and stack[-1][0] in ('if', 'else'):
+                    stack.pop()
+
+                elif tag == 'for' and len(words) >= 4 and words[-2] == 'in':
+                    node = [_FOR, self._parse_targets(words[1:-2]), _parse_name(words[-1], self.name), []]
+                    nodes.append(node)
+                    stack.append(('for', node[3], node))
+
+                elif tag == 'endfor' and stack[-1][0] == 'for':
+                    stack.pop()
+
+                else:
+                    raise TemplateError(f"Unexpected tag '{token}' in template '{self.name}'")
+
+            else:
+                # Merge adjacent static text into a single segment
+                if nodes and nodes[-1][0] == _TEXT:
+                    nodes[-1] = (_TEXT, nodes[-1][1] + token)
+                else:
+                    nodes.append((_TEXT, token))
+
+        if len(stack) > 1:
+            raise TemplateError(f"Unclosed '{stack[-1][0]}' block in template '{self.name}'")
+
+        return [tuple(node) if isinstance(node, list) else node for node in root]
+
+    def _parse_targets(self, words):
+        """Parse the loop variable(s) of a for tag into a tuple of names"""
+        targets = tuple(target.strip() for target in " ".join(words).split(","))
+        for target in targets:
+            if not target.isidentifier():
+                raise TemplateError(f"Invalid loop variable '{target}' in template '{self.name}'")
+        return targets
+
+    def _generate_code(self):
+        """Generate the Python source of a render function for the node tree"""
+        lines = ["def render(context, out):", "    append = out.append"]
+
+        def expr(path, loop_vars):
+            if path[0] in loop_vars:
+                code = loop_vars[path[0]]
+            else:
+                code = f"_context_get(context, {path[0]!r})"
+            for part in path[1:]:
+                code = f"_attr({code}, {part!r})"
+            return code
+
+        def value_expr(path, loop_vars):
+            if len(path) == 2 and path[0] in loop_vars:
+                # Inline the common loop item lookup
+                item = loop_vars[path[0]]
+                return (
+                    f"({item}[{path[1]!r}] if {item}.__class__ is dict "
+                    f"else getattr({item}, {path[1]!r}))"
+                )
+            return expr(path, loop_vars)
+
+        def emit_run(run, pad, loop_vars):
+            # Static text and placeholders in one f-string; values are read
+            # into locals first so the f-string holds only plain names
+            parts = []
+            for node in run:
+                if node[0] == _TEXT:
+                    parts.append(node[1].replace("{", "{{").replace("}", "}}"))
+                elif len(node[1]) == 1 and node[1][0] in loop_vars:
+                    parts.append("{" + loop_vars[node[1][0]] + "}")
+                else:
+                    local = f"_v{len(lines)}"
+                    lines.append(f"{pad}{local} = {value_expr(node[1], loop_vars)}")
+                    parts.append("{" + local + "}")
+            lines.append(f"{pad}append(f{''.join(parts)!r})")
+
+        def emit(nodes, indent, loop_vars):
+            pad = "    " * indent
+            run = []
+            for node in nodes:
+                kind = node[0]
+                if kind == _TEXT or kind == _VAR:
+                    run.append(node)
+                    continue
+                if run:
+                    emit_run(run, pad, loop_vars)
+                    run = []
+                if kind == _IF:
+                    lines.append(f"{pad}if {value_expr(node[1], loop_vars)}:")
+                    lines.append(f"{pad}    pass")
+                    emit(node[2], indent + 1, loop_vars)
+                    if node[3]:
+                        lines.append(f"{pad}else:")
+                        lines.append(f"{pad}    pass")
+                        emit(node[3], indent + 1, loop_vars)
+                else:
+                    names = {target: f"_loop{len(lines)}_{index}" for index, target in enumerate(node[1])}
+                    lines.append(f"{pad}for {', '.join(names.values())} in {expr(node[2], loop_vars)} or ():")
+                    lines.append(f"{pad}    pass")
+                    emit(node[3], indent + 1, {**loop_vars, **names})
+            if run:
+                emit_run(run, pad, loop_vars)
+
+        emit(self.nodes, 1, {})
+        return "\n".join(lines)
+
+    def _build_renderer(self):
+        """Compile the node tree into a Python function"""
+        source = self._generate_code()
+        namespace = {
+            "_context_get": _context_get,
+            "_attr": _attr
+        }
+        exec(compile(source, f"<template {self.name}>", "exec"), namespace)
+        return namespace["render"]
+
+    def static_text(self):
+        """Get the template's static segments in document order"""
+        segments = []
+
+        def collect(nodes):
+            for node in nodes:
+                if node[0] == _TEXT:
+                    segments.append(node[1])
+                elif node[0] == _IF:
+                    collect(node[2])
+                    collect(node[3])
+                elif node[0] == _FOR:
+                    collect(node[3])
+
+        collect(self.nodes)
+        return segments
+
+    def names(self):
+        """Get the top-level context names the template reads"""
+        names = set()
+
+        def collect(nodes, loop_vars):
+            for node in nodes:
+                kind = node[0]
+                if kind == _VAR or kind == _IF:
+                    if node[1][0] not in loop_vars:
+                        names.add(node[1][0])
+                if kind == _IF:
+                    collect(node[2], loop_vars)
+                    collect(node[3], loop_vars)
+                elif kind == _FOR:
+                    if node[2][0] not in loop_vars:
+                        names.add(node[2][0])
+                    collect(node[3], loop_vars | set(node[1]))
+
+        collect(self.nodes, frozenset())
+        return frozenset(names)
+
+    def sections(self):
+        """
+        Split the template into consecutive sections that render independently
+
+        Each section ends at a top-level placeholder or block, so joining the
+        sections' output gives the same result as rendering the whole template.
+        """
+        if self._sections is None:
+            sections = []
+            current = []
+            for node in self.nodes:
+                current.append(node)
+                if node[0] != _TEXT:
+                    sections.append(current)
+                    current = []
+            if current:
+                sections.append(current)
+
+            self._sections = [
+                CompiledTemplate(None, f"{self.name}[{index}]", nodes)
+                for index, nodes in enumerate(sections)
+            ]
+        return self._sections
+
+    def render_parts(self, context, out=None):
+        """Render into a list of string parts (appending to out if given)"""
+        if out is None:
+            out = []
+        self._renderer(context, out)
+        return out
+
+    def render(self, context):
+        """Render the template to a string with a single join"""
+        return ''.join(self.render_parts(context))
+
+def compile_template(source, name='<template>'):
+    """Compile template source once, typically at module import"""
+    return CompiledTemplate(source, name)
@@ -1,7 +1,19 @@
 # Invoice Template
 
 import datetime
-import os
+from itertools import islice
+from asset_store import register_file, asset_ref
+from templates.engine import compile_template
+from templates.schema import build_schema
+from invoice_totals import (
+    LineItemColumns, InvoiceTotals, parse_tax_classes, format_money, format_rate
+)
+
+# Document type metadata used by the registry
+DISPLAY_NAME = "Invoice"
+DESCRIPTION = "A commercial document issued by a seller to a buyer, indicating the products, quantities, and agreed prices for products or services provided."
+CREDITS = 3
+SORT_ORDER = 2
 
 # Define the parameter structure for this document type
 PARAMETERS = [
@@ -123,7 +135,7 @@ PARAMETERS = [
                 "label": "Line Items (one per line in format: Description | Quantity | Unit Price)",
                 "type": "textarea",
                 "required": True,
-                "help": "Enter each item on a new line in the format: Description | Quantity | Unit Price"
+                "help": "Enter each item on a new line in the format: Description | Quantity | Unit Price. Optionally add | Tax Class | Discount (an amount or a percentage like 10%). Line amounts are shown rounded to the cent; totals are computed from the unrounded amounts"
             },
             {
                 "id": "tax_rate",
@@ -133,6 +145,13 @@ PARAMETERS = [
                 "default": 0,
                 "help": "Tax rate as a percentage (e.g., 7.5 for 7.5%)"
             },
+            {
+                "id": "tax_classes",
+                "label": "Tax Classes (one per line in format: Class | Rate)",
+                "type": "textarea",
+                "required": False,
+                "help": "Additional tax classes that line items can reference (e.g., Reduced | 5). Lines without a class use the tax rate above"
+            },
             {
                 "id": "shipping",
                 "label": "Shipping/Handling Fee",
@@ -164,93 +183,38 @@ PARAMETERS = [
     }
 ]
 
-def generate(parameters):
-    # Extract parameters
-    business_name = parameters.get('business_name', '')
-    business_address = parameters.get('business_address', '')
-    business_phone = parameters.get('business_phone', '')
-    business_email = parameters.get('business_email', '')
-    
-    client_name = parameters.get('client_name', '')
-    client_address = parameters.get('client_address', '')
-    client_phone = parameters.get('client_phone', '')
-    client_email = parameters.get('client_email', '')
-    
-    invoice_number = parameters.get('invoice_number', '')
-    invoice_date = parameters.get('invoice_date', '')
-    due_date = parameters.get('due_date', '')
-    payment_terms = parameters.get('payment_terms', '')
-    
-    line_items_text = parameters.get('line_items', '')
-    tax_rate = float(parameters.get('tax_rate', 0))
-    shipping = float(parameters.get('shipping', 0))
-    notes = parameters.get('notes', '')
-    payment_instructions = parameters.get('payment_instructions', '')
-    
-    # Process line items
-    line_items = []
-    subtotal = 0
-    
-    for line in line_items_text.split('\n'):
-        if line.strip():
-            parts = [part.strip() for part in line.split('|')]
-            if len(parts) == 3:
-                desc, qty, price = parts
-                try:
-                    qty = float(qty)
-                    price = float(price)
-                    amount = qty * price
-                    subtotal += amount
-                    line_items.append({
-                        'description': desc,
-                        'quantity': qty,
-                        'unit_price': price,
-                        'amount': amount
-                    })
-                except ValueError:
-                    continue
-
-    # Calculate totals
-    tax_amount = subtotal * (tax_rate / 100)
-    total = subtotal + tax_amount + shipping
+# Schema index for validation, built once at import
+SCHEMA = build_schema(PARAMETERS)
 
-    # Check if company logo exists
-    company_logo = parameters.get('company_logo', '')
-    logo_html = ''
-    if company_logo and os.path.exists(company_logo):
-        import base64
-        with open(company_logo, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode()
-        logo_html = f'<img src="data:image/png;base64,{encoded_string}" style="max-height: 80px; max-width: 200px; margin-bottom: 15px;">'
-    
-    # Generate HTML
-    document = f"""
+# Compiled once at import; the invoice is rendered as head, batches of line
+# item rows, then tail so it can be streamed
+HEAD_TEMPLATE = compile_template("""
     <div style="max-width: 800px; margin: 0 auto; padding: 20px; font-family: Arial, sans-serif;">
         <div style="display: flex; justify-content: space-between; margin-bottom: 40px;">
             <div>
-                {logo_html}
+                {{ logo_html }}
                 <h1 style="color: #2c3e50; margin: 0; font-size: 28px;">INVOICE</h1>
                 <div style="margin-top: 20px;">
-                    <p style="margin: 5px 0;"><strong>{business_name}</strong></p>
-                    <p style="margin: 5px 0; white-space: pre-line;">{business_address}</p>
-                    <p style="margin: 5px 0;">Phone: {business_phone}</p>
-                    <p style="margin: 5px 0;">Email: {business_email}</p>
+                    <p style="margin: 5px 0;"><strong>{{ business_name }}</strong></p>
+                    <p style="margin: 5px 0; white-space: pre-line;">{{ business_address }}</p>
+                    <p style="margin: 5px 0;">Phone: {{ business_phone }}</p>
+                    <p style="margin: 5px 0;">Email: {{ business_email }}</p>
                 </div>
             </div>
             <div style="text-align: right;">
-                <h2 style="color: #7f8c8d; margin: 0;">Invoice #{invoice_number}</h2>
-                <p style="margin: 5px 0;">Date: {invoice_date}</p>
-                <p style="margin: 5px 0;">Due Date: {due_date}</p>
-                <p style="margin: 5px 0;">Terms: {payment_terms}</p>
+                <h2 style="color: #7f8c8d; margin: 0;">Invoice #{{ invoice_number }}</h2>
+                <p style="margin: 5px 0;">Date: {{ invoice_date }}</p>
+                <p style="margin: 5px 0;">Due Date: {{ due_date }}</p>
+                <p style="margin: 5px 0;">Terms: {{ payment_terms }}</p>
             </div>
         </div>
 
         <div style="margin-bottom: 30px;">
             <h3 style="border-bottom: 1px solid #ccc; padding-bottom: 5px;">Bill To:</h3>
-            <p style="margin: 5px 0;"><strong>{client_name}</strong></p>
-            <p style="margin: 5px 0; white-space: pre-line;">{client_address}</p>
-            <p style="margin: 5px 0;">Phone: {client_phone}</p>
-            <p style="margin: 5px 0;">Email: {client_email}</p>
+            <p style="margin: 5px 0;"><strong>{{ client_name }}</strong></p>
+            <p style="margin: 5px 0; white-space: pre-line;">{{ client_address }}</p>
+            <p style="margin: 5px 0;">Phone: {{ client_phone }}</p>
+            <p style="margin: 5px 0;">Email: {{ client_email }}</p>
         </div>
 
         <table style="width: 100%; border-collapse: collapse; margin-bottom: 30px;">
@@ -262,59 +226,144 @@ def generate(parameters):
                     <th style="padding: 10px; text-align: right; border-bottom: 2px solid #ddd;">Amount</th>
                 </tr>
             </thead>
-            <tbody>"""
+            <tbody>""", name="invoice_head")
 
-    for item in line_items:
-        document += f"""
+# Rows are the tuples of LineItemColumns.rows()
+ROWS_TEMPLATE = compile_template("""{% for description, quantity, unit_price, amount, tax_class, discount in line_items %}
                 <tr>
-                    <td style="padding: 10px; border-bottom: 1px solid #ddd;">{item['description']}</td>
-                    <td style="padding: 10px; text-align: right; border-bottom: 1px solid #ddd;">{item['quantity']}</td>
-                    <td style="padding: 10px; text-align: right; border-bottom: 1px solid #ddd;">${item['unit_price']:.2f}</td>
-                    <td style="padding: 10px; text-align: right; border-bottom: 1px solid #ddd;">${item['amount']:.2f}</td>
-                </tr>"""
+                    <td style="padding: 10px; border-bottom: 1px solid #ddd;">{{ description }}{% if tax_class %}<br><small>Tax class: {{ tax_class }}</small>{% endif %}{% if discount %}<br><small>Discount: {{ discount }}</small>{% endif %}</td>
+                    <td style="padding: 10px; text-align: right; border-bottom: 1px solid #ddd;">{{ quantity }}</td>
+                    <td style="padding: 10px; text-align: right; border-bottom: 1px solid #ddd;">${{ unit_price }}</td>
+                    <td style="padding: 10px; text-align: right; border-bottom: 1px solid #ddd;">${{ amount }}</td>
+                </tr>{% endfor %}""", name="invoice_rows")
 
-    document += f"""
+TAIL_TEMPLATE = compile_template("""
             </tbody>
         </table>
 
         <div style="margin-left: auto; width: 300px;">
             <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
                 <strong>Subtotal:</strong>
-                <span>${subtotal:.2f}</span>
-            </div>
+                <span>${{ subtotal }}</span>
+            </div>{% for tax in taxes %}
             <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
-                <strong>Tax ({tax_rate}%):</strong>
-                <span>${tax_amount:.2f}</span>
-            </div>
+                <strong>Tax ({{ tax.label }}%):</strong>
+                <span>${{ tax.amount }}</span>
+            </div>{% endfor %}
             <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
                 <strong>Shipping:</strong>
-                <span>${shipping:.2f}</span>
+                <span>${{ shipping }}</span>
             </div>
             <div style="display: flex; justify-content: space-between; margin-top: 10px; padding-top: 10px; border-top: 2px solid #2c3e50;">
                 <strong>Total:</strong>
-                <span style="font-size: 1.2em; font-weight: bold;">${total:.2f}</span>
+                <span style="font-size: 1.2em; font-weight: bold;">${{ total }}</span>
             </div>
-        </div>"""
-
-    if notes:
-        document += f"""
+        </div>{% if notes %}
         <div style="margin-top: 40px;">
             <h3 style="border-bottom: 1px solid #ccc; padding-bottom: 5px;">Notes:</h3>
-            <p style="white-space: pre-line;">{notes}</p>
-        </div>"""
-
-    if payment_instructions:
-        document += f"""
+            <p style="white-space: pre-line;">{{ notes }}</p>
+        </div>{% endif %}{% if payment_instructions %}
         <div style="margin-top: 20px;">
             <h3 style="border-bottom: 1px solid #ccc; padding-bottom: 5px;">Payment Instructions:</h3>
-            <p style="white-space: pre-line;">{payment_instructions}</p>
-        </div>"""
-
-    document += """
+            <p style="white-space: pre-line;">{{ payment_instructions }}</p>
+        </div>{% endif %}
         <div style="margin-top: 40px; text-align: center; color: #7f8c8d; font-size: 0.9em;">
             <p>Thank you for your business!</p>
         </div>
     </div>
+    """, name="invoice_tail")
+
+# Number of line item rows rendered per streamed chunk
+STREAM_ROWS_PER_CHUNK = 500
+
+# Characters of line item text split into lines at a time
+LINE_SPLIT_CHARS = 64 * 1024
+
+def iter_lines(text):
+    """Yield the lines of a string, splitting it a bounded chunk at a time rather than all at once"""
+    start = 0
+    while True:
+        end = text.find('\n', start + LINE_SPLIT_CHARS)
+        if end == -1:
+            yield from text[start:].split('\n')
+            return
+        yield from text[start:end].split('\n')
+        start = end + 1
+
+def iter_line_batches(line_items, tax_classes, batch_size):
+    """
+    Lazily parse line items into computed column batches of at most batch_size lines
+    
+    Accepts the textarea string or any iterable of lines (e.g. an open file).
+    Lines that don't parse are skipped.
+    """
+    lines = iter_lines(line_items) if isinstance(line_items, str) else iter(line_items)
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            return
+        yield LineItemColumns(tax_classes).extend_lines(batch).compute()
+
+def get_logo_html(company_logo):
+    """Build the logo image tag (an asset reference) if the logo file exists"""
+    asset_id = register_file(company_logo)
+    if asset_id:
+        return f'<img src="{asset_ref(asset_id)}" style="max-height: 80px; max-width: 200px; margin-bottom: 15px;">'
+    return ''
+
+def generate_stream(parameters, rows_per_chunk=STREAM_ROWS_PER_CHUNK):
     """
+    Generate an invoice as a stream of HTML chunks
+    
+    Line items are parsed lazily and totals are kept as running sums, so
+    memory stays bounded by rows_per_chunk regardless of the number of rows.
+    """
+    tax_classes = parse_tax_classes(parameters.get('tax_classes', ''))
+    totals = InvoiceTotals(parameters.get('tax_rate', 0), tax_classes)
+    
+    yield HEAD_TEMPLATE.render({
+        'logo_html': get_logo_html(parameters.get('company_logo', '')),
+        
+        'business_name': parameters.get('business_name', ''),
+        'business_address': parameters.get('business_address', ''),
+        'business_phone': parameters.get('business_phone', ''),
+        'business_email': parameters.get('business_email', ''),
+        
+        'client_name': parameters.get('client_name', ''),
+        'client_address': parameters.get('client_address', ''),
+        'client_phone': parameters.get('client_phone', ''),
+        'client_email': parameters.get('client_email', ''),
+        
+        'invoice_number': parameters.get('invoice_number', ''),
+        'invoice_date': parameters.get('invoice_date', ''),
+        'due_date': parameters.get('due_date', ''),
+        'payment_terms': parameters.get('payment_terms', '')
+    })
+    
+    # Render rows in batches, accumulating totals in integer cents
+    for columns in iter_line_batches(parameters.get('line_items', ''), tax_classes, rows_per_chunk):
+        if len(columns):
+            totals.add(columns)
+            yield ROWS_TEMPLATE.render({'line_items': columns.rows()})
+
+    result = totals.result(parameters.get('shipping', 0))
 
-    return document
+    yield TAIL_TEMPLATE.render({
+        'subtotal': format_money(result['subtotal']),
+        'taxes': [
+            {
+                'label': f"{tax['tax_class']} {format_rate(tax['rate'])}" if tax['tax_class'] else format_rate(tax['rate']),
+                'amount': format_money(tax['amount'])
+            }
+            for tax in result['taxes']
+        ],
+        'shipping': format_money(result['shipping']),
+        'total': format_money(result['total']),
+        
+        'notes': parameters.get('notes', ''),
+        'payment_instructions': parameters.get('payment_instructions', '')
+    })
+
+def generate(parameters):
+    """Generate an invoice document"""
+    return ''.join(generate_stream(parameters))
@@ -1,5 +1,14 @@
 # Letter of Intent Template
 
+from templates.engine import compile_template
+from templates.schema import build_schema
+
+# Document type metadata used by the registry
+DISPLAY_NAME = "Letter of Intent"
+DESCRIPTION = "A document outlining the understanding between parties that wish to enter into a contract. It sets forth the main terms of a deal."
+CREDITS = 4
+SORT_ORDER = 3
+
 # Define the parameter structure for this document type
 PARAMETERS = [
     {
@@ -182,115 +191,80 @@ PARAMETERS = [
     }
 ]
 
-def generate(parameters):
-    """Generate a letter of intent document"""
-    # Extract parameters
-    sender_name = parameters.get('sender_name', '')
-    sender_title = parameters.get('sender_title', '')
-    sender_company = parameters.get('sender_company', '')
-    sender_address = parameters.get('sender_address', '')
-    sender_phone = parameters.get('sender_phone', '')
-    sender_email = parameters.get('sender_email', '')
-    
-    recipient_name = parameters.get('recipient_name', '')
-    recipient_title = parameters.get('recipient_title', '')
-    recipient_company = parameters.get('recipient_company', '')
-    recipient_address = parameters.get('recipient_address', '')
-    
-    date = parameters.get('date', '')
-    subject = parameters.get('subject', '')
-    intent_type = parameters.get('intent_type', '')
-    
-    introduction = parameters.get('introduction', '')
-    background = parameters.get('background', '')
-    intent_details = parameters.get('intent_details', '')
-    timeline = parameters.get('timeline', '')
-    terms_conditions = parameters.get('terms_conditions', '')
-    confidentiality = parameters.get('confidentiality', '')
-    conclusion = parameters.get('conclusion', '')
+# Schema index for validation, built once at import
+SCHEMA = build_schema(PARAMETERS)
 
-    # Generate HTML document with dynamic styling
-    document = f"""
+# Compiled once at import
+TEMPLATE = compile_template("""
     <div style="max-width: 800px; margin: 0 auto; font-family: Arial, sans-serif;">
         <!-- Sender Information -->
         <div style="text-align: left; margin-bottom: 30px;">
-            <p>{sender_name}<br>
-            {sender_title}<br>
-            {sender_company}<br>
-            {sender_address}<br>
-            {sender_phone}<br>
-            {sender_email}</p>
+            <p>{{ sender_name }}<br>
+            {{ sender_title }}<br>
+            {{ sender_company }}<br>
+            {{ sender_address }}<br>
+            {{ sender_phone }}<br>
+            {{ sender_email }}</p>
         </div>
         
         <!-- Date -->
         <div style="margin-bottom: 30px;">
-            <p>{date}</p>
+            <p>{{ date }}</p>
         </div>
         
         <!-- Recipient Information -->
         <div style="margin-bottom: 30px;">
-            <p>{recipient_name}<br>
-            {recipient_title}<br>
-            {recipient_company}<br>
-            {recipient_address}</p>
+            <p>{{ recipient_name }}<br>
+            {{ recipient_title }}<br>
+            {{ recipient_company }}<br>
+            {{ recipient_address }}</p>
         </div>
         
         <!-- Subject -->
         <div style="margin-bottom: 30px;">
-            <p><strong>Subject:</strong> {subject}</p>
+            <p><strong>Subject:</strong> {{ subject }}</p>
         </div>
         
         <!-- Salutation -->
         <div style="margin-bottom: 30px;">
-            <p>Dear {recipient_name},</p>
+            <p>Dear {{ recipient_name }},</p>
         </div>
         
         <!-- Introduction -->
         <div style="margin-bottom: 20px;">
-            <p>{introduction}</p>
+            <p>{{ introduction }}</p>
         </div>
         
         <!-- Background -->
         <div style="margin-bottom: 20px;">
             <h3 style="color: var(--primary-color, #2E86C1);">Background</h3>
-            <p>{background}</p>
+            <p>{{ background }}</p>
         </div>
         
         <!-- Intent Details -->
         <div style="margin-bottom: 20px;">
             <h3 style="color: var(--primary-color, #2E86C1);">Intent Details</h3>
-            <p>{intent_details}</p>
+            <p>{{ intent_details }}</p>
         </div>
         
         <!-- Timeline -->
         <div style="margin-bottom: 20px;">
             <h3 style="color: var(--primary-color, #2E86C1);">Proposed Timeline</h3>
-            <p>{timeline}</p>
+            <p>{{ timeline }}</p>
         </div>
-    """
-    
-    # Add terms and conditions if provided
-    if terms_conditions:
-        document += f"""
+    {% if terms_conditions %}
         <div style="margin-bottom: 20px;">
             <h3 style="color: var(--primary-color, #2E86C1);">Terms and Conditions</h3>
-            <p>{terms_conditions}</p>
+            <p>{{ terms_conditions }}</p>
         </div>
-        """
-    
-    # Add confidentiality clause if provided
-    if confidentiality:
-        document += f"""
+        {% endif %}{% if confidentiality %}
         <div style="margin-bottom: 20px;">
             <h3 style="color: var(--primary-color, #2E86C1);">Confidentiality</h3>
-            <p>{confidentiality}</p>
+            <p>{{ confidentiality }}</p>
         </div>
-        """
-    
-    # Add conclusion
-    document += f"""
+        {% endif %}
         <div style="margin-bottom: 30px;">
-            <p>{conclusion}</p>
+            <p>{{ conclusion }}</p>
         </div>
         
         <!-- Closing -->
@@ -298,19 +272,52 @@ def generate(parameters):
             <p>Sincerely,</p>
             <div style="margin-top: 30px;">
                 <p>____________________<br>
-                {sender_name}<br>
-                {sender_title}<br>
-                {sender_company}</p>
+                {{ sender_name }}<br>
+                {{ sender_title }}<br>
+                {{ sender_company }}</p>
             </div>
         </div>
     </div>
     
     <style>
-    :root {{
+    :root {
         --primary-color: #2E86C1;
         --secondary-color: #2874A6;
-    }}
+    }
     </style>
-    """
-    
-    return document
+    """, name="letter_of_intent")
+
+def build_context(parameters):
+    """Build the template context for a letter of intent from its parameters"""
+    # Extract parameters
+    context = {
+        'sender_name': parameters.get('sender_name', ''),
+        'sender_title': parameters.get('sender_title', ''),
+        'sender_company': parameters.get('sender_company', ''),
+        'sender_address': parameters.get('sender_address', ''),
+        'sender_phone': parameters.get('sender_phone', ''),
+        'sender_email': parameters.get('sender_email', ''),
+        
+        'recipient_name': parameters.get('recipient_name', ''),
+        'recipient_title': parameters.get('recipient_title', ''),
+        'recipient_company': parameters.get('recipient_company', ''),
+        'recipient_address': parameters.get('recipient_address', ''),
+        
+        'date': parameters.get('date', ''),
+        'subject': parameters.get('subject', ''),
+        'intent_type': parameters.get('intent_type', ''),
+        
+        'introduction': parameters.get('introduction', ''),
+        'background': parameters.get('background', ''),
+        'intent_details': parameters.get('intent_details', ''),
+        'timeline': parameters.get('timeline', ''),
+        'terms_conditions': parameters.get('terms_conditions', ''),
+        'confidentiality': parameters.get('confidentiality', ''),
+        'conclusion': parameters.get('conclusion', '')
+    }
+
+    return context
+
+def generate(parameters):
+    """Generate a letter of intent document"""
+    return TEMPLATE.render(build_context(parameters))
@@ -1,5 +1,14 @@
 # NDA (Non-Disclosure Agreement) Template
 
+from templates.engine import compile_template
+from templates.schema import build_schema
+
+# Document type metadata used by the registry
+DISPLAY_NAME = "Non-Disclosure Agreement"
+DESCRIPTION = "A legal contract that establishes a confidential relationship between parties. Used when sensitive information needs to be shared but protected from others."
+CREDITS = 5
+SORT_ORDER = 1
+
 # Define the parameter structure for this document type
 PARAMETERS = [
     {
@@ -126,65 +135,26 @@ PARAMETERS = [
     }
 ]
 
-def generate(parameters):
-    """
-    Generate an NDA document based on the provided parameters
-    
-    Args:
-        parameters: A dictionary containing all the parameter values
-        
-    Returns:
-        HTML content for the document
-    """
-    # Format dates
-    agreement_date = parameters.get("agreement_date", "")
-    if isinstance(agreement_date, str):
-        formatted_agreement_date = agreement_date
-    else:
-        formatted_agreement_date = agreement_date.strftime("%B %d, %Y") if agreement_date else ""
-    
-    expiration_date = parameters.get("expiration_date", "")
-    formatted_expiration_date = ""
-    if expiration_date:
-        if isinstance(expiration_date, str):
-            formatted_expiration_date = expiration_date
-        else:
-            formatted_expiration_date = expiration_date.strftime("%B %d, %Y")
-    
-    # Get parameters with defaults
-    party1_name = parameters.get("party1_name", "[DISCLOSING PARTY NAME]")
-    party1_address = parameters.get("party1_address", "[DISCLOSING PARTY ADDRESS]")
-    party1_type = parameters.get("party1_type", "Corporation")
-    party1_state = parameters.get("party1_state", "[STATE]")
-    
-    party2_name = parameters.get("party2_name", "[RECEIVING PARTY NAME]")
-    party2_address = parameters.get("party2_address", "[RECEIVING PARTY ADDRESS]")
-    party2_type = parameters.get("party2_type", "Corporation")
-    party2_state = parameters.get("party2_state", "[STATE]")
-    
-    purpose = parameters.get("purpose", "[PURPOSE OF DISCLOSURE]")
-    confidential_info = parameters.get("confidential_info_definition", 
-                                      "Any information disclosed by Disclosing Party to Receiving Party, either directly or indirectly, in writing, orally or by any other means, that is designated as confidential or that reasonably should be understood to be confidential given the nature of the information and the circumstances of disclosure.")
-    governing_law = parameters.get("governing_law", "[STATE]")
-    term_years = parameters.get("term_years", "3")
-    
-    # Generate the document content
-    document = f"""
+# Schema index for validation, built once at import
+SCHEMA = build_schema(PARAMETERS)
+
+# Compiled once at import
+TEMPLATE = compile_template("""
     <h1 style="text-align: center; margin-bottom: 20px;">NON-DISCLOSURE AGREEMENT</h1>
     
-    <p>This Non-Disclosure Agreement (this "Agreement") is made and entered into as of {formatted_agreement_date} by and between:</p>
+    <p>This Non-Disclosure Agreement (this "Agreement") is made and entered into as of {{ formatted_agreement_date }} by and between:</p>
     
-    <p><strong>{party1_name}</strong>, a {party1_type} organized under the laws of {party1_state}, with its principal address at {party1_address} (the "Disclosing Party"), and</p>
+    <p><strong>{{ party1_name }}</strong>, a {{ party1_type }} organized under the laws of {{ party1_state }}, with its principal address at {{ party1_address }} (the "Disclosing Party"), and</p>
     
-    <p><strong>{party2_name}</strong>, a {party2_type} organized under the laws of {party2_state}, with its principal address at {party2_address} (the "Receiving Party").</p>
+    <p><strong>{{ party2_name }}</strong>, a {{ party2_type }} organized under the laws of {{ party2_state }}, with its principal address at {{ party2_address }} (the "Receiving Party").</p>
     
     <p>Disclosing Party and Receiving Party are sometimes referred to individually as a "Party" and collectively as the "Parties".</p>
     
     <h3>1. PURPOSE</h3>
-    <p>The Parties wish to explore a potential business relationship in connection with {purpose} (the "Purpose"). In connection with the Purpose, Disclosing Party may disclose to Receiving Party certain confidential technical and business information which Disclosing Party desires Receiving Party to treat as confidential.</p>
+    <p>The Parties wish to explore a potential business relationship in connection with {{ purpose }} (the "Purpose"). In connection with the Purpose, Disclosing Party may disclose to Receiving Party certain confidential technical and business information which Disclosing Party desires Receiving Party to treat as confidential.</p>
     
     <h3>2. CONFIDENTIAL INFORMATION</h3>
-    <p>"Confidential Information" means {confidential_info}</p>
+    <p>"Confidential Information" means {{ confidential_info }}</p>
     
     <h3>3. OBLIGATIONS OF RECEIVING PARTY</h3>
     <p>Receiving Party shall:</p>
@@ -195,13 +165,8 @@ def generate(parameters):
     <p>(e) limit access to Confidential Information to employees, agents, and representatives having a need to know in connection with the Purpose and who are bound by confidentiality obligations at least as restrictive as those contained herein.</p>
     
     <h3>4. TERM AND TERMINATION</h3>
-    <p>This Agreement shall remain in effect for {term_years} years from the date of disclosure of Confidential Information.
-    """
-    
-    if formatted_expiration_date:
-        document += f" In any case, this Agreement will expire on {formatted_expiration_date}."
-    
-    document += f"""
+    <p>This Agreement shall remain in effect for {{ term_years }} years from the date of disclosure of Confidential Information.
+    {% if formatted_expiration_date %} In any case, this Agreement will expire on {{ formatted_expiration_date }}.{% endif %}
     </p>
     <p>Notwithstanding the foregoing, Receiving Party's obligations with respect to Confidential Information that constitutes a trade secret shall continue until such information ceases to be a trade secret.</p>
     
@@ -220,7 +185,7 @@ def generate(parameters):
     <p>Nothing in this Agreement shall be construed as granting any rights under any patent, copyright, trade secret or other intellectual property right, nor shall this Agreement grant Receiving Party any rights in or to Disclosing Party's Confidential Information, except the limited right to use such information in accordance with this Agreement.</p>
     
     <h3>8. GOVERNING LAW</h3>
-    <p>This Agreement shall be governed by and construed in accordance with the laws of the State of {governing_law}, without regard to conflicts of law principles.</p>
+    <p>This Agreement shall be governed by and construed in accordance with the laws of the State of {{ governing_law }}, without regard to conflicts of law principles.</p>
     
     <h3>9. REMEDIES</h3>
     <p>The Parties acknowledge and agree that a breach of this Agreement by Receiving Party may cause irreparable harm to Disclosing Party and that Disclosing Party shall be entitled to seek injunctive relief in addition to any other remedies available at law or in equity.</p>
@@ -233,7 +198,7 @@ def generate(parameters):
     <div style="display: flex; justify-content: space-between; margin-top: 50px;">
         <div style="width: 45%;">
             <p><strong>DISCLOSING PARTY:</strong></p>
-            <p>{party1_name}</p>
+            <p>{{ party1_name }}</p>
             <p>By: ________________________________</p>
             <p>Name: _____________________________</p>
             <p>Title: ______________________________</p>
@@ -241,12 +206,63 @@ def generate(parameters):
         
         <div style="width: 45%;">
             <p><strong>RECEIVING PARTY:</strong></p>
-            <p>{party2_name}</p>
+            <p>{{ party2_name }}</p>
             <p>By: ________________________________</p>
             <p>Name: _____________________________</p>
             <p>Title: ______________________________</p>
         </div>
     </div>
+    """, name="nda")
+
+def build_context(parameters):
+    """Build the template context for an NDA from its parameters"""
+    # Format dates
+    agreement_date = parameters.get("agreement_date", "")
+    if isinstance(agreement_date, str):
+        formatted_agreement_date = agreement_date
+    else:
+        formatted_agreement_date = agreement_date.strftime("%B %d, %Y") if agreement_date else ""
+    
+    expiration_date = parameters.get("expiration_date", "")
+    formatted_expiration_date = ""
+    if expiration_date:
+        if isinstance(expiration_date, str):
+            formatted_expiration_date = expiration_date
+        else:
+            formatted_expiration_date = expiration_date.strftime("%B %d, %Y")
+    
+    # Get parameters with defaults
+    context = {
+        "formatted_agreement_date": formatted_agreement_date,
+        "formatted_expiration_date": formatted_expiration_date,
+        
+        "party1_name": parameters.get("party1_name", "[DISCLOSING PARTY NAME]"),
+        "party1_address": parameters.get("party1_address", "[DISCLOSING PARTY ADDRESS]"),
+        "party1_type": parameters.get("party1_type", "Corporation"),
+        "party1_state": parameters.get("party1_state", "[STATE]"),
+        
+        "party2_name": parameters.get("party2_name", "[RECEIVING PARTY NAME]"),
+        "party2_address": parameters.get("party2_address", "[RECEIVING PARTY ADDRESS]"),
+        "party2_type": parameters.get("party2_type", "Corporation"),
+        "party2_state": parameters.get("party2_state", "[STATE]"),
+        
+        "purpose": parameters.get("purpose", "[PURPOSE OF DISCLOSURE]"),
+        "confidential_info": parameters.get("confidential_info_definition", 
+                                            "Any information disclosed by Disclosing Party to Receiving Party, either directly or indirectly, in writing, orally or by any other means, that is designated as confidential or that reasonably should be understood to be confidential given the nature of the information and the circumstances of disclosure."),
+        "governing_law": parameters.get("governing_law", "[STATE]"),
+        "term_years": parameters.get("term_years", "3")
+    }
+    
+    return context
+
+def generate(parameters):
     """
+    Generate an NDA document based on the provided parameters
     
-    return document
+    Args:
+        parameters: A dictionary containing all the parameter values
+        
+    Returns:
+        HTML content for the document
+    """
+    return TEMPLATE.render(build_context(parameters))
@@ -0,0 +1,81 @@
+# Incremental document preview for the generation wizard
+#
+# A template module that defines TEMPLATE and build_context(parameters) is
+# previewed section by section: each section of the compiled template knows
+# the context names it reads, so after an edit only the sections whose
+# context values changed are rendered again and the cached output of the
+# others is reused. Other templates are regenerated in full, but only when
+# their parameters change.
+
+from templates.registry import get_document_type
+
+def preview_parameters(parameters):
+    """Drop empty form values so templates fall back to their placeholders"""
+    return {
+        field_id: value for field_id, value in parameters.items()
+        if value is not None and value != ''
+    }
+
+class IncrementalPreview:
+    """Cached preview of one document type, updated as its parameters are edited"""
+
+    def __init__(self, doc_type):
+        self.doc_type = doc_type
+        document_type = get_document_type(doc_type)
+        module = document_type.module
+        template = getattr(module, 'TEMPLATE', None)
+        self._build_context = getattr(module, 'build_context', None)
+
+        if template is not None and self._build_context is not None:
+            self.sections = template.sections()
+            self.dependencies = [section.names() for section in self.sections]
+        else:
+            self.sections = None
+            self.dependencies = None
+        self._generate = document_type.generate
+
+        self._parameters = None
+        self._context = None
+        self._parts = None
+        self.html = None
+
+        # Sections rendered by the last update, and in total
+        self.last_rendered = 0
+        self.rendered = 0
+
+    def _changed_names(self, context):
+        """Get the context names whose values differ from the last update"""
+        previous = self._context
+        changed = {name for name, value in context.items()
+                   if name not in previous or previous[name] != value}
+        changed.update(name for name in previous if name not in context)
+        return changed
+
+    def update(self, parameters):
+        """Get the preview HTML for the parameters, re-rendering only what changed"""
+        parameters = preview_parameters(parameters)
+        if parameters == self._parameters:
+            self.last_rendered = 0
+            return self.html
+
+        if self.sections is None:
+            self.html = self._generate(parameters)
+            self.last_rendered = 1
+        else:
+            context = self._build_context(parameters)
+            if self._parts is None:
+                self._parts = [section.render(context) for section in self.sections]
+                self.last_rendered = len(self.sections)
+            else:
+                changed = self._changed_names(context)
+                self.last_rendered = 0
+                for index, names in enumerate(self.dependencies):
+                    if not names.isdisjoint(changed):
+                        self._parts[index] = self.sections[index].render(context)
+                        self.last_rendered += 1
+            self._context = context
+            self.html = ''.join(self._parts)
+
+        self._parameters = parameters
+        self.rendered += self.last_rendered
+        return self.html
@@ -1,5 +1,14 @@
 # Business Proposal Template
 
+from templates.engine import compile_template
+from templates.schema import build_schema
+
+# Document type metadata used by the registry
+DISPLAY_NAME = "Business Proposal"
+DESCRIPTION = "A document that offers a solution to a client's problem. Often used in business to suggest services or products to meet specific needs."
+CREDITS = 8
+SORT_ORDER = 4
+
 # Define the parameter structure for this document type
 PARAMETERS = [
     {
@@ -248,169 +257,159 @@ PARAMETERS = [
     }
 ]
 
-def generate(parameters):
-    """Generate a business proposal document"""
-    # Extract parameters
-    company_name = parameters.get('company_name', '')
-    company_address = parameters.get('company_address', '')
-    company_phone = parameters.get('company_phone', '')
-    company_email = parameters.get('company_email', '')
-    company_website = parameters.get('company_website', '')
-    
-    client_name = parameters.get('client_name', '')
-    client_address = parameters.get('client_address', '')
-    client_contact_name = parameters.get('client_contact_name', '')
-    client_contact_title = parameters.get('client_contact_title', '')
-    client_email = parameters.get('client_email', '')
-    
-    proposal_date = parameters.get('proposal_date', '')
-    proposal_id = parameters.get('proposal_id', '')
-    proposal_title = parameters.get('proposal_title', '')
-    valid_until = parameters.get('valid_until', '')
-    
-    executive_summary = parameters.get('executive_summary', '')
-    problem_statement = parameters.get('problem_statement', '')
-    proposed_solution = parameters.get('proposed_solution', '')
-    solution_benefits = parameters.get('solution_benefits', '')
-    deliverables = parameters.get('deliverables', '')
-    
-    pricing_structure = parameters.get('pricing_structure', '')
-    payment_terms = parameters.get('payment_terms', '')
-    total_price = parameters.get('total_price', '')
-    
-    timeline = parameters.get('timeline', '')
-    terms_conditions = parameters.get('terms_conditions', '')
-    company_background = parameters.get('company_background', '')
-    experience = parameters.get('experience', '')
-    conclusion = parameters.get('conclusion', '')
+# Schema index for validation, built once at import
+SCHEMA = build_schema(PARAMETERS)
 
-    # Generate HTML document with dynamic styling support
-    document = f"""
+# Compiled once at import
+TEMPLATE = compile_template("""
     <div style="max-width: 800px; margin: 0 auto; font-family: Arial, sans-serif;">
         <!-- Header -->
         <div style="text-align: center; margin-bottom: 40px;">
-            <h1 style="color: var(--primary-color, #2E86C1); margin-bottom: 10px;">{proposal_title}</h1>
-            <p style="font-size: 1.1em;">Prepared for {client_name}</p>
-            <p>Proposal #{proposal_id} | {proposal_date}</p>
+            <h1 style="color: var(--primary-color, #2E86C1); margin-bottom: 10px;">{{ proposal_title }}</h1>
+            <p style="font-size: 1.1em;">Prepared for {{ client_name }}</p>
+            <p>Proposal #{{ proposal_id }} | {{ proposal_date }}</p>
         </div>
         
         <!-- Company Information -->
         <div style="display: flex; justify-content: space-between; margin-bottom: 40px;">
             <div>
-                <strong>{company_name}</strong><br>
-                {company_address}<br>
-                {company_phone}<br>
-                {company_email}
-                {f'<br>{company_website}' if company_website else ''}
+                <strong>{{ company_name }}</strong><br>
+                {{ company_address }}<br>
+                {{ company_phone }}<br>
+                {{ company_email }}
+                {% if company_website %}<br>{{ company_website }}{% endif %}
             </div>
             <div style="text-align: right;">
-                <strong>{client_name}</strong><br>
-                {client_address}<br>
-                {client_contact_name}
-                {f'<br>{client_contact_title}' if client_contact_title else ''}<br>
-                {client_email}
+                <strong>{{ client_name }}</strong><br>
+                {{ client_address }}<br>
+                {{ client_contact_name }}
+                {% if client_contact_title %}<br>{{ client_contact_title }}{% endif %}<br>
+                {{ client_email }}
             </div>
         </div>
         
         <!-- Executive Summary -->
         <div style="margin-bottom: 30px;">
             <h2 style="color: var(--primary-color, #2E86C1); border-bottom: 2px solid var(--primary-color, #2E86C1); padding-bottom: 5px;">Executive Summary</h2>
-            <p>{executive_summary}</p>
+            <p>{{ executive_summary }}</p>
         </div>
         
         <!-- Problem Statement -->
         <div style="margin-bottom: 30px;">
             <h2 style="color: var(--primary-color, #2E86C1); border-bottom: 2px solid var(--primary-color, #2E86C1); padding-bottom: 5px;">Problem Statement</h2>
-            <p>{problem_statement}</p>
+            <p>{{ problem_statement }}</p>
         </div>
         
         <!-- Proposed Solution -->
         <div style="margin-bottom: 30px;">
             <h2 style="color: var(--primary-color, #2E86C1); border-bottom: 2px solid var(--primary-color, #2E86C1); padding-bottom: 5px;">Our Solution</h2>
-            <p>{proposed_solution}</p>
+            <p>{{ proposed_solution }}</p>
             
             <h3 style="color: var(--primary-color, #2E86C1); margin-top: 20px;">Key Benefits</h3>
-            <p>{solution_benefits}</p>
+            <p>{{ solution_benefits }}</p>
             
             <h3 style="color: var(--primary-color, #2E86C1); margin-top: 20px;">Deliverables</h3>
-            <p>{deliverables}</p>
+            <p>{{ deliverables }}</p>
         </div>
         
         <!-- Pricing -->
         <div style="margin-bottom: 30px;">
             <h2 style="color: var(--primary-color, #2E86C1); border-bottom: 2px solid var(--primary-color, #2E86C1); padding-bottom: 5px;">Investment</h2>
             <div style="background: rgba(46, 134, 193, 0.1); padding: 20px; border-radius: 5px; margin-top: 20px;">
-                <h3 style="color: var(--primary-color, #2E86C1); margin-top: 0;">Total Investment: {total_price}</h3>
-                <p><strong>Pricing Structure:</strong><br>{pricing_structure}</p>
-                <p><strong>Payment Terms:</strong><br>{payment_terms}</p>
+                <h3 style="color: var(--primary-color, #2E86C1); margin-top: 0;">Total Investment: {{ total_price }}</h3>
+                <p><strong>Pricing Structure:</strong><br>{{ pricing_structure }}</p>
+                <p><strong>Payment Terms:</strong><br>{{ payment_terms }}</p>
             </div>
         </div>
         
         <!-- Timeline -->
         <div style="margin-bottom: 30px;">
             <h2 style="color: var(--primary-color, #2E86C1); border-bottom: 2px solid var(--primary-color, #2E86C1); padding-bottom: 5px;">Project Timeline</h2>
-            <p>{timeline}</p>
-            <p><strong>Valid Until:</strong> {valid_until}</p>
+            <p>{{ timeline }}</p>
+            <p><strong>Valid Until:</strong> {{ valid_until }}</p>
         </div>
-    """
-    
-    if terms_conditions:
-        document += f"""
+    {% if terms_conditions %}
         <!-- Terms and Conditions -->
         <div style="margin-bottom: 30px;">
             <h2 style="color: var(--primary-color, #2E86C1); border-bottom: 2px solid var(--primary-color, #2E86C1); padding-bottom: 5px;">Terms and Conditions</h2>
-            <p>{terms_conditions}</p>
+            <p>{{ terms_conditions }}</p>
         </div>
-        """
-    
-    if company_background or experience:
-        document += f"""
+        {% endif %}{% if has_about_section %}
         <!-- About Us -->
         <div style="margin-bottom: 30px;">
-            <h2 style="color: var(--primary-color, #2E86C1); border-bottom: 2px solid var(--primary-color, #2E86C1); padding-bottom: 5px;">About {company_name}</h2>
-        """
-        
-        if company_background:
-            document += f"""
+            <h2 style="color: var(--primary-color, #2E86C1); border-bottom: 2px solid var(--primary-color, #2E86C1); padding-bottom: 5px;">About {{ company_name }}</h2>
+        {% if company_background %}
             <h3 style="color: var(--primary-color, #2E86C1); margin-top: 20px;">Company Background</h3>
-            <p>{company_background}</p>
-            """
-        
-        if experience:
-            document += f"""
+            <p>{{ company_background }}</p>
+            {% endif %}{% if experience %}
             <h3 style="color: var(--primary-color, #2E86C1); margin-top: 20px;">Relevant Experience</h3>
-            <p>{experience}</p>
-            """
-        
-        document += """
+            <p>{{ experience }}</p>
+            {% endif %}
         </div>
-        """
-    
-    # Add conclusion
-    document += f"""
+        {% endif %}
         <!-- Conclusion -->
         <div style="margin-bottom: 30px;">
             <h2 style="color: var(--primary-color, #2E86C1); border-bottom: 2px solid var(--primary-color, #2E86C1); padding-bottom: 5px;">Next Steps</h2>
-            <p>{conclusion}</p>
+            <p>{{ conclusion }}</p>
         </div>
-    """
     
-    # Add footer
-    document += f"""
         <!-- Footer -->
         <div style="text-align: center; margin-top: 50px; padding-top: 20px; border-top: 1px solid #ccc; color: #666;">
             <p>For questions about this proposal, please contact:</p>
-            <p><strong>{company_name}</strong><br>
-            {company_email} | {company_phone}</p>
+            <p><strong>{{ company_name }}</strong><br>
+            {{ company_email }} | {{ company_phone }}</p>
         </div>
     </div>
     
     <style>
-    :root {{
+    :root {
         --primary-color: #2E86C1;
         --secondary-color: #2874A6;
-    }}
+    }
     </style>
-    """
-    
-    return document
+    """, name="proposal")
+
+def build_context(parameters):
+    """Build the template context for a business proposal from its parameters"""
+    # Extract parameters
+    context = {
+        'company_name': parameters.get('company_name', ''),
+        'company_address': parameters.get('company_address', ''),
+        'company_phone': parameters.get('company_phone', ''),
+        'company_email': parameters.get('company_email', ''),
+        'company_website': parameters.get('company_website', ''),
+        
+        'client_name': parameters.get('client_name', ''),
+        'client_address': parameters.get('client_address', ''),
+        'client_contact_name': parameters.get('client_contact_name', ''),
+        'client_contact_title': parameters.get('client_contact_title', ''),
+        'client_email': parameters.get('client_email', ''),
+        
+        'proposal_date': parameters.get('proposal_date', ''),
+        'proposal_id': parameters.get('proposal_id', ''),
+        'proposal_title': parameters.get('proposal_title', ''),
+        'valid_until': parameters.get('valid_until', ''),
+        
+        'executive_summary': parameters.get('executive_summary', ''),
+        'problem_statement': parameters.get('problem_statement', ''),
+        'proposed_solution': parameters.get('proposed_solution', ''),
+        'solution_benefits': parameters.get('solution_benefits', ''),
+        'deliverables': parameters.get('deliverables', ''),
+        
+        'pricing_structure': parameters.get('pricing_structure', ''),
+        'payment_terms': parameters.get('payment_terms', ''),
+        'total_price': parameters.get('total_price', ''),
+        
+        'timeline': parameters.get('timeline', ''),
+        'terms_conditions': parameters.get('terms_conditions', ''),
+        'company_background': parameters.get('company_background', ''),
+        'experience': parameters.get('experience', ''),
+        'conclusion': parameters.get('conclusion', '')
+    }
+    context['has_about_section'] = bool(context['company_background'] or context['experience'])
+
+    return context
+
+def generate(parameters):
+    """Generate a business proposal document"""
+    return TEMPLATE.render(build_context(parameters))
@@ -0,0 +1,143 @@
+# Document type registry
+#
+# Document types are discovered without importing them:
+#   - every templates/<doc_type>_template.py module in this package
+#   - entry points in the "docgenius.templates" group, named by doc type and
+#     pointing at a template module (e.g. msa = "acme_docs.msa_template")
+#
+# A template module defines PARAMETERS, SCHEMA and generate(parameters), and
+# optionally generate_stream(parameters), DISPLAY_NAME, DESCRIPTION, CREDITS
+# and SORT_ORDER. Modules are imported on first use and cached.
+
+import os
+import importlib
+import threading
+from importlib import metadata
+
+ENTRY_POINT_GROUP = "docgenius.templates"
+TEMPLATE_SUFFIX = "_template"
+
+# Defaults for optional template metadata
+DEFAULT_CREDITS = 5
+DEFAULT_SORT_ORDER = 100
+
+class DocumentType:
+    """A registered document type whose template module is imported on first use"""
+
+    def __init__(self, name, module_name):
+        self.name = name
+        self.module_name = module_name
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def module(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.module_name)
+        return self._module
+
+    @property
+    def parameters(self):
+        return self.module.PARAMETERS
+
+    @property
+    def schema(self):
+        return self.module.SCHEMA
+
+    @property
+    def generate(self):
+        return self.module.generate
+
+    @property
+    def generate_stream(self):
+        """Streaming generator, or None if the template can't stream"""
+        return getattr(self.module, 'generate_stream', None)
+
+    @property
+    def display_name(self):
+        return getattr(self.module, 'DISPLAY_NAME', self.name.replace("_", " ").title())
+
+    @property
+    def description(self):
+        return getattr(self.module, 'DESCRIPTION', "")
+
+    @property
+    def credits(self):
+        return getattr(self.module, 'CREDITS', DEFAULT_CREDITS)
+
+    @property
+    def sort_order(self):
+        return getattr(self.module, 'SORT_ORDER', DEFAULT_SORT_ORDER)
+
+class TemplateRegistry:
+    """Discovers document types once and hands out their lazily loaded templates"""
+
+    def __init__(self, package_dir=None, package='templates', entry_point_group=ENTRY_POINT_GROUP):
+        self.package_dir = package_dir or os.path.dirname(os.path.abspath(__file__))
+        self.package = package
+        self.entry_point_group = entry_point_group
+        self._types = None
+        self._lock = threading.Lock()
+
+    def _discover(self):
+        """Find template modules by directory scan, then entry points"""
+        types = {}
+
+        for filename in sorted(os.listdir(self.package_dir)):
+            stem, ext = os.path.splitext(filename)
+            if ext == '.py' and stem.endswith(TEMPLATE_SUFFIX):
+                name = stem[:-len(TEMPLATE_SUFFIX)]
+                types[name] = DocumentType(name, f"{self.package}.{stem}")
+
+        # Installed plugins can add document types (but not replace built-in ones)
+        for entry_point in metadata.entry_points(group=self.entry_point_group):
+            if entry_point.name in types:
+                print(f"Ignoring document type plugin '{entry_point.name}': name already registered")
+                continue
+            types[entry_point.name] = DocumentType(entry_point.name, entry_point.module)
+
+        return types
+
+    @property
+    def types(self):
+        if self._types is None:
+            with self._lock:
+                if self._types is None:
+                    self._types = self._discover()
+        return self._types
+
+    def __contains__(self, doc_type):
+        return doc_type in self.types
+
+    def names(self):
+        """Get the registered document type names without importing any template"""
+        return list(self.types)
+
+    def get(self, doc_type):
+        """Get a registered document type"""
+        document_type = self.types.get(doc_type)
+        if document_type is None:
+            raise ValueError(f"Document type '{doc_type}' is not supported")
+        return document_type
+
+    def ordered(self):
+        """Get all document types in display order (imports every template)"""
+        return sorted(self.types.values(), key=lambda t: (t.sort_order, t.name))
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Get the process-wide document type registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TemplateRegistry()
+    return _registry
+
+def get_document_type(doc_type):
+    """Get a registered document type, raising ValueError if it isn't supported"""
+    return get_registry().get(doc_type)
@@ -0,0 +1,105 @@
+# Precomputed parameter schema index used to validate document parameters
+#
+# Each template builds its index once at import from its PARAMETERS sections.
+# The index maps field id to a compiled validator (type coercion and an options
+# set), and keeps the required field ids in form order, so validation is a
+# single pass over the submitted keys.
+
+import os
+import datetime
+
+# How fields that aren't part of the schema are handled:
+#   ignore - drop them (default)
+#   error  - reject the parameters
+#   keep   - pass them through unvalidated
+UNKNOWN_FIELD_MODES = ('ignore', 'error', 'keep')
+UNKNOWN_FIELDS = os.getenv("PARAMETER_UNKNOWN_FIELDS", "ignore")
+
+if UNKNOWN_FIELDS not in UNKNOWN_FIELD_MODES:
+    raise ValueError(f"PARAMETER_UNKNOWN_FIELDS must be one of: {', '.join(UNKNOWN_FIELD_MODES)}")
+
+def _number_validator(field_id):
+    def coerce(value):
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            raise ValueError(f"Field '{field_id}' must be a number")
+    return coerce
+
+def _date_validator(field_id):
+    def coerce(value):
+        if not isinstance(value, (datetime.date, str)):
+            raise ValueError(f"Field '{field_id}' must be a valid date")
+        return value
+    return coerce
+
+# Type coercions by field type; other types are passed through as is
+_TYPE_VALIDATORS = {
+    'number': _number_validator,
+    'date': _date_validator
+}
+
+class SchemaIndex:
+    """Field id -> (coerce, options, options label) lookup built from PARAMETERS"""
+
+    def __init__(self, parameters):
+        self.fields = {}
+        required = []
+
+        for section in parameters:
+            for field in section['fields']:
+                field_id = field['id']
+                make_validator = _TYPE_VALIDATORS.get(field.get('type'))
+                options = field.get('options')
+                self.fields[field_id] = (
+                    make_validator(field_id) if make_validator else None,
+                    frozenset(options) if options else None,
+                    ', '.join(options) if options else None
+                )
+                if field.get('required', False):
+                    required.append(field_id)
+
+        self.required = tuple(required)
+
+    def validate(self, parameters, unknown_fields=None):
+        """Validate and coerce submitted parameters, raising ValueError on the first problem"""
+        unknown_fields = unknown_fields or UNKNOWN_FIELDS
+        if unknown_fields not in UNKNOWN_FIELD_MODES:
+            raise ValueError(f"unknown_fields must be one of: {', '.join(UNKNOWN_FIELD_MODES)}")
+
+        # Check required fields
+        missing_fields = [field_id for field_id in self.required if not parameters.get(field_id)]
+        if missing_fields:
+            raise ValueError(f"Missing required fields: {', '.join(missing_fields)}")
+
+        fields = self.fields
+        validated_params = {}
+        for field_id, value in parameters.items():
+            spec = fields.get(field_id)
+            if spec is None:
+                if unknown_fields == 'error':
+                    raise ValueError(f"Unknown field '{field_id}'")
+                if unknown_fields == 'keep':
+                    validated_params[field_id] = value
+                continue
+
+            coerce, options, options_label = spec
+            if coerce is not None:
+                value = coerce(value)
+
+            # Options validation
+            if options is not None:
+                try:
+                    valid = value in options
+                except TypeError:  # Unhashable values can't be one of the options
+                    valid = False
+                if not valid:
+                    raise ValueError(f"Invalid value for field '{field_id}'. Must be one of: {options_label}")
+
+            validated_params[field_id] = value
+
+        return validated_params
+
+def build_schema(parameters):
+    """Build the schema index for a template's PARAMETERS, typically at module import"""
+    return SchemaIndex(parameters)
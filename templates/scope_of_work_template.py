@@ -1,5 +1,14 @@
 # Scope of Work Template
 
+from templates.engine import compile_template
+from templates.schema import build_schema
+
+# Document type metadata used by the registry
+DISPLAY_NAME = "Scope of Work"
+DESCRIPTION = "A document that defines project-specific activities, deliverables, and timelines for a vendor providing services to a client."
+CREDITS = 10
+SORT_ORDER = 5
+
 # Define the parameter structure for this document type
 PARAMETERS = [
     {
@@ -269,103 +278,38 @@ PARAMETERS = [
     }
 ]
 
-def generate(parameters):
-    """
-    Generate a Scope of Work document based on the provided parameters
-    
-    Args:
-        parameters: A dictionary containing all the parameter values
-        
-    Returns:
-        HTML content for the document
-    """
-    # Format dates
-    document_date = parameters.get("document_date", "")
-    if isinstance(document_date, str):
-        formatted_document_date = document_date
-    else:
-        formatted_document_date = document_date.strftime("%B %d, %Y") if document_date else ""
-    
-    project_start = parameters.get("project_start", "")
-    if isinstance(project_start, str):
-        formatted_project_start = project_start
-    else:
-        formatted_project_start = project_start.strftime("%B %d, %Y") if project_start else ""
-    
-    project_end = parameters.get("project_end", "")
-    if isinstance(project_end, str):
-        formatted_project_end = project_end
-    else:
-        formatted_project_end = project_end.strftime("%B %d, %Y") if project_end else ""
-    
-    # Get parameters with defaults
-    project_name = parameters.get("project_name", "[PROJECT NAME]")
-    project_number = parameters.get("project_number", "")
-    
-    client_name = parameters.get("client_name", "[CLIENT NAME]")
-    client_address = parameters.get("client_address", "[CLIENT ADDRESS]")
-    client_contact = parameters.get("client_contact", "[CLIENT CONTACT]")
-    client_email = parameters.get("client_email", "[CLIENT EMAIL]")
-    client_phone = parameters.get("client_phone", "[CLIENT PHONE]")
-    
-    contractor_name = parameters.get("contractor_name", "[CONTRACTOR NAME]")
-    contractor_address = parameters.get("contractor_address", "[CONTRACTOR ADDRESS]")
-    contractor_contact = parameters.get("contractor_contact", "[CONTRACTOR CONTACT]")
-    contractor_email = parameters.get("contractor_email", "[CONTRACTOR EMAIL]")
-    contractor_phone = parameters.get("contractor_phone", "[CONTRACTOR PHONE]")
-    
-    project_description = parameters.get("project_description", "[PROJECT DESCRIPTION]")
-    project_objectives = parameters.get("project_objectives", "[PROJECT OBJECTIVES]")
-    
-    scope_overview = parameters.get("scope_overview", "[SCOPE OVERVIEW]")
-    included_work = parameters.get("included_work", "[INCLUDED WORK]")
-    excluded_work = parameters.get("excluded_work", "")
-    
-    deliverables = parameters.get("deliverables", "[DELIVERABLES]")
-    deliverable_format = parameters.get("deliverable_format", "")
-    acceptance_criteria = parameters.get("acceptance_criteria", "[ACCEPTANCE CRITERIA]")
-    
-    milestones = parameters.get("milestones", "[MILESTONES]")
-    
-    fee_structure = parameters.get("fee_structure", "Fixed Fee")
-    total_cost = parameters.get("total_cost", "[TOTAL COST]")
-    payment_schedule = parameters.get("payment_schedule", "[PAYMENT SCHEDULE]")
-    expenses = parameters.get("expenses", "")
-    
-    change_management = parameters.get("change_management", "[CHANGE MANAGEMENT PROCESS]")
-    responsibilities = parameters.get("responsibilities", "")
-    assumptions = parameters.get("assumptions", "")
-    termination = parameters.get("termination", "")
-    
-    # Generate the document content
-    document = f"""
+# Schema index for validation, built once at import
+SCHEMA = build_schema(PARAMETERS)
+
+# Compiled once at import
+TEMPLATE = compile_template("""
     <div style="font-family: Arial, sans-serif; color: #333;">
         <!-- Header -->
         <div style="text-align: center; margin-bottom: 30px;">
             <h1 style="color: #2E86C1;">SCOPE OF WORK</h1>
-            <h2 style="color: #555;">{project_name}</h2>
-            {f'<p>Project ID: {project_number}</p>' if project_number else ''}
-            <p>Date: {formatted_document_date}</p>
+            <h2 style="color: #555;">{{ project_name }}</h2>
+            {% if project_number %}<p>Project ID: {{ project_number }}</p>{% endif %}
+            <p>Date: {{ formatted_document_date }}</p>
         </div>
         
         <!-- Party Information -->
         <div style="display: flex; justify-content: space-between; margin-bottom: 30px;">
             <div style="width: 48%;">
                 <h3 style="color: #2E86C1; border-bottom: 1px solid #ddd; padding-bottom: 5px;">Client</h3>
-                <p><strong>{client_name}</strong></p>
-                <p>{client_address.replace('\n', '<br>')}</p>
-                <p><strong>Contact:</strong> {client_contact}</p>
-                <p><strong>Email:</strong> {client_email}</p>
-                <p><strong>Phone:</strong> {client_phone}</p>
+                <p><strong>{{ client_name }}</strong></p>
+                <p>{{ client_address_html }}</p>
+                <p><strong>Contact:</strong> {{ client_contact }}</p>
+                <p><strong>Email:</strong> {{ client_email }}</p>
+                <p><strong>Phone:</strong> {{ client_phone }}</p>
             </div>
             
             <div style="width: 48%;">
                 <h3 style="color: #2E86C1; border-bottom: 1px solid #ddd; padding-bottom: 5px;">Contractor</h3>
-                <p><strong>{contractor_name}</strong></p>
-                <p>{contractor_address.replace('\n', '<br>')}</p>
-                <p><strong>Contact:</strong> {contractor_contact}</p>
-                <p><strong>Email:</strong> {contractor_email}</p>
-                <p><strong>Phone:</strong> {contractor_phone}</p>
+                <p><strong>{{ contractor_name }}</strong></p>
+                <p>{{ contractor_address_html }}</p>
+                <p><strong>Contact:</strong> {{ contractor_contact }}</p>
+                <p><strong>Email:</strong> {{ contractor_email }}</p>
+                <p><strong>Phone:</strong> {{ contractor_phone }}</p>
             </div>
         </div>
         
@@ -374,10 +318,10 @@ def generate(parameters):
             <h2 style="color: #2E86C1; border-bottom: 2px solid #2E86C1; padding-bottom: 5px;">1. PROJECT OVERVIEW</h2>
             
             <h3 style="color: #2E86C1; margin-top: 20px;">1.1 Project Description</h3>
-            <p>{project_description}</p>
+            <p>{{ project_description }}</p>
             
             <h3 style="color: #2E86C1; margin-top: 20px;">1.2 Project Objectives</h3>
-            <p>{project_objectives}</p>
+            <p>{{ project_objectives }}</p>
         </div>
         
         <!-- Scope of Services -->
@@ -385,19 +329,14 @@ def generate(parameters):
             <h2 style="color: #2E86C1; border-bottom: 2px solid #2E86C1; padding-bottom: 5px;">2. SCOPE OF SERVICES</h2>
             
             <h3 style="color: #2E86C1; margin-top: 20px;">2.1 Scope Overview</h3>
-            <p>{scope_overview}</p>
+            <p>{{ scope_overview }}</p>
             
             <h3 style="color: #2E86C1; margin-top: 20px;">2.2 Work Included</h3>
-            <p>{included_work}</p>
-    """
-    
-    if excluded_work:
-        document += f"""
+            <p>{{ included_work }}</p>
+    {% if excluded_work %}
             <h3 style="color: #2E86C1; margin-top: 20px;">2.3 Work Excluded</h3>
-            <p>{excluded_work}</p>
-        """
-    
-    document += f"""
+            <p>{{ excluded_work }}</p>
+        {% endif %}
         </div>
         
         <!-- Deliverables -->
@@ -405,49 +344,39 @@ def generate(parameters):
             <h2 style="color: #2E86C1; border-bottom: 2px solid #2E86C1; padding-bottom: 5px;">3. DELIVERABLES</h2>
             
             <h3 style="color: #2E86C1; margin-top: 20px;">3.1 List of Deliverables</h3>
-            <p>{deliverables}</p>
-    """
-    
-    if deliverable_format:
-        document += f"""
+            <p>{{ deliverables }}</p>
+    {% if deliverable_format %}
             <h3 style="color: #2E86C1; margin-top: 20px;">3.2 Deliverable Format</h3>
-            <p>{deliverable_format}</p>
-        """
-    
-    document += f"""
+            <p>{{ deliverable_format }}</p>
+        {% endif %}
             <h3 style="color: #2E86C1; margin-top: 20px;">3.3 Acceptance Criteria</h3>
-            <p>{acceptance_criteria}</p>
+            <p>{{ acceptance_criteria }}</p>
         </div>
         
         <!-- Timeline -->
         <div style="margin-bottom: 30px;">
             <h2 style="color: #2E86C1; border-bottom: 2px solid #2E86C1; padding-bottom: 5px;">4. TIMELINE</h2>
             
-            <p><strong>Project Start Date:</strong> {formatted_project_start}</p>
-            <p><strong>Project End Date:</strong> {formatted_project_end}</p>
+            <p><strong>Project Start Date:</strong> {{ formatted_project_start }}</p>
+            <p><strong>Project End Date:</strong> {{ formatted_project_end }}</p>
             
             <h3 style="color: #2E86C1; margin-top: 20px;">4.1 Key Milestones</h3>
-            <p>{milestones}</p>
+            <p>{{ milestones }}</p>
         </div>
         
         <!-- Budget and Payment -->
         <div style="margin-bottom: 30px;">
             <h2 style="color: #2E86C1; border-bottom: 2px solid #2E86C1; padding-bottom: 5px;">5. BUDGET AND PAYMENT</h2>
             
-            <p><strong>Fee Structure:</strong> {fee_structure}</p>
-            <p><strong>Total Cost:</strong> {total_cost}</p>
+            <p><strong>Fee Structure:</strong> {{ fee_structure }}</p>
+            <p><strong>Total Cost:</strong> {{ total_cost }}</p>
             
             <h3 style="color: #2E86C1; margin-top: 20px;">5.1 Payment Schedule</h3>
-            <p>{payment_schedule}</p>
-    """
-    
-    if expenses:
-        document += f"""
+            <p>{{ payment_schedule }}</p>
+    {% if expenses %}
             <h3 style="color: #2E86C1; margin-top: 20px;">5.2 Expenses</h3>
-            <p>{expenses}</p>
-        """
-    
-    document += f"""
+            <p>{{ expenses }}</p>
+        {% endif %}
         </div>
         
         <!-- Additional Terms -->
@@ -455,28 +384,17 @@ def generate(parameters):
             <h2 style="color: #2E86C1; border-bottom: 2px solid #2E86C1; padding-bottom: 5px;">6. ADDITIONAL TERMS</h2>
             
             <h3 style="color: #2E86C1; margin-top: 20px;">6.1 Change Management</h3>
-            <p>{change_management}</p>
-    """
-    
-    if responsibilities:
-        document += f"""
+            <p>{{ change_management }}</p>
+    {% if responsibilities %}
             <h3 style="color: #2E86C1; margin-top: 20px;">6.2 Client Responsibilities</h3>
-            <p>{responsibilities}</p>
-        """
-    
-    if assumptions:
-        document += f"""
+            <p>{{ responsibilities }}</p>
+        {% endif %}{% if assumptions %}
             <h3 style="color: #2E86C1; margin-top: 20px;">6.3 Assumptions</h3>
-            <p>{assumptions}</p>
-        """
-    
-    if termination:
-        document += f"""
+            <p>{{ assumptions }}</p>
+        {% endif %}{% if termination %}
             <h3 style="color: #2E86C1; margin-top: 20px;">6.4 Termination</h3>
-            <p>{termination}</p>
-        """
-    
-    document += f"""
+            <p>{{ termination }}</p>
+        {% endif %}
         </div>
         
         <!-- Signatures -->
@@ -486,7 +404,7 @@ def generate(parameters):
             
             <div style="display: flex; justify-content: space-between; margin-top: 40px;">
                 <div style="width: 45%;">
-                    <p style="border-top: 1px solid #333; padding-top: 10px;"><strong>For Client: {client_name}</strong></p>
+                    <p style="border-top: 1px solid #333; padding-top: 10px;"><strong>For Client: {{ client_name }}</strong></p>
                     <p>Name: ________________________________</p>
                     <p>Title: ________________________________</p>
                     <p>Date: ________________________________</p>
@@ -494,7 +412,7 @@ def generate(parameters):
                 </div>
                 
                 <div style="width: 45%;">
-                    <p style="border-top: 1px solid #333; padding-top: 10px;"><strong>For Contractor: {contractor_name}</strong></p>
+                    <p style="border-top: 1px solid #333; padding-top: 10px;"><strong>For Contractor: {{ contractor_name }}</strong></p>
                     <p>Name: ________________________________</p>
                     <p>Title: ________________________________</p>
                     <p>Date: ________________________________</p>
@@ -503,6 +421,87 @@ def generate(parameters):
             </div>
         </div>
     </div>
+    """, name="scope_of_work")
+
+def build_context(parameters):
+    """Build the template context for a Scope of Work from its parameters"""
+    # Format dates
+    document_date = parameters.get("document_date", "")
+    if isinstance(document_date, str):
+        formatted_document_date = document_date
+    else:
+        formatted_document_date = document_date.strftime("%B %d, %Y") if document_date else ""
+    
+    project_start = parameters.get("project_start", "")
+    if isinstance(project_start, str):
+        formatted_project_start = project_start
+    else:
+        formatted_project_start = project_start.strftime("%B %d, %Y") if project_start else ""
+    
+    project_end = parameters.get("project_end", "")
+    if isinstance(project_end, str):
+        formatted_project_end = project_end
+    else:
+        formatted_project_end = project_end.strftime("%B %d, %Y") if project_end else ""
+    
+    client_address = parameters.get("client_address", "[CLIENT ADDRESS]")
+    contractor_address = parameters.get("contractor_address", "[CONTRACTOR ADDRESS]")
+    
+    # Get parameters with defaults
+    context = {
+        "formatted_document_date": formatted_document_date,
+        "formatted_project_start": formatted_project_start,
+        "formatted_project_end": formatted_project_end,
+        
+        "project_name": parameters.get("project_name", "[PROJECT NAME]"),
+        "project_number": parameters.get("project_number", ""),
+        
+        "client_name": parameters.get("client_name", "[CLIENT NAME]"),
+        "client_address_html": client_address.replace("\n", "<br>"),
+        "client_contact": parameters.get("client_contact", "[CLIENT CONTACT]"),
+        "client_email": parameters.get("client_email", "[CLIENT EMAIL]"),
+        "client_phone": parameters.get("client_phone", "[CLIENT PHONE]"),
+        
+        "contractor_name": parameters.get("contractor_name", "[CONTRACTOR NAME]"),
+        "contractor_address_html": contractor_address.replace("\n", "<br>"),
+        "contractor_contact": parameters.get("contractor_contact", "[CONTRACTOR CONTACT]"),
+        "contractor_email": parameters.get("contractor_email", "[CONTRACTOR EMAIL]"),
+        "contractor_phone": parameters.get("contractor_phone", "[CONTRACTOR PHONE]"),
+        
+        "project_description": parameters.get("project_description", "[PROJECT DESCRIPTION]"),
+        "project_objectives": parameters.get("project_objectives", "[PROJECT OBJECTIVES]"),
+        
+        "scope_overview": parameters.get("scope_overview", "[SCOPE OVERVIEW]"),
+        "included_work": parameters.get("included_work", "[INCLUDED WORK]"),
+        "excluded_work": parameters.get("excluded_work", ""),
+        
+        "deliverables": parameters.get("deliverables", "[DELIVERABLES]"),
+        "deliverable_format": parameters.get("deliverable_format", ""),
+        "acceptance_criteria": parameters.get("acceptance_criteria", "[ACCEPTANCE CRITERIA]"),
+        
+        "milestones": parameters.get("milestones", "[MILESTONES]"),
+        
+        "fee_structure": parameters.get("fee_structure", "Fixed Fee"),
+        "total_cost": parameters.get("total_cost", "[TOTAL COST]"),
+        "payment_schedule": parameters.get("payment_schedule", "[PAYMENT SCHEDULE]"),
+        "expenses": parameters.get("expenses", ""),
+        
+        "change_management": parameters.get("change_management", "[CHANGE MANAGEMENT PROCESS]"),
+        "responsibilities": parameters.get("responsibilities", ""),
+        "assumptions": parameters.get("assumptions", ""),
+        "termination": parameters.get("termination", "")
+    }
+    
+    return context
+
+def generate(parameters):
     """
+    Generate a Scope of Work document based on the provided parameters
     
-    return document
+    Args:
+        parameters: A dictionary containing all the parameter values
+        
+    Returns:
+        HTML content for the document
+    """
+    return TEMPLATE.render(build_context(parameters))
@@ -0,0 +1,123 @@
+# Per-user cache for the profile, credit and history reads done on every page rerun
+#
+# Streamlit reruns the whole page script on each widget change, so without a
+# cache every rerun repeats the same user lookups against SQLite. Reads are
+# wrapped with @cached_user_read and kept for USER_CACHE_TTL_SECONDS; every
+# write path for a user's row, credits or documents calls invalidate_user()
+# so the next read sees the change right away. The cache is per process: a
+# write made by another process (e.g. the API) shows up once the TTL expires.
+
+import os
+import copy
+import time
+import sqlite3
+import threading
+from functools import wraps
+
+# Cache settings (override with environment variables)
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_USERS = int(os.getenv("USER_CACHE_MAX_USERS", "1000"))
+
+# Returned by UserCache.get on a miss (None is a valid cached value)
+MISSING = object()
+
+class UserCache:
+    """TTL cache of read results, grouped by user so a user's entries can be dropped at once"""
+
+    def __init__(self, ttl=USER_CACHE_TTL_SECONDS, max_users=USER_CACHE_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._users = {}
+        # Bumped by every invalidation, so a read that raced a write isn't cached
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, user_id, key):
+        """Get a cached value, or MISSING if it is missing or expired"""
+        with self._lock:
+            entry = self._users.get(user_id, {}).get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._counters['misses'] += 1
+                return MISSING
+            self._counters['hits'] += 1
+            return entry[1]
+
+    def put(self, user_id, key, value, generation=None):
+        """Cache a value for a user, unless an invalidation happened since generation"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            entries = self._users.get(user_id)
+            if entries is None:
+                if len(self._users) >= self.max_users:
+                    # Drop the user cached first; dicts keep insertion order
+                    del self._users[next(iter(self._users))]
+                entries = self._users[user_id] = {}
+            entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, user_id):
+        """Drop everything cached for a user"""
+        with self._lock:
+            self.generation += 1
+            if self._users.pop(user_id, None) is not None:
+                self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, users=len(self._users))
+
+_cache = UserCache()
+
+def get_user_cache():
+    """Get the process-wide user cache"""
+    return _cache
+
+def invalidate_user(user_id):
+    """Drop a user's cached reads; call after any write to their data"""
+    if user_id:
+        _cache.invalidate(user_id)
+
+def _check_cacheable(function, value):
+    """Raise TypeError if a value holds sqlite3.Row objects, which can't be copied"""
+    if isinstance(value, sqlite3.Row):
+        raise TypeError(
+            f"{function.__name__} returned sqlite3.Row objects; "
+            "convert rows with dict() before caching them"
+        )
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            _check_cacheable(function, item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _check_cacheable(function, item)
+
+def cached_user_read(function):
+    """
+    Cache a read function called as function(user_id, *args) per user and args
+
+    Callers get a copy of the cached value, so mutating it doesn't change the
+    cache. Functions must return plain values (dicts, not sqlite3.Row): a
+    function returning rows raises TypeError on its first call.
+    """
+    @wraps(function)
+    def wrapper(user_id, *args):
+        if not user_id or USER_CACHE_TTL_SECONDS <= 0:
+            value = function(user_id, *args)
+            _check_cacheable(function, value)
+            return value
+
+        key = (function.__name__, args)
+        value = _cache.get(user_id, key)
+        if value is MISSING:
+            generation = _cache.generation
+            value = function(user_id, *args)
+            _check_cacheable(function, value)
+            _cache.put(user_id, key, value, generation)
+        return copy.deepcopy(value)
+
+    return wrapper
@@ -1,16 +1,21 @@
 import streamlit as st
 import base64
 import os
-import uuid
 from datetime import datetime, timedelta
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from db import get_db_connection
+from ledger import debit, credit, InsufficientCredits
+from user_cache import cached_user_read
+from templates.registry import get_registry, get_document_type, DEFAULT_CREDITS
 
 def format_date(date_obj):
     """Format a date object as a readable string"""
     if not date_obj:
         return ""
+    if isinstance(date_obj, str):
+        # SQLite returns timestamps as text
+        date_obj = datetime.fromisoformat(date_obj)
     return date_obj.strftime("%B %d, %Y")
 
 def can_create_document():
@@ -28,25 +33,15 @@ def can_create_document():
 
 def get_document_display_name(doc_type):
     """Convert document type to display name"""
-    display_names = {
-        "nda": "Non-Disclosure Agreement",
-        "invoice": "Invoice",
-        "letter_of_intent": "Letter of Intent",
-        "proposal": "Business Proposal",
-        "scope_of_work": "Scope of Work"
-    }
-    return display_names.get(doc_type, doc_type.replace("_", " ").title())
+    if doc_type in get_registry():
+        return get_document_type(doc_type).display_name
+    return doc_type.replace("_", " ").title()
 
 def get_document_description(doc_type):
     """Get a description for a document type"""
-    descriptions = {
-        "nda": "A legal contract that establishes a confidential relationship between parties. Used when sensitive information needs to be shared but protected from others.",
-        "invoice": "A commercial document issued by a seller to a buyer, indicating the products, quantities, and agreed prices for products or services provided.",
-        "letter_of_intent": "A document outlining the understanding between parties that wish to enter into a contract. It sets forth the main terms of a deal.",
-        "proposal": "A document that offers a solution to a client's problem. Often used in business to suggest services or products to meet specific needs.",
-        "scope_of_work": "A document that defines project-specific activities, deliverables, and timelines for a vendor providing services to a client."
-    }
-    return descriptions.get(doc_type, "")
+    if doc_type in get_registry():
+        return get_document_type(doc_type).description
+    return ""
 
 def create_download_link(file_path, link_text):
     """Create a download link for a file"""
@@ -116,6 +111,7 @@ def display_rai_indicator(score, flags=None):
             else:
                 st.success("The document appears to contain minimal sensitive information.")
 
+@cached_user_read
 def get_user_credits(user_id):
     """Get user's current credit balance"""
     if not user_id:
@@ -140,16 +136,8 @@ def get_user_credits(user_id):
 
 def calculate_required_credits(doc_type, word_count=None):
     """Calculate required credits for document generation"""
-    base_credits = {
-        'nda': 5,
-        'invoice': 3,
-        'letter_of_intent': 4,
-        'proposal': 8,
-        'scope_of_work': 10
-    }
-    
     # Base credit cost for the document type
-    required_credits = base_credits.get(doc_type, 5)
+    required_credits = get_document_type(doc_type).credits if doc_type in get_registry() else DEFAULT_CREDITS
     
     # Additional credits based on complexity/length if word count provided
     if word_count:
@@ -161,129 +149,36 @@ def deduct_credits(user_id, amount, document_id, description):
     """Deduct credits from user's balance and record the transaction"""
     if not user_id:
         return False
-        
-    conn = get_db_connection()
-    cursor = conn.cursor()
     
     try:
-        # Start transaction
-        cursor.execute("BEGIN")
-        
-        # Update user's credit balance
-        cursor.execute(
-            """
-            UPDATE users 
-            SET ai_credits = ai_credits - ?,
-                total_credits_used = total_credits_used + ?,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = ? AND subscription != 'pro'
-            RETURNING ai_credits
-            """,
-            (amount, amount, user_id)
-        )
-        
-        result = cursor.fetchone()
-        if not result:
-            # User is either not found or is on pro plan
-            cursor.execute("ROLLBACK")
-            return True
-        
-        new_balance = result[0]
-        if new_balance < 0:
-            # Insufficient credits
-            cursor.execute("ROLLBACK")
-            return False
-        
-        # Record the transaction
-        cursor.execute(
-            """
-            INSERT INTO credit_transactions 
-            (id, user_id, amount, transaction_type, document_id, description, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            """,
-            (str(uuid.uuid4()), user_id, -amount, 'deduction', document_id, description)
-        )
-        
-        # Update document with credits used if document_id provided
-        if document_id:
-            cursor.execute(
-                """
-                UPDATE documents
-                SET credits_used = ?
-                WHERE id = ?
-                """,
-                (amount, document_id)
-            )
-        
-        cursor.execute("COMMIT")
-        
-        # Update session state
-        st.session_state["ai_credits"] = new_balance
+        # Checked and deducted in one statement; a repeated charge for the
+        # same document is not deducted again
+        result = debit(user_id, amount, document_id, description)
+    except InsufficientCredits:
+        return False
+    
+    # Update session state (pro users aren't charged)
+    if result['applied'] and not result['duplicate']:
+        st.session_state["ai_credits"] = result['balance']
         st.session_state["total_credits_used"] = st.session_state.get("total_credits_used", 0) + amount
-        
-        return True
-        
-    except Exception as e:
-        cursor.execute("ROLLBACK")
-        raise e
-    finally:
-        cursor.close()
-        conn.close()
+    
+    return True
 
 def add_credits(user_id, amount, description, transaction_type='purchase'):
     """Add credits to user's balance and record the transaction"""
     if not user_id:
         return False
-        
-    conn = get_db_connection()
-    cursor = conn.cursor()
     
-    try:
-        cursor.execute("BEGIN")
-        
-        # Update user's credit balance
-        cursor.execute(
-            """
-            UPDATE users 
-            SET ai_credits = ai_credits + ?,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = ? AND subscription != 'pro'
-            RETURNING ai_credits
-            """,
-            (amount, user_id)
-        )
-        
-        result = cursor.fetchone()
-        if not result:
-            cursor.execute("ROLLBACK")
-            return False
-            
-        new_balance = result[0]
-        
-        # Record the transaction
-        cursor.execute(
-            """
-            INSERT INTO credit_transactions 
-            (id, user_id, amount, transaction_type, description, created_at)
-            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            """,
-            (str(uuid.uuid4()), user_id, amount, transaction_type, description)
-        )
-        
-        cursor.execute("COMMIT")
-        
-        # Update session state
-        st.session_state["ai_credits"] = new_balance
-        
-        return True
-        
-    except Exception as e:
-        cursor.execute("ROLLBACK")
-        raise e
-    finally:
-        cursor.close()
-        conn.close()
+    result = credit(user_id, amount, description, transaction_type)
+    if not result['applied']:
+        return False
+    
+    # Update session state
+    st.session_state["ai_credits"] = result['balance']
+    
+    return True
 
+@cached_user_read
 def get_credit_history(user_id, limit=10):
     """Get user's credit transaction history"""
     if not user_id:
@@ -313,61 +208,56 @@ def get_credit_history(user_id, limit=10):
     cursor.close()
     conn.close()
     
-    return transactions
-
-def get_document_count(user_id):
-    """Get total number of documents generated by a user"""
-    if not user_id:
-        return 0
-        
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT COUNT(*) FROM documents WHERE user_id = ?",
-        (user_id,)
-    )
-    count = cursor.fetchone()[0]
-    
-    cursor.close()
-    conn.close()
-    
-    return count
+    return [dict(t) for t in transactions]
 
-def get_user_storage_used(user_id):
-    """Calculate the total storage used by a user's documents in MB"""
+@cached_user_read
+def get_user_usage(user_id):
+    """Get a user's usage counters (maintained by triggers on documents) in one row lookup"""
+    usage = {'document_count': 0, 'content_bytes': 0, 'documents_this_month': 0}
     if not user_id:
-        return 0
+        return usage
         
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        # Get the sum of content lengths (in bytes)
         cursor.execute(
             """
-            SELECT SUM(LENGTH(content)) as total_bytes
-            FROM documents
-            WHERE user_id = ?
+            SELECT u.document_count, u.content_bytes,
+                   COALESCE(m.document_count, 0) AS documents_this_month
+            FROM user_usage u
+            LEFT JOIN user_monthly_usage m
+                ON m.user_id = u.user_id AND m.month = strftime('%Y-%m', 'now')
+            WHERE u.user_id = ?
             """,
             (user_id,)
         )
-        
-        result = cursor.fetchone()
-        total_bytes = result[0] if result[0] is not None else 0
-        
-        # Convert bytes to megabytes (1 MB = 1,048,576 bytes)
-        storage_mb = total_bytes / 1048576.0
-        
-        return round(storage_mb, 2)  # Round to 2 decimal places
-        
-    except Exception as e:
-        print(f"Error calculating storage: {str(e)}")
-        return 0
+        row = cursor.fetchone()
+        if row:
+            usage.update(dict(row))
+        return usage
     finally:
         cursor.close()
         conn.close()
 
+def get_document_count(user_id):
+    """Get total number of documents generated by a user"""
+    return get_user_usage(user_id)['document_count']
+
+def get_user_storage_used(user_id):
+    """Calculate the total storage used by a user's documents in MB"""
+    try:
+        total_bytes = get_user_usage(user_id)['content_bytes']
+    except Exception as e:
+        print(f"Error calculating storage: {str(e)}")
+        return 0
+    
+    # Convert bytes to megabytes (1 MB = 1,048,576 bytes)
+    storage_mb = total_bytes / 1048576.0
+    
+    return round(storage_mb, 2)  # Round to 2 decimal places
+
+@cached_user_read
 def get_recent_documents(user_id, limit=5):
     """Get user's most recent documents"""
     if not user_id:
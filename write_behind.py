@@ -0,0 +1,255 @@
+# Write-behind queue for non-critical inserts
+#
+# Writes nothing reads back right away (document feedback, for one) don't
+# need their own commit: enqueue() keeps them in memory and a background
+# thread applies them in one transaction once WRITE_BEHIND_BATCH_SIZE are
+# waiting or WRITE_BEHIND_FLUSH_SECONDS have passed, one commit (and sync)
+# per batch instead of per write. Whatever is queued is flushed when the
+# process exits normally.
+#
+# Crash safety: with WRITE_BEHIND_JOURNAL set to a file path, every write is
+# also appended to that journal before enqueue() returns, and the writes
+# left in it by a crashed process are applied the next time the queue
+# starts. The journal is handed to the OS on every append, which survives
+# the process dying; WRITE_BEHIND_JOURNAL_FSYNC=1 also syncs it to disk on
+# every append, which survives losing power but costs a sync per write.
+#
+# A journalled write may be applied more than once (if the process dies
+# between committing a batch and clearing the journal), so only queue
+# statements that can be repeated safely: inserts with an explicit primary
+# key using INSERT OR IGNORE, or updates that set absolute values. Credit
+# transactions stay in the ledger's own transactions (see ledger.py): their
+# idempotency keys are only useful if they are committed with the balance.
+
+import os
+import json
+import atexit
+import sqlite3
+import threading
+from db import get_db_connection
+
+# Write-behind settings (override with environment variables)
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "1.0"))
+WRITE_BEHIND_JOURNAL = os.getenv("WRITE_BEHIND_JOURNAL", "")
+WRITE_BEHIND_JOURNAL_FSYNC = os.getenv("WRITE_BEHIND_JOURNAL_FSYNC", "0") == "1"
+
+def _group(writes):
+    """Group consecutive writes of the same statement, for executemany"""
+    groups = []
+    for statement, params in writes:
+        if groups and groups[-1][0] == statement:
+            groups[-1][1].append(params)
+        else:
+            groups.append((statement, [params]))
+    return groups
+
+def apply_writes(writes):
+    """
+    Apply (statement, params) writes in a single transaction
+
+    If the batch fails on a bad write (anything but a busy database), the
+    writes are retried one at a time and the ones that fail are dropped, so
+    one bad write can't hold back the rest. Returns the number dropped.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for statement, params in _group(writes):
+                cursor.executemany(statement, params)
+            cursor.execute("COMMIT")
+            return 0
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            # Retry the whole batch later if the database is busy
+            if "locked" in str(e) or "busy" in str(e):
+                raise
+        except sqlite3.Error:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+
+        dropped = 0
+        for statement, params in writes:
+            try:
+                cursor.execute(statement, params)
+                conn.commit()
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                if "locked" in str(e) or "busy" in str(e):
+                    raise
+                print(f"Write-behind dropped a write that failed: {str(e)}")
+                dropped += 1
+            except sqlite3.Error as e:
+                conn.rollback()
+                print(f"Write-behind dropped a write that failed: {str(e)}")
+                dropped += 1
+        return dropped
+    finally:
+        cursor.close()
+        conn.close()
+
+class WriteBehindQueue:
+    """Buffer of writes applied in batches on a background thread"""
+
+    def __init__(self, batch_size=WRITE_BEHIND_BATCH_SIZE, flush_seconds=WRITE_BEHIND_FLUSH_SECONDS,
+                 journal_path=WRITE_BEHIND_JOURNAL, journal_fsync=WRITE_BEHIND_JOURNAL_FSYNC):
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.journal_path = journal_path or None
+        self.journal_fsync = journal_fsync
+
+        self._pending = []
+        self._lock = threading.Lock()
+        # Held for a whole flush, so batches are applied in order
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._journal = None
+        self._counters = {'queued': 0, 'flushed': 0, 'batches': 0, 'dropped': 0, 'recovered': 0, 'errors': 0}
+
+        if self.journal_path:
+            self._counters['recovered'] = self._recover()
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    @property
+    def _rotated_path(self):
+        # Journal of the batch being flushed (or of a flush that failed)
+        return f"{self.journal_path}.flushing"
+
+    def _read_journal(self, path):
+        writes = []
+        try:
+            with open(path, encoding='utf-8') as journal:
+                for line in journal:
+                    try:
+                        statement, params = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash mid-append
+                        continue
+                    writes.append((statement, tuple(params)))
+        except FileNotFoundError:
+            pass
+        return writes
+
+    def _recover(self):
+        """Apply the writes a previous process left in the journal; returns how many"""
+        writes = self._read_journal(self._rotated_path) + self._read_journal(self.journal_path)
+        if writes:
+            self._counters['dropped'] += apply_writes(writes)
+            print(f"Write-behind recovered {len(writes)} writes from {self.journal_path}")
+        for path in (self._rotated_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return len(writes)
+
+    def enqueue(self, statement, params=()):
+        """Queue a write; it is journalled (if enabled) before this returns"""
+        params = tuple(params)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.write(json.dumps([statement, params], default=str) + "\n")
+                self._journal.flush()
+                if self.journal_fsync:
+                    os.fsync(self._journal.fileno())
+            self._pending.append((statement, params))
+            self._counters['queued'] += 1
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _rotate_journal(self):
+        """Move the journal aside for the batch being flushed (called with _lock held)"""
+        self._journal.close()
+        if os.path.exists(self._rotated_path):
+            # A failed flush left its writes there; they are back in the
+            # batch, so keep them together with the new ones
+            with open(self.journal_path, encoding='utf-8') as journal, \
+                    open(self._rotated_path, 'a', encoding='utf-8') as rotated:
+                rotated.write(journal.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self._rotated_path)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def flush(self):
+        """Apply every queued write now; returns the number applied"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                if batch and self._journal is not None:
+                    self._rotate_journal()
+            if not batch:
+                return 0
+
+            try:
+                dropped = apply_writes(batch)
+            except Exception:
+                # Keep the writes (and the rotated journal) for the next flush
+                with self._lock:
+                    self._pending[:0] = batch
+                    self._counters['errors'] += 1
+                raise
+
+            if self.journal_path:
+                os.remove(self._rotated_path)
+            with self._lock:
+                self._counters['flushed'] += len(batch) - dropped
+                self._counters['dropped'] += dropped
+                self._counters['batches'] += 1
+            return len(batch) - dropped
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write-behind flush failed, retrying: {str(e)}")
+
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+                if os.path.exists(self.journal_path) and not os.path.getsize(self.journal_path):
+                    os.remove(self.journal_path)
+
+    def pending(self):
+        """Number of writes waiting to be flushed"""
+        with self._lock:
+            return len(self._pending)
+
+    def get_stats(self):
+        """Get write counts: queued, flushed, batches, dropped, recovered, errors and pending"""
+        with self._lock:
+            return dict(self._counters, pending=len(self._pending))
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_write_behind():
+    """Get the process-wide write-behind queue, starting it on first use"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteBehindQueue()
+                atexit.register(_queue.close)
+    return _queue
+
+def enqueue(statement, params=()):
+    """Queue a write on the process-wide write-behind queue"""
+    get_write_behind().enqueue(statement, params)